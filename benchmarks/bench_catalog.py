@@ -0,0 +1,195 @@
+"""Benchmark the hot paths on synthetic catalogs of several sizes.
+
+For each size, a synthetic catalog with that many price rows is generated in
+a temporary SQLite database, and the main operations on books and prices are
+timed. Results can be saved as JSON and compared with a previous run.
+
+Usage::
+
+    python benchmarks/bench_catalog.py [--sizes 1000 10000 100000 1000000]
+        [--repeat 3] [--output results.json] [--compare previous.json]
+"""
+
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+import polars as pl
+
+import monitorbookprices as mbp
+
+SITES = ["buecher", "ibs", "libraccio", "mondadori"]
+WORDS = [
+    "storia",
+    "città",
+    "perché",
+    "über",
+    "kapital",
+    "guerra",
+    "pace",
+    "mädchen",
+    "notte",
+    "libro",
+    "straße",
+    "amore",
+    "mare",
+    "vita",
+]
+
+
+def synthetic_catalog(price_rows, seed=0):
+    """Return synthetic books and prices with `price_rows` prices.
+
+    There is one book every hundred prices, each book is sold on all `SITES`,
+    and each book and site has one price per day.
+    """
+    rng = random.Random(seed)
+    n_books = max(10, price_rows // 100)
+    isbns = [f"978{i:010d}" for i in range(n_books)]
+    books = pl.DataFrame(
+        {
+            "isbn": isbns,
+            "author": [
+                f"{rng.choice(WORDS).title()} Autore{i}" for i in range(n_books)
+            ],
+            "title": [
+                " ".join(rng.choice(WORDS) for _ in range(4)) for _ in range(n_books)
+            ],
+            "year": ["2020"] * n_books,
+            "publisher": [
+                rng.choice(["Adelphi", "Einaudi", "Hanser"]) for _ in range(n_books)
+            ],
+            "full_price": [20.0] * n_books,
+            "min_price": [None] * n_books,
+            **{site: [f"https://www.{site}.it/{i}" for i in isbns] for site in SITES},
+        },
+        schema_overrides=mbp.schema(),
+    )
+    index = pl.int_range(price_rows, eager=True)
+    prices = pl.DataFrame(
+        {
+            "isbn": pl.Series(isbns).gather(index % n_books),
+            "price": [round(rng.uniform(10, 20), 2) for _ in range(price_rows)],
+            "site": pl.Series(SITES).gather((index // n_books) % len(SITES)),
+            "date": pl.select(
+                pl.lit(date(2020, 1, 1))
+                + pl.duration(days=index // (n_books * len(SITES)))
+            ).to_series(),
+        }
+    )
+    return books, prices
+
+
+def timed(function, repeat, setup=None):
+    """Return median seconds taken by `function`, after a warm-up call.
+
+    If given, `setup` is called before each call of `function`, outside of
+    the timed region.
+    """
+    runs = []
+    for _ in range(repeat + 1):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs[1:])
+
+
+def operations(books, prices, url):
+    """Return operations to time.
+
+    Returns
+    -------
+    dict
+        Dictionary of name : function, or name : `(setup, function)` for
+        operations that need a setup outside of the timed region.
+    """
+    isbn = books["isbn"][len(books) // 2]
+    word = books["title"][0].split()[0]
+    victims = books.head(10)
+    victim_prices = prices.filter(pl.col("isbn").is_in(victims["isbn"].implode()))
+
+    def write():
+        mbp.write_database(prices, "prices_copy", url=url, if_table_exists="replace")
+
+    def restore():
+        # exactly one copy of the ten books and of their prices
+        mbp.wipe_book(victims, url=url)
+        mbp.write_database(victims, "books", url=url)
+        mbp.write_database(victim_prices, "prices", url=url)
+
+    def wipe():
+        mbp.wipe_book(victims, url=url)
+
+    def plot():
+        history = prices.filter(pl.col("isbn") == isbn)
+        mbp.plot_history(history, step=True, max_points=500)
+
+    return {
+        "prepare_scrape": lambda: mbp.prepare_scrape(books),
+        "update_min": lambda: mbp.update_min(books, prices),
+        "discounts": lambda: mbp.discounts(books, prices),
+        "find_book": lambda: mbp.find_book(word, url=url),
+        "write_database": write,
+        "read_database": lambda: mbp.read_database(
+            table_name="prices", url=url, schema=None
+        ),
+        "read_database_one_book": lambda: mbp.read_database(
+            table_name="prices", url=url, schema=None, isbn=isbn
+        ),
+        "wipe_book": (restore, wipe),
+        "plot_history": plot,
+    }
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None)
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare is not None:
+        previous = {
+            (result["size"], result["operation"]): result["seconds"]
+            for result in json.loads(args.compare.read_text())
+        }
+    results = []
+    for size in args.sizes:
+        books, prices = synthetic_catalog(size)
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{Path(tmp) / 'database.db'}"
+            mbp.write_database(books, "books", url=url)
+            mbp.write_database(prices, "prices", url=url)
+            mbp.ensure_schema(url=url)
+            for name, function in operations(books, prices, url).items():
+                setup = None
+                if isinstance(function, tuple):
+                    setup, function = function
+                seconds = timed(function, args.repeat, setup=setup)
+                results.append(
+                    {"size": size, "operation": name, "seconds": round(seconds, 5)}
+                )
+                line = f"{size:>9} {name:>24}: {seconds * 1000:10.1f} ms"
+                before = previous.get((size, name))
+                if before:
+                    line += f"  (x{before / seconds:.2f} vs previous)"
+                print(line)
+            mbp.dispose_engine(url)
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark import time of the package and of its entry points.
+
+Each statement runs in a fresh interpreter. The report lists the time taken
+by the statement and which heavy libraries it loaded. With `--check`, the
+script fails if a statement loads a library it should not.
+
+Usage::
+
+    python benchmarks/bench_import.py [--repeat 5] [--output results.json] [--check]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+HEAVY = ("bokeh", "holoviews", "hvplot", "pandas", "selenium.webdriver")
+
+# statement, heavy libraries it may load
+STATEMENTS = [
+    ("import monitorbookprices", ()),
+    ("from monitorbookprices import read_database", ()),
+    ("from monitorbookprices import find_book", ()),
+    ("from monitorbookprices import scrape_to_database", ()),
+    ("from monitorbookprices import run_scrape_job", ()),
+    ("from monitorbookprices import plot_history", HEAVY),
+]
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [m for m in {heavy!r} if m in sys.modules]]))
+"""
+
+
+def measure(statement):
+    """Return seconds taken by `statement` and heavy libraries it loaded."""
+    out = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(statement=statement, heavy=HEAVY)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout)
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    results = []
+    failed = False
+    for statement, allowed in STATEMENTS:
+        runs = [measure(statement) for _ in range(args.repeat)]
+        seconds = statistics.median(run[0] for run in runs)
+        loaded = runs[0][1]
+        unexpected = [module for module in loaded if module not in allowed]
+        failed |= bool(unexpected)
+        results.append(
+            {
+                "statement": statement,
+                "seconds": round(seconds, 4),
+                "heavy_modules": loaded,
+                "unexpected_modules": unexpected,
+            }
+        )
+        print(
+            f"{statement:>50}: {seconds * 1000:8.1f} ms"
+            + (f"  loads {', '.join(loaded)}" if loaded else "")
+        )
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.check and failed:
+        sys.exit("Some statements load libraries they do not need.")
+
+
+if __name__ == "__main__":
+    main()
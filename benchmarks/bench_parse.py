@@ -0,0 +1,62 @@
+"""Benchmark price extraction on saved shop pages.
+
+Compare pages per second of the BeautifulSoup parsers and of the fast lxml
+extractors on the fixture pages in `tests/data/test_scrape`.
+
+Usage::
+
+    python benchmarks/bench_parse.py [--repeat 50] [--output results.json]
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from monitorbookprices.scrape.extract import parse_page
+from monitorbookprices.scrape.registry import get_site
+
+FIXTURES = Path(__file__).parents[1] / "tests/data/test_scrape"
+
+
+def pages_per_second(site, content, fast, repeat):
+    """Return pages parsed per second."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse_page(site, content, fast=fast)
+    return repeat / (time.perf_counter() - start)
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    results = []
+    for path in sorted(FIXTURES.glob("*.html")):
+        site = get_site(path.stem.split("_")[0])
+        content = path.read_bytes()
+        before = pages_per_second(site, content, False, args.repeat)
+        after = pages_per_second(site, content, True, args.repeat)
+        results.append(
+            {
+                "page": path.stem,
+                "site": site.name,
+                "bytes": len(content),
+                "pages_per_second_soup": round(before, 1),
+                "pages_per_second_fast": round(after, 1),
+                "speedup": round(after / before, 2),
+            }
+        )
+        print(
+            f"{path.stem:>22}: {before:8.1f} -> {after:8.1f} pages/s "
+            f"(x{after / before:.1f})"
+        )
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
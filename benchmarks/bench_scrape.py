@@ -0,0 +1,136 @@
+"""Benchmark end-to-end scraping throughput on recorded shop pages.
+
+The fixture pages in `tests/data/test_scrape` are served by a local HTTP
+server, and a synthetic catalog linking every book to every website with a
+fixture is scraped with `scrape_database`. Websites without a fixture, and
+browser-based websites, are skipped.
+
+Usage::
+
+    python benchmarks/bench_scrape.py [--books 200] [--repeat 3]
+        [--output results.json]
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import polars as pl
+
+import monitorbookprices as mbp
+from monitorbookprices.scrape.registry import get_site, site_for_url
+
+FIXTURES = Path(__file__).parents[1] / "tests/data/test_scrape"
+
+
+def fixture_pages():
+    """Return content of the main fixture page of each website."""
+    pages = {}
+    for name in mbp.list_sites():
+        path = FIXTURES / f"{name}.html"
+        if path.exists() and get_site(name).fetch == "http":
+            pages[f"/{name}"] = path.read_bytes()
+    return pages
+
+
+@contextmanager
+def local_shop(pages):
+    """Serve `pages` from a local keep-alive HTTP server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):  # noqa: N802
+            body = pages.get(urlsplit(self.path).path)
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def synthetic_books(sites, n_books):
+    """Return `n_books` books linked to all `sites`."""
+    isbns = [f"978{i:010d}" for i in range(n_books)]
+    return pl.DataFrame(
+        [
+            mbp.new_book(
+                {
+                    "isbn": isbn,
+                    **{
+                        site: f"https://www.{get_site(site).domains[0]}/libro/{isbn}"
+                        for site in sites
+                    },
+                }
+            )
+            for isbn in isbns
+        ],
+        schema=mbp.schema(),
+    )
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    pages = fixture_pages()
+    sites = [path[1:] for path in pages]
+    skipped = [site for site in mbp.list_sites() if site not in sites]
+    books = synthetic_books(sites, args.books)
+    links = args.books * len(sites)
+    with local_shop(pages) as server:
+        host, port = server.server_address[:2]
+
+        def url_map(url):
+            return f"http://{host}:{port}/{site_for_url(url).name}"
+
+        runs = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            prices = mbp.scrape_database(books, url_map=url_map, progress=False)
+            runs.append(time.perf_counter() - start)
+    seconds = statistics.median(runs)
+    result = {
+        "books": args.books,
+        "sites": sites,
+        "skipped_sites": skipped,
+        "links": links,
+        "prices_found": prices["price"].is_not_null().sum(),
+        "seconds": round(seconds, 4),
+        "links_per_second": round(links / seconds, 1),
+    }
+    print(
+        f"{links} links on {len(sites)} websites in {seconds:.2f} s: "
+        f"{links / seconds:.1f} links/s (skipped: {', '.join(skipped) or 'none'})"
+    )
+    if args.output is not None:
+        args.output.write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
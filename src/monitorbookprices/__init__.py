@@ -1,47 +1,71 @@
-"""init."""
-
-from .analysis.plots import plot_history
-from .analysis.prices import update_min, update_min_whole_database
-from .book.general import (
-    book_info,
-    create_excel_template,
-    fill_book_schema,
-    new_book,
-    schema,
-    schema_prices,
-)
-from .data.database import (
-    delete_known_books,
-    find_book,
-    read_database,
-    wipe_book,
-    write_database,
-)
-from .data.excel import read_excel, write_excel
-from .scrape.general import prepare_scrape, scrape_database, scrape_list
-from .scrape.sites import list_sites, list_sites_links, scrape_url
-
-__all__ = [
-    "book_info",
-    "create_excel_template",
-    "delete_known_books",
-    "fill_book_schema",
-    "find_book",
-    "list_sites",
-    "list_sites_links",
-    "new_book",
-    "plot_history",
-    "prepare_scrape",
-    "read_database",
-    "read_excel",
-    "schema",
-    "scrape_database",
-    "scrape_list",
-    "schema_prices",
-    "scrape_url",
-    "update_min",
-    "update_min_whole_database",
-    "wipe_book",
-    "write_database",
-    "write_excel",
-]
+"""init.
+
+Functions are imported from their submodule on first access, so that
+importing the package does not load the plotting, browser, scraping and
+database libraries that are not used.
+"""
+
+from importlib import import_module
+
+_submodules = {
+    ".analysis.discounts": ["cheapest", "discounts"],
+    ".analysis.plots": ["plot_histories", "plot_history"],
+    ".analysis.prices": [
+        "update_min",
+        "update_min_incremental",
+        "update_min_whole_database",
+    ],
+    ".book.general": [
+        "book_info",
+        "compact_prices",
+        "create_excel_template",
+        "expand_prices",
+        "fill_book_schema",
+        "new_book",
+        "schema",
+        "schema_prices",
+    ],
+    ".data.database": [
+        "delete_known_books",
+        "ensure_schema",
+        "read_database",
+        "upsert_database",
+        "wipe_book",
+        "write_database",
+        "write_database_batches",
+    ],
+    ".data.engine": ["dispose_engine", "get_engine"],
+    ".data.excel": ["read_excel", "write_excel"],
+    ".data.parquet": ["compact_parquet"],
+    ".data.search": ["find_book"],
+    ".scrape.general": [
+        "iter_scrape_database",
+        "prepare_scrape",
+        "scrape_database",
+        "scrape_list",
+        "scrape_to_database",
+    ],
+    ".scrape.jobqueue": ["JobQueue", "run_worker", "run_workers"],
+    ".scrape.jobs": ["run_scrape_job"],
+    ".scrape.registry": ["SiteAdapter", "register_site", "unregister_site"],
+    ".scrape.scheduler": ["plan_scrape", "revisit_intervals"],
+    ".scrape.sites": ["list_sites", "list_sites_links", "scrape_url"],
+    ".scrape.telemetry": ["ScrapeTelemetry", "default_telemetry"],
+}
+_exports = {name: module for module, names in _submodules.items() for name in names}
+
+__all__ = sorted(_exports)
+
+
+def __getattr__(name):
+    """Import `name` from its submodule on first access."""
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    """Return public names of the package."""
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,121 @@
+"""Discounts over the price history of the whole catalog."""
+
+from datetime import datetime, timedelta
+
+import polars as pl
+
+from monitorbookprices.book.general import expand_prices
+
+
+def discounts(books_df, prices_df, date=None, windows=(30, 90), lazy=False):
+    """Return current discounts of all books on all sites.
+
+    Everything is computed with a single lazy query over the whole price
+    history, with one row per book and site.
+
+    Parameters
+    ----------
+    books_df: :class:`polars.DataFrame` or :class:`polars.LazyFrame`
+        Books, with at least the columns `isbn` and `full_price`. The columns
+        `author` and `title` are kept if present.
+    prices_df: :class:`polars.DataFrame` or :class:`polars.LazyFrame`
+        Price history, in the default or compact schema.
+    date: :class:`datetime.date`, optional
+        Day of the analysis: later prices are ignored. Defaults to the last
+        day in `prices_df`.
+    windows: iterable of int, default=(30, 90)
+        Lengths, in days, of the windows of the rolling minima.
+    lazy: bool, default=False
+        Whether to return a :class:`polars.LazyFrame`.
+
+    Returns
+    -------
+    :class:`polars.DataFrame`
+        For each book and site:
+
+        - `price` and `date`: last scraped price, `null` if the book was
+          not available, and day of the scrape;
+        - `discount` and `discount_pct`: difference between `full_price`
+          and `price`, absolute and in percent of `full_price`;
+        - `min_price` and `min_date`: all-time minimum price and the first
+          day it was reached;
+        - `min_<n>d`: minimum price in the last `n` days, for `n` in
+          `windows`;
+        - `new_low`: whether `price`, scraped on `date`, is lower than all
+          previous prices.
+
+        Sorted by decreasing `discount_pct`.
+    """
+    prices = expand_prices(prices_df.lazy()).with_columns(pl.col("date").cast(pl.Date))
+    if date is None:
+        date = pl.col("date").max()
+    else:
+        date = pl.lit(date.date() if isinstance(date, datetime) else date)
+    prices = prices.filter(pl.col("date") <= date).sort("isbn", "site", "date")
+    price = pl.col("price")
+    books = books_df.lazy()
+    info = [col for col in ("author", "title") if col in books.collect_schema().names()]
+    out = (
+        prices.with_columns(today=date)
+        .group_by("isbn", "site")
+        .agg(
+            price.last(),
+            pl.col("date").last(),
+            pl.col("today").first(),
+            min_price=price.min(),
+            min_date=pl.col("date").filter(price == price.min()).first(),
+            previous_min=price.filter(pl.col("date") < pl.col("date").last()).min(),
+            **{
+                f"min_{days}d": price.filter(
+                    pl.col("date") > pl.col("today") - timedelta(days=days)
+                ).min()
+                for days in windows
+            },
+        )
+        .join(books.select("isbn", *info, "full_price"), on="isbn", how="left")
+        .with_columns(discount=pl.col("full_price") - price)
+        .with_columns(discount_pct=100 * pl.col("discount") / pl.col("full_price"))
+        .with_columns(
+            new_low=(
+                (pl.col("date") == pl.col("today")) & (price < pl.col("previous_min"))
+            ).fill_null(False)
+        )
+        .select(
+            "isbn",
+            *info,
+            "site",
+            "full_price",
+            "price",
+            "date",
+            "discount",
+            "discount_pct",
+            "min_price",
+            "min_date",
+            *[f"min_{days}d" for days in windows],
+            "new_low",
+        )
+        .sort("discount_pct", descending=True, nulls_last=True)
+    )
+    return out if lazy else out.collect()
+
+
+def cheapest(discounts_df):
+    """Return the site with the lowest current price of each book.
+
+    Parameters
+    ----------
+    discounts_df: :class:`polars.DataFrame` or :class:`polars.LazyFrame`
+        Output of :func:`discounts`.
+
+    Returns
+    -------
+    :class:`polars.DataFrame` or :class:`polars.LazyFrame`
+        One row of `discounts_df` per book, sorted by decreasing
+        `discount_pct`. Books not available on any site are left out.
+    """
+    return (
+        discounts_df.filter(pl.col("price").is_not_null())
+        .sort("price")
+        .unique("isbn", keep="first", maintain_order=True)
+        .sort("discount_pct", descending=True, nulls_last=True)
+    )
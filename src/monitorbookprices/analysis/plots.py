@@ -2,9 +2,18 @@
 
 import holoviews as hv
 import hvplot.polars  # noqa: F401
+import numpy as np
 import polars as pl
 
-hv.extension("bokeh")
+_extension_loaded = False
+
+
+def load_extension():
+    """Load the bokeh extension of holoviews, once, before the first plot."""
+    global _extension_loaded
+    if not _extension_loaded:
+        hv.extension("bokeh")
+        _extension_loaded = True
 
 
 def plot_history(
@@ -15,10 +24,27 @@ def plot_history(
     height=300,
     width=800,
     hlines=None,
+    max_points=None,
+    step=False,
 ):
-    """Plot history of recent price recordings."""
+    """Plot history of recent price recordings.
+
+    Long histories can be lightened with `step` and `max_points`, see
+    :func:`downsample`.
+
+    Parameters
+    ----------
+    max_points: int, optional
+        Maximum number of points per site. Defaults to all points.
+    step: bool, default=False
+        Whether to draw step lines, dropping the days where the price did
+        not change.
+    """
+    load_extension()
     if site is not None:
         df = df.filter(pl.col("site") == site)
+    if step or max_points is not None:
+        df = downsample(df, max_points=max_points, by=("site",), step=step)
     plot_title = (
         title
         if title is not None
@@ -26,7 +52,7 @@ def plot_history(
         if book is None
         else f"{book['isbn'][0]}: {book['author'][0]} - {book['title'][0]}. {book['publisher'][0]} ({book['year'][0]})"
     )
-    plo = df.hvplot.line(
+    plo = (df.hvplot.step if step else df.hvplot.line)(
         x="date",
         y="price",
         by="site",
@@ -34,6 +60,7 @@ def plot_history(
         height=height,
         width=width,
         rot=90,
+        **({"where": "post"} if step else {}),
     )
 
     if hlines is not None:
@@ -71,6 +98,7 @@ def plot_history(
 
 def horizontal_line(X_A, X_B, Y, label=None, line_width=1, line_dash="solid"):
     """Horizontal line with label using holoviews Curve."""
+    load_extension()
     return hv.Curve(
         [[X_A, Y], [X_B, Y]],
         label=label,
@@ -78,3 +106,146 @@ def horizontal_line(X_A, X_B, Y, label=None, line_width=1, line_dash="solid"):
         line_width=line_width,
         line_dash=line_dash,
     )
+
+
+def plot_histories(
+    df,
+    books_df=None,
+    cols=3,
+    height=250,
+    width=400,
+    max_points=200,
+):
+    """Plot price histories of many books in a grid.
+
+    All books are drawn from the single frame `df`, with one facet per ISBN
+    and one step line per site. Histories are downsampled first, see
+    :func:`downsample`.
+
+    Parameters
+    ----------
+    df: :class:`polars.DataFrame`
+        Prices, with columns `isbn`, `site`, `date` and `price`.
+    books_df: :class:`polars.DataFrame`, optional
+        Books, used to title the facets with their author and title.
+    cols: int, default=3
+        Number of columns of the grid.
+    height: int, default=250
+        Height of each facet.
+    width: int, default=400
+        Width of each facet.
+    max_points: int, default=200
+        Maximum number of points per book and site.
+    """
+    load_extension()
+    df = downsample(df, max_points=max_points).sort("isbn", "site", "date")
+    if books_df is not None:
+        labels = books_df.select(
+            "isbn",
+            label=pl.concat_str(
+                "isbn",
+                pl.lit(": "),
+                "author",
+                pl.lit(" - "),
+                "title",
+                ignore_nulls=True,
+            ),
+        )
+        df = df.join(labels, on="isbn", how="left")
+    else:
+        df = df.with_columns(label=pl.col("isbn"))
+    return (
+        hv.Dataset(
+            df.select("label", "site", "date", "price").to_pandas(),
+            kdims=["label", "site", "date"],
+            vdims=["price"],
+        )
+        .to(hv.Curve, "date", "price", ["label", "site"])
+        .opts(interpolation="steps-post", height=height, width=width, tools=["hover"])
+        .overlay("site")
+        .layout("label")
+        .cols(cols)
+    )
+
+
+def downsample(df, max_points=None, by=("isbn", "site"), step=True):
+    """Reduce the number of points of price histories.
+
+    Parameters
+    ----------
+    df: :class:`polars.DataFrame`
+        Prices, with columns `date`, `price` and `by`.
+    max_points: int, optional
+        Maximum number of points of each history, selected with the
+        Largest-Triangle-Three-Buckets algorithm, see :func:`lttb`. Defaults
+        to all points.
+    by: tuple of str, default=("isbn", "site")
+        Columns identifying a history.
+    step: bool, default=True
+        Whether to drop the days where the price did not change, keeping the
+        last day of each history. The result is meant to be drawn as step
+        lines.
+    """
+    by = [col for col in by if col in df.columns]
+    df = df.sort(*by, "date")
+    if step:
+        previous = pl.col("price").shift(1).over(by) if by else pl.col("price").shift(1)
+        last = (
+            pl.col("date") == pl.col("date").max().over(by)
+            if by
+            else pl.col("date") == pl.col("date").max()
+        )
+        df = df.filter(pl.col("price").ne_missing(previous) | last)
+    if max_points is None:
+        return df
+    if not by:
+        return lttb(df, max_points)
+    return df.group_by(by, maintain_order=True).map_groups(
+        lambda group: lttb(group, max_points)
+    )
+
+
+def lttb(df, n_out, x="date", y="price"):
+    """Downsample a series with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are kept. The points in between are split into
+    `n_out - 2` buckets, and the point of each bucket forming the largest
+    triangle with the point kept in the previous bucket and the average of
+    the next bucket is kept. This preserves the visual shape of the series,
+    its peaks and drops in particular. Rows where `y` is missing are all
+    kept.
+
+    Parameters
+    ----------
+    df: :class:`polars.DataFrame`
+        Series, sorted by `x`.
+    n_out: int
+        Number of points to keep.
+    x: str, default="date"
+        Column of the abscissae.
+    y: str, default="price"
+        Column of the ordinates.
+    """
+    valid = df[y].is_not_null()
+    points = df.filter(valid)
+    n = points.height
+    if n_out >= n or n_out < 3:
+        return df
+    xs = points[x].to_physical().to_numpy().astype(float)
+    ys = points[y].to_numpy().astype(float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = xs[end:next_end].mean()
+        avg_y = ys[end:next_end].mean()
+        area = np.abs(
+            (xs[a] - avg_x) * (ys[start:end] - ys[a])
+            - (xs[a] - xs[start:end]) * (avg_y - ys[a])
+        )
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return pl.concat([points[keep], df.filter(~valid)]).sort(x)
@@ -1,34 +1,86 @@
 """Prices functions."""
 
 import polars as pl
+from sqlalchemy import text
 
-from monitorbookprices.book.general import schema as get_schema_default
-from monitorbookprices.data.database import read_database, write_database
+from monitorbookprices.book.general import expand_prices
+from monitorbookprices.data.database import read_database
+from monitorbookprices.data.engine import resolve_engine
 
 
 def update_min(books_df, prices_df):
-    """Update min in table books."""
-    mapping = {}
-    for book in books_df.iter_slices(1):
-        isbn = book["isbn"][0]
-        prs = prices_df.filter(pl.col("isbn") == isbn)
-        mm = prs.min()["price"][0]
-        min_price = book["min_price"][0]
-        if mm is None:
-            # list_min_price.append(min_price)
-            mapping[isbn] = min_price
-        elif min_price is None:
-            # list_min_price.append(mm)
-            mapping[isbn] = mm
-        elif mm < min_price:
-            # list_min_price.append(mm)
-            mapping[isbn] = mm
-        elif min_price <= mm:
-            # list_min_price.append(min_price)
-            mapping[isbn] = min_price
-        else:
-            print("What?")
-    return books_df.with_columns(min_price=pl.col("isbn").replace_strict(mapping))
+    """Update min in table books.
+
+    The minimum price of each book is computed with a single group-by over
+    `prices_df`, and compared with the `min_price` already in `books_df`.
+    `prices_df` can be in the default or compact schema, see
+    :func:`monitorbookprices.book.general.compact_prices`.
+    """
+    mins = expand_prices(min_prices(prices_df))
+    new_min = pl.col("isbn").replace_strict(
+        mins["isbn"],
+        mins["price"],
+        default=None,
+        return_dtype=books_df.schema["min_price"],
+    )
+    return books_df.with_columns(min_price=pl.min_horizontal("min_price", new_min))
+
+
+def min_prices(prices_df):
+    """Return minimum registered price of each isbn in `prices_df`.
+
+    Returns
+    -------
+    :class:`polars.DataFrame`
+        DataFrame with columns `isbn` and `price`. ISBNs without any
+        registered price are left out.
+    """
+    return (
+        prices_df.group_by("isbn")
+        .agg(pl.col("price").min())
+        .filter(pl.col("price").is_not_null())
+    )
+
+
+def update_min_incremental(
+    prices_df,
+    books_table="books",
+    engine=None,
+    url=None,
+):
+    """Update min_price in database from a batch of new prices.
+
+    Only the rows of `books_table` whose `min_price` goes down (or was not
+    set) because of the prices in `prices_df` are updated, with targeted
+    `UPDATE` statements in a single transaction.
+
+    Parameters
+    ----------
+    prices_df: :class:`polars.DataFrame`
+        Newly scraped prices, with at least the columns `isbn` and `price`.
+    books_table: str, default="books"
+        Name of the table with the books.
+    engine: :class:`sqlalchemy.engine.Engine`, optional
+        Engine object providing the connection to the database.
+    url: str, optional
+        Database url.
+
+    Returns
+    -------
+    int
+        Number of updated books.
+    """
+    engine = resolve_engine(engine, url)
+    mins = expand_prices(min_prices(prices_df))
+    if mins.height == 0:
+        return 0
+    statement = text(
+        f"UPDATE {books_table} SET min_price = :price "  # noqa: S608
+        "WHERE isbn = :isbn AND (min_price IS NULL OR min_price > :price)"
+    )
+    with engine.begin() as connection:
+        result = connection.execute(statement, mins.to_dicts())
+    return result.rowcount
 
 
 def update_min_whole_database(
@@ -36,29 +88,40 @@ def update_min_whole_database(
     prices_table="prices",
     engine=None,
     url=None,
+    new_prices=None,
+    prices_url=None,
 ):
     """Update min_price in database.
 
     Updates value `min_price` in the table specified by `books_table` with the
     minimum of all prices registered in the table specified by `prices_table`.
+    Only the `isbn` and `price` columns of the prices are read, and the books
+    are updated in place with :func:`update_min_incremental`, so that the
+    keys, indexes and triggers of `books_table` are kept.
+
+    If `new_prices` is given, only this batch of prices is considered.
+
+    If the prices are kept apart from the books, e.g. in a Parquet store,
+    they are read from `prices_url` instead.
+
+    Returns
+    -------
+    int
+        Number of updated books.
     """
-    books = read_database(
-        table_name=books_table,
-        engine=engine,
-        url=url,
-        schema=get_schema_default(),
-    )
-    prices = read_database(
-        table_name=prices_table,
-        engine=engine,
-        url=url,
-        schema=get_schema_default(),
-    )
-    b2 = update_min(books, prices)
-    write_database(
-        b2,
-        table_name=books_table,
+    if new_prices is None:
+        new_prices = min_prices(
+            read_database(
+                table_name=prices_table,
+                engine=engine if prices_url is None else None,
+                url=url if prices_url is None else prices_url,
+                schema=None,
+                columns=["isbn", "price"],
+            )
+        )
+    return update_min_incremental(
+        new_prices,
+        books_table=books_table,
         engine=engine,
         url=url,
-        if_table_exists="replace",
     )
@@ -1,10 +1,12 @@
 """Book functions."""
 
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
 
 import polars as pl
 
-from monitorbookprices.scrape.sites import list_sites as list_supported_sites
+from monitorbookprices.scrape.registry import site_catalog
 
 
 def create_excel_template(
@@ -36,7 +38,18 @@ def fill_book_schema(**kwargs):
 
 
 def schema():
-    """Return supported schema."""
+    """Return supported schema.
+
+    The schema is derived once from the catalog of supported websites, see
+    :func:`monitorbookprices.scrape.registry.site_catalog`, and a copy is
+    returned.
+    """
+    return dict(_schema(site_catalog()))
+
+
+@lru_cache(maxsize=1)
+def _schema(catalog):
+    """Return frozen schema of the books table for the websites of `catalog`."""
     out = {
         "isbn": pl.String,
         "author": pl.String,
@@ -46,13 +59,26 @@ def schema():
         "full_price": pl.Float64,
         "min_price": pl.Float64,
     }
-    for site in list_supported_sites():
+    for site in catalog.names:
         out[site] = pl.String
-    return out
+    return MappingProxyType(out)
+
 
+def schema_prices(compact=False):
+    """Return supported schema for the prices table.
 
-def schema_prices():
-    """Return supported schema for the prices table."""
+    Parameters
+    ----------
+    compact: bool, default=False
+        Whether to return the compact schema, see :func:`compact_prices`.
+    """
+    if compact:
+        return {
+            "isbn": pl.UInt64,
+            "price": pl.Float32,
+            "site": pl.Enum(site_catalog().names),
+            "date": pl.Date,
+        }
     return {
         "isbn": pl.String,
         "price": pl.Float64,
@@ -61,6 +87,66 @@ def schema_prices():
     }
 
 
+def get_schema(name):
+    """Return the schema of the table `name`, either "books" or "prices"."""
+    if name == "books":
+        return schema()
+    if name == "prices":
+        return schema_prices()
+    raise ValueError(f"Unknown schema {name}.")
+
+
+def compact_prices(df):
+    """Convert prices to the compact schema.
+
+    ISBNs are stored as integers, sites as an enumeration of the supported
+    sites, prices as 32-bit floats, and dates as days. This takes a fraction
+    of the memory of the default schema, and speeds up joins and group-bys.
+    Columns missing from `df`, and other columns, are left untouched.
+
+    Parameters
+    ----------
+    df: :class:`polars.DataFrame` or :class:`polars.LazyFrame`
+        Prices, with columns of either schema.
+    """
+    compact = schema_prices(compact=True)
+    dtypes = df.collect_schema()
+    exprs = []
+    for name, dtype in compact.items():
+        if name not in dtypes or dtypes[name] == dtype:
+            continue
+        col = pl.col(name)
+        if name == "date":
+            if dtypes[name] == pl.String:
+                col = col.str.slice(0, 10).str.to_date("%Y-%m-%d")
+            else:
+                col = col.cast(pl.Date)
+        elif name == "isbn" and dtypes[name] == pl.String:
+            col = col.str.strip_chars().cast(dtype)
+        else:
+            col = col.cast(dtype)
+        exprs.append(col)
+    return df.with_columns(exprs)
+
+
+def expand_prices(df):
+    """Convert compact ISBNs, sites and prices back to the default schema.
+
+    Inverse of :func:`compact_prices`, except for dates, which stay days.
+    Prices are rounded to cents.
+    Columns already in the default schema are left untouched.
+    """
+    dtypes = df.collect_schema()
+    exprs = []
+    if "isbn" in dtypes and dtypes["isbn"].is_integer():
+        exprs.append(pl.col("isbn").cast(pl.String).str.zfill(13))
+    if "site" in dtypes and isinstance(dtypes["site"], (pl.Enum, pl.Categorical)):
+        exprs.append(pl.col("site").cast(pl.String))
+    if "price" in dtypes and dtypes["price"] == pl.Float32:
+        exprs.append(pl.col("price").cast(pl.Float64).round(2))
+    return df.with_columns(exprs)
+
+
 def book_info():
     """Return book info entries."""
     return [
@@ -1,17 +1,64 @@
 """Data - Database functions."""
 
+import time
+from datetime import datetime, timedelta
+
 import polars as pl
-from sqlalchemy import create_engine
+import pyarrow as pa
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    MetaData,
+    Table,
+    Text,
+    column,
+    inspect,
+    literal_column,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+
+from monitorbookprices.book.general import (
+    compact_prices,
+    expand_prices,
+    get_schema,
+    schema as get_schema_default,
+    schema_prices as get_schema_prices,
+)
+from monitorbookprices.data.engine import resolve_engine
+from monitorbookprices.data.parquet import (
+    delete_parquet,
+    is_parquet_url,
+    scan_parquet,
+    write_parquet,
+)
+from monitorbookprices.data.search import ensure_search_index, find_book  # noqa: F401
 
-from monitorbookprices.book.general import schema as get_schema_default
+TABLE_KEYS = {
+    "books": ("isbn",),
+    "prices": ("isbn", "site", "date"),
+}
 
 
 def read_database(
     engine=None,
     query=None,
-    schema=get_schema_default(),
+    schema="books",
     table_name=None,
     url=None,
+    columns=None,
+    isbn=None,
+    site=None,
+    start=None,
+    end=None,
+    lazy=False,
+    compact=False,
 ):
     """Read database.
 
@@ -19,19 +66,55 @@ def read_database(
     At least one between `engine` and `url` must be user-defined.
     If both are, the engine has the priority.
 
+    When reading a whole table, columns and rows can be selected with
+    `columns`, `isbn`, `site`, `start` and `end`. The selection is compiled
+    into a parameterized query, see :func:`select_query`, so that only the
+    requested rows are loaded from the database.
+
+    If `url` starts with `parquet://`, the table is read from a Parquet store
+    instead, see :func:`monitorbookprices.data.parquet.scan_parquet`.
+
     Parameters
     ----------
     engine: :class:`sqlalchemy.engine.Engine`, optional
         Engine object providing the connection to the database.
-    schema: dict, optional.
-        Override schema with dictionary of column : `polars` type.
+    query: str or :class:`sqlalchemy.sql.expression.Select`, optional
+        Query to run. Takes priority over `table_name`.
+    schema: dict or {'books', 'prices'}, default='books'
+        Override schema with dictionary of column : `polars` type, or with
+        the schema of the books or prices table, see
+        :func:`monitorbookprices.book.general.get_schema`. `None` keeps the
+        types of the database.
+    table_name: str, optional
+        Name of the table to read.
     url: str, optional
         Database url.
+    columns: list of str, optional
+        Columns to read. Defaults to all columns.
+    isbn: str, list of str or :class:`polars.DataFrame`, optional
+        Only read rows of the given ISBN(s). For a DataFrame, the `isbn`
+        column is used.
+    site: str or list of str, optional
+        Only read rows of the given site(s).
+    start: :class:`datetime.date`, optional
+        Only read rows dated on or after `start`.
+    end: :class:`datetime.date`, optional
+        Only read rows dated on or before `end`.
+    lazy: bool, default=False
+        Whether to return a :class:`polars.LazyFrame`. Only a Parquet store
+        is scanned lazily: from a SQL database, the query runs at once and
+        its result is wrapped in a :class:`polars.LazyFrame`, so that only
+        the return type changes. Use the other arguments to restrict what
+        is read.
+    compact: bool, default=False
+        Whether to convert prices to the compact schema, see
+        :func:`monitorbookprices.book.general.compact_prices`.
 
     Returns
     -------
-    :class:`polars.DataFrame`
-        Database as a :class:`polars.DataFrame`.
+    :class:`polars.DataFrame` or :class:`polars.LazyFrame`
+        Database as a :class:`polars.DataFrame`, or as a
+        :class:`polars.LazyFrame` if `lazy`.
 
     Raises
     ------
@@ -39,20 +122,109 @@ def read_database(
         If neither `engine` nor `url` are user-defined.
 
     """
-    if engine is None:
-        if url is None:
-            raise ValueError("Either `engine` or `url` has to be user-defined.")
-        else:
-            engine = create_engine(url)
+    if isinstance(schema, str):
+        schema = get_schema(schema)
+    if engine is None and is_parquet_url(url):
+        if query is not None or table_name is None:
+            raise ValueError("Parquet stores are read by `table_name` only.")
+        lf = scan_parquet(
+            table_name,
+            url,
+            columns=columns,
+            isbn=None if isbn is None else isbn_list(isbn),
+            site=site,
+            start=start,
+            end=end,
+            schema=schema,
+        )
+        if compact:
+            lf = compact_prices(lf)
+        return lf if lazy else lf.collect()
+    engine = resolve_engine(engine, url)
     if query is None:
         if table_name is None:
             raise ValueError("Either `query` or `table_name` has to be user-defined.")
-        query = f"SELECT * FROM {table_name}"  # noqa: S608
-    return pl.read_database(
+        query = select_query(
+            table_name,
+            columns=columns,
+            isbn=isbn,
+            site=site,
+            start=start,
+            end=end,
+            dialect=engine.dialect.name,
+        )
+    if schema is not None and columns is not None:
+        schema = {key: value for key, value in schema.items() if key in columns}
+    df = pl.read_database(
         query=query,
         connection=engine,
         schema_overrides=schema,
     )
+    if compact:
+        df = compact_prices(df)
+    return df.lazy() if lazy else df
+
+
+def select_query(
+    table_name,
+    columns=None,
+    isbn=None,
+    site=None,
+    start=None,
+    end=None,
+    dialect=None,
+):
+    """Build a parameterized query reading `table_name`.
+
+    See :func:`read_database` for the parameters. `dialect` is the name of the
+    database dialect: on SQLite, dates are compared as strings, as that is
+    how they are stored.
+
+    Returns
+    -------
+    :class:`sqlalchemy.sql.expression.Select`
+        Query selecting `columns`, or all columns, filtered by the other
+        arguments.
+    """
+    target = table(table_name)
+    if columns is None:
+        query = select(literal_column("*")).select_from(target)
+    else:
+        query = select(*(column(name) for name in columns)).select_from(target)
+    if isbn is not None:
+        query = query.where(column("isbn").in_(isbn_list(isbn)))
+    if site is not None:
+        sites = [site] if isinstance(site, str) else list(site)
+        query = query.where(column("site").in_(sites))
+    if start is not None:
+        query = query.where(column("date") >= _date_parameter(start, dialect))
+    if end is not None:
+        if isinstance(end, datetime):
+            query = query.where(column("date") <= _date_parameter(end, dialect))
+        else:
+            # dates stored with a time are still on day `end`
+            query = query.where(
+                column("date") < _date_parameter(end + timedelta(days=1), dialect)
+            )
+    return query
+
+
+def _date_parameter(value, dialect):
+    """Return `value` as compared to the dates stored by `dialect`."""
+    if dialect == "sqlite":
+        return str(value)
+    return value
+
+
+def isbn_list(isbn):
+    """Return list of unique ISBNs from a str, list, Series or DataFrame."""
+    if isinstance(isbn, str):
+        isbns = [isbn]
+    elif isinstance(isbn, pl.DataFrame):
+        isbns = isbn["isbn"].to_list()
+    else:
+        isbns = list(isbn)
+    return list(dict.fromkeys(isbns))
 
 
 def write_database(
@@ -70,6 +242,12 @@ def write_database(
     At least one between `engine` and `url` must be user-defined.
     If both are, the engine has the priority.
 
+    If `url` starts with `parquet://`, the table is written to a Parquet
+    store instead, see :func:`monitorbookprices.data.parquet.write_parquet`.
+
+    Prices in the compact schema are converted back to the default one
+    before writing, see :func:`monitorbookprices.book.general.expand_prices`.
+
     Parameters
     ----------
     df: :class:`polars.DataFrame`
@@ -93,11 +271,13 @@ def write_database(
         If neither `engine` nor `url` are user-defined.
 
     """
-    if engine is None:
-        if url is None:
-            raise ValueError("Either `engine` or `url` has to be user-defined.")
-        else:
-            engine = create_engine(url)
+    df = expand_prices(df)
+    if engine is None and is_parquet_url(url):
+        if modify_df_before_writing is not None:
+            df = modify_df_before_writing(df=df, engine=None, table_name=table_name)
+        write_parquet(df, table_name, url, if_table_exists=if_table_exists)
+        return
+    engine = resolve_engine(engine, url)
     if modify_df_before_writing is not None:
         df = modify_df_before_writing(
             df=df,
@@ -111,6 +291,314 @@ def write_database(
     )
 
 
+def write_database_batches(
+    rows,
+    table_name,
+    schema,
+    engine=None,
+    url=None,
+    batch_rows=500,
+    batch_seconds=30,
+):
+    """Append rows to a database table in batches, as they arrive.
+
+    Rows are grouped into Arrow record batches, and each batch is appended
+    to the table in its own transaction once it has `batch_rows` rows, or
+    when a row arrives more than `batch_seconds` seconds after the previous
+    write. Rows already written are therefore kept even if `rows` raises.
+    With a `parquet://` url, each batch is a new file of the Parquet store.
+
+    Parameters
+    ----------
+    rows: iterable of dict
+        Rows to be written.
+    table_name: str
+        Name of table to use in the database.
+    schema: dict
+        Schema of the rows, as dictionary of column : `polars` type.
+    engine: :class:`sqlalchemy.engine.Engine`, default=`None`
+        Engine object providing the connection to the database.
+    url: str, default=`None`
+        Database url.
+    batch_rows: int, default=500
+        Maximum number of rows per batch.
+    batch_seconds: float, default=30
+        Maximum time between writes, in seconds.
+
+    Returns
+    -------
+    int
+        Number of written rows.
+    """
+    parquet = engine is None and is_parquet_url(url)
+    if not parquet:
+        engine = resolve_engine(engine, url)
+    arrow_schema = pl.DataFrame(schema=schema).to_arrow().schema
+    written = 0
+    buffer = []
+    last_write = time.monotonic()
+
+    def flush():
+        batch = pa.RecordBatch.from_pylist(buffer, schema=arrow_schema)
+        if parquet:
+            write_parquet(pl.from_arrow(batch), table_name, url)
+        else:
+            with engine.begin() as connection:
+                pl.from_arrow(batch).write_database(
+                    table_name=table_name,
+                    connection=connection,
+                    if_table_exists="append",
+                )
+        buffer.clear()
+        return batch.num_rows
+
+    try:
+        for row in rows:
+            buffer.append(row)
+            if (
+                len(buffer) >= batch_rows
+                or time.monotonic() - last_write >= batch_seconds
+            ):
+                written += flush()
+                last_write = time.monotonic()
+    finally:
+        if buffer:
+            written += flush()
+    return written
+
+
+def sql_type(dtype):
+    """Return SQLAlchemy type storing the `polars` type `dtype`."""
+    if dtype == pl.Date:
+        return Date
+    if dtype == pl.Datetime:
+        return DateTime
+    if dtype == pl.Boolean:
+        return Boolean
+    if dtype.is_float():
+        return Float
+    if dtype.is_integer():
+        return BigInteger
+    return Text
+
+
+def ensure_table(table_name, key, schema, engine=None, url=None, indexes=()):
+    """Create table with unique key and indexes, if missing.
+
+    If the table already exists (e.g., created by :func:`write_database`),
+    only the unique index on `key` and the other indexes are created.
+    Before creating the unique index, a `date` column of the key is
+    truncated to the day, as :func:`upsert_database` identifies rows by day,
+    and duplicated rows are removed, keeping the last inserted one.
+
+    Parameters
+    ----------
+    table_name: str
+        Name of the table.
+    key: tuple of str
+        Columns identifying a row.
+    schema: dict
+        Columns of the table, as dictionary of column : `polars` type. Used
+        only if the table is created.
+    engine: :class:`sqlalchemy.engine.Engine`, optional
+        Engine object providing the connection to the database.
+    url: str, optional
+        Database url.
+    indexes: iterable of tuple of str, default=()
+        Columns of further (non-unique) indexes.
+    """
+    engine = resolve_engine(engine, url)
+    if not inspect(engine).has_table(table_name):
+        Table(
+            table_name,
+            MetaData(),
+            *[Column(name, sql_type(dtype)) for name, dtype in schema.items()],
+        ).create(engine)
+    existing = {index["name"] for index in inspect(engine).get_indexes(table_name)}
+    with engine.begin() as connection:
+        key_index = f"{table_name}_key"
+        if key_index not in existing:
+            if "date" in key:
+                truncate_dates(table_name, connection)
+            delete_duplicates(table_name, key, connection)
+            connection.execute(
+                text(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS {key_index} "
+                    f"ON {table_name} ({', '.join(key)})"
+                )
+            )
+        for columns in indexes:
+            connection.execute(
+                text(
+                    f"CREATE INDEX IF NOT EXISTS {table_name}_{'_'.join(columns)} "
+                    f"ON {table_name} ({', '.join(columns)})"
+                )
+            )
+
+
+def truncate_dates(table_name, connection, date_column="date"):
+    """Truncate `date_column` to the day, e.g. for dates with a time.
+
+    On SQLite, values that are not dates are left unchanged.
+    """
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        day = f"date({date_column})"
+        statement = (
+            f"UPDATE {table_name} SET {date_column} = {day} "  # noqa: S608
+            f"WHERE {day} IS NOT NULL AND {date_column} != {day}"
+        )
+    elif dialect == "postgresql":
+        day = f"date_trunc('day', {date_column})"
+        statement = (
+            f"UPDATE {table_name} SET {date_column} = {day} "  # noqa: S608
+            f"WHERE {date_column} != {day}"
+        )
+    else:
+        raise NotImplementedError(f"Database {dialect} is not supported.")
+    connection.execute(text(statement))
+
+
+def delete_duplicates(table_name, key, connection):
+    """Delete rows with duplicated `key`, keeping the last inserted one.
+
+    Rows with a missing key column are kept, as the unique index does not
+    apply to them.
+    """
+    dialect = connection.dialect.name
+    columns = ", ".join(key)
+    not_null = " AND ".join(f"{col} IS NOT NULL" for col in key)
+    if dialect == "sqlite":
+        # one pass over the table grouped by key, rather than a self-join
+        statement = (
+            f"DELETE FROM {table_name} WHERE {not_null} AND rowid NOT IN ("  # noqa: S608
+            f"SELECT MAX(rowid) FROM {table_name} GROUP BY {columns})"
+        )
+    elif dialect == "postgresql":
+        same_key = " AND ".join(f"a.{col} = b.{col}" for col in key)
+        statement = (
+            f"DELETE FROM {table_name} AS a USING {table_name} AS b "  # noqa: S608
+            f"WHERE {same_key} AND a.ctid < b.ctid"
+        )
+    else:
+        raise NotImplementedError(f"Database {dialect} is not supported.")
+    connection.execute(text(statement))
+
+
+def ensure_schema(
+    engine=None,
+    url=None,
+    books_table="books",
+    prices_table="prices",
+):
+    """Create books and prices tables with keys and indexes, if missing.
+
+    Books are identified by `isbn`, prices by `isbn`, `site` and `date`.
+    Prices are also indexed by `date`. On SQLite, the full-text search index
+    of the books is created too, see
+    :func:`monitorbookprices.data.search.ensure_search_index`.
+    """
+    engine = resolve_engine(engine, url)
+    ensure_table(
+        books_table,
+        TABLE_KEYS["books"],
+        get_schema_default(),
+        engine=engine,
+    )
+    ensure_table(
+        prices_table,
+        TABLE_KEYS["prices"],
+        {**get_schema_prices(), "date": pl.Date},
+        engine=engine,
+        indexes=[("date",)],
+    )
+    ensure_search_index(books_table, engine=engine)
+
+
+def upsert_database(
+    df,
+    table_name,
+    key=None,
+    engine=None,
+    url=None,
+    chunk_size=1000,
+):
+    """Insert or update rows of a database table.
+
+    Rows of `df` are merged into the table by `key`: rows with a new key are
+    inserted, the others replace the rows in the table, with bulk
+    `INSERT ... ON CONFLICT DO UPDATE` statements in a single transaction.
+    Rows of `df` with the same key are deduplicated first, keeping the last
+    one. The table, its unique key and indexes are created if missing, see
+    :func:`ensure_schema` and :func:`ensure_table`.
+
+    Prices are identified by day: the `date` column of the prices table is
+    stored as a date, so that rescraping a book on the same day replaces
+    its price.
+
+    Parameters
+    ----------
+    df: :class:`polars.DataFrame`
+        DataFrame to be merged.
+    table_name: str
+        Name of table to use in the database.
+    key: tuple of str, optional
+        Columns identifying a row. Defaults to the key of the books or the
+        prices table, depending on `table_name`.
+    engine: :class:`sqlalchemy.engine.Engine`, default=`None`
+        Engine object providing the connection to the database.
+    url: str, default=`None`
+        Database url.
+    chunk_size: int, default=1000
+        Number of rows per statement.
+
+    Returns
+    -------
+    int
+        Number of inserted or updated rows.
+
+    Notes
+    -----
+    Only SQLite and PostgreSQL are supported.
+    """
+    engine = resolve_engine(engine, url)
+    if key is None:
+        try:
+            key = TABLE_KEYS[table_name]
+        except KeyError:
+            raise ValueError(f"`key` of table {table_name} unknown.") from None
+    key = tuple(key)
+    if "date" in key and df.schema["date"] == pl.Datetime:
+        df = df.with_columns(pl.col("date").dt.date())
+    df = df.unique(subset=list(key), keep="last", maintain_order=True)
+    ensure_table(
+        table_name,
+        key,
+        get_schema_default() if table_name == "books" else df.schema,
+        engine=engine,
+        indexes=[("date",)] if "date" in key else (),
+    )
+
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        insert = sqlite.insert
+        # store dates and datetimes as sqlalchemy does
+        df = df.with_columns(pl.col(pl.Date, pl.Datetime).cast(pl.String))
+    elif dialect == "postgresql":
+        insert = postgresql.insert
+    else:
+        raise NotImplementedError(f"Database {dialect} is not supported.")
+    statement = insert(table(table_name, *[column(name) for name in df.columns]))
+    statement = statement.on_conflict_do_update(
+        index_elements=list(key),
+        set_={name: statement.excluded[name] for name in df.columns if name not in key},
+    )
+    with engine.begin() as connection:
+        for chunk in df.iter_slices(chunk_size):
+            connection.execute(statement, chunk.to_dicts())
+    return df.height
+
+
 def delete_known_books(
     df,
     df_db=None,
@@ -132,46 +620,78 @@ def delete_known_books(
     )
 
 
-def find_book(
-    text,
-    df_db=None,
-    table_name="books",
+def wipe_book(
+    isbn,
     engine=None,
     url=None,
+    tables=("books", "prices"),
+    chunk_size=500,
+    prices_url=None,
 ):
-    """Find a book from a piece of text.
+    """Wipe books from database.
 
-    The text can come from any string column in the database.
-    Note that the match is case-insensitive.
-    """
-    if df_db is None:
-        df_db = read_database(
-            table_name=table_name,
-            engine=engine,
-            url=url,
-        )
-    return df_db.filter(
-        pl.any_horizontal(pl.col(pl.String).str.contains("(?i)" + text))
-    )
+    Rows of the given books are removed from all `tables` with
+    parameterized `DELETE` statements, in a single transaction.
 
+    If the prices are kept apart from the books, e.g. in a Parquet store,
+    the `prices` table is wiped from `prices_url` instead, in a separate
+    step.
 
-def wipe_book(
-    isbn,
-    engine=None,
-    url=None,
-):
-    """Wipe book from database."""
-    for table_name in ["books", "prices"]:
-        df = read_database(
-            table_name=table_name,
-            engine=engine,
-            url=url,
-        )
-        to_delete = df.filter(pl.col("isbn") == isbn)
-        write_database(
-            df.join(to_delete, on="isbn", how="anti"),
-            table_name,
-            engine=engine,
-            url=url,
-            if_table_exists="replace",
+    Parameters
+    ----------
+    isbn: str, list of str, :class:`polars.Series` or :class:`polars.DataFrame`
+        ISBN(s) of the book(s) to wipe. For a DataFrame, the `isbn` column
+        is used.
+    engine: :class:`sqlalchemy.engine.Engine`, optional
+        Engine object providing the connection to the database.
+    url: str, optional
+        Database url.
+    tables: iterable of str, default=("books", "prices")
+        Tables to wipe the books from. Missing tables are skipped.
+    chunk_size: int, default=500
+        Maximum number of ISBNs per statement.
+    prices_url: str, optional
+        Url of the database or Parquet store of the prices, if not the
+        database of the books.
+
+    Returns
+    -------
+    dict
+        Number of deleted rows in each table.
+    """
+    if engine is None and is_parquet_url(url):
+        raise ValueError(
+            "Books are stored in a SQL database, pass the Parquet store of "
+            "the prices as `prices_url`."
         )
+    engine = resolve_engine(engine, url)
+    isbns = isbn_list(isbn)
+    tables = list(tables)
+    separate_prices = prices_url is not None and "prices" in tables
+    if separate_prices:
+        tables.remove("prices")
+    deleted = {}
+    with engine.begin() as connection:
+        for table_name in tables:
+            if not inspect(connection).has_table(table_name):
+                continue
+            isbn_column = column("isbn")
+            target = table(table_name, isbn_column)
+            deleted[table_name] = 0
+            for start in range(0, len(isbns), chunk_size):
+                result = connection.execute(
+                    target.delete().where(
+                        isbn_column.in_(isbns[start : start + chunk_size])
+                    )
+                )
+                deleted[table_name] += result.rowcount
+    if separate_prices:
+        if is_parquet_url(prices_url):
+            deleted["prices"] = delete_parquet("prices", prices_url, isbns)
+        else:
+            deleted.update(
+                wipe_book(
+                    isbns, url=prices_url, tables=["prices"], chunk_size=chunk_size
+                )
+            )
+    return deleted
@@ -0,0 +1,101 @@
+"""Data - Process-wide registry of database engines."""
+
+import atexit
+import threading
+
+from sqlalchemy import create_engine, event
+
+SQLITE_PRAGMAS = {"busy_timeout": 5000}
+
+_engines = {}
+_lock = threading.Lock()
+
+
+def get_engine(url, pool_size=None, sqlite_pragmas=None, **kwargs):
+    """Return the engine of `url`, creating it on first use.
+
+    Engines, and their connection pools, are shared by all the functions of
+    the package called with the same `url`. The options are only used when
+    the engine is created: call :func:`dispose_engine` first to recreate an
+    engine with different options.
+
+    Parameters
+    ----------
+    url: str
+        Database url.
+    pool_size: int, optional
+        Number of connections kept in the pool. Defaults to the SQLAlchemy
+        default of the database.
+    sqlite_pragmas: dict, optional
+        Pragmas set on every new SQLite connection. Defaults to
+        `SQLITE_PRAGMAS`, a busy timeout that leaves the database file
+        untouched. Pass e.g. `{"journal_mode": "WAL", "synchronous":
+        "NORMAL"}` to opt in to the write-ahead log, which converts the file
+        permanently. Use an empty dictionary to keep the SQLite defaults.
+
+    Remaining keyword arguments are passed to
+    :func:`sqlalchemy.create_engine`.
+
+    Returns
+    -------
+    :class:`sqlalchemy.engine.Engine`
+        Engine of `url`.
+    """
+    with _lock:
+        engine = _engines.get(url)
+        if engine is not None:
+            return engine
+        if pool_size is not None:
+            kwargs["pool_size"] = pool_size
+        engine = create_engine(url, **kwargs)
+        if engine.dialect.name == "sqlite":
+            pragmas = SQLITE_PRAGMAS if sqlite_pragmas is None else sqlite_pragmas
+            set_sqlite_pragmas(engine, pragmas)
+        _engines[url] = engine
+        return engine
+
+
+def set_sqlite_pragmas(engine, pragmas):
+    """Set `pragmas` on every new connection of `engine`."""
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def resolve_engine(engine=None, url=None):
+    """Return `engine` if given, otherwise the shared engine of `url`.
+
+    Raises
+    ------
+    ValueError
+        If neither `engine` nor `url` are user-defined.
+    """
+    if engine is not None:
+        return engine
+    if url is None:
+        raise ValueError("Either `engine` or `url` has to be user-defined.")
+    return get_engine(url)
+
+
+def dispose_engine(url):
+    """Close all connections of the engine of `url` and forget it."""
+    with _lock:
+        engine = _engines.pop(url, None)
+    if engine is not None:
+        engine.dispose()
+
+
+@atexit.register
+def dispose_all():
+    """Close all connections of all shared engines."""
+    with _lock:
+        engines = list(_engines.values())
+        _engines.clear()
+    for engine in engines:
+        engine.dispose()
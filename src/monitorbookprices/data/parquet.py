@@ -0,0 +1,231 @@
+"""Data - Price history stored as date-partitioned Parquet datasets."""
+
+import shutil
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import polars as pl
+
+from monitorbookprices.book.general import schema_prices as get_schema_prices
+
+SCHEME = "parquet://"
+PARTITION = "month"
+
+
+def is_parquet_url(url):
+    """Return whether `url` points to a Parquet store."""
+    return isinstance(url, str) and url.startswith(SCHEME)
+
+
+def parquet_path(url, table_name):
+    """Return directory of the dataset `table_name` in the store at `url`.
+
+    The url of a store is `parquet://` followed by the path of its
+    directory, e.g. `parquet:///home/user/prices` or `parquet://prices`.
+    """
+    return Path(url[len(SCHEME) :]) / table_name
+
+
+def _to_date(value):
+    """Return the date of `value`."""
+    return value.date() if isinstance(value, datetime) else value
+
+
+def write_parquet(df, table_name, url, if_table_exists="append"):
+    """Write `df` to the Parquet dataset `table_name`.
+
+    The dataset is partitioned by month of the `date` column, in directories
+    `month=YYYY-MM`. Each write adds one file per month, see
+    :func:`compact_parquet` to merge them. Dates are stored as days.
+
+    Parameters
+    ----------
+    df: :class:`polars.DataFrame`
+        DataFrame to be stored. Must have a `date` column.
+    table_name: str
+        Name of the dataset.
+    url: str
+        Url of the store.
+    if_table_exists: {'append', 'replace', 'fail'}, default='append'
+        Behavior if the dataset already exists.
+
+    Returns
+    -------
+    int
+        Number of written rows.
+    """
+    if "date" not in df.columns:
+        raise ValueError("Parquet datasets need a `date` column.")
+    path = parquet_path(url, table_name)
+    if path.exists():
+        if if_table_exists == "fail":
+            raise ValueError(f"Table {table_name} already exists.")
+        if if_table_exists == "replace":
+            shutil.rmtree(path)
+    if df.schema["date"] == pl.Datetime:
+        df = df.with_columns(pl.col("date").dt.date())
+    # file names sort in order of writing
+    name = f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet"
+    for (month,), part in df.group_by(
+        pl.col("date").dt.strftime("%Y-%m").alias(PARTITION)
+    ):
+        _write_file(part, path / f"{PARTITION}={month}" / name)
+    return df.height
+
+
+def _write_file(df, file):
+    """Write `df` to `file` atomically."""
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = file.with_suffix(".tmp")
+    df.write_parquet(tmp, statistics=True)
+    tmp.replace(file)
+
+
+def scan_parquet(
+    table_name,
+    url,
+    columns=None,
+    isbn=None,
+    site=None,
+    start=None,
+    end=None,
+    schema=None,
+):
+    """Scan the Parquet dataset `table_name`.
+
+    Filters are pushed down to the scan: partitions outside `start` and
+    `end` are skipped, and the other filters prune row groups by their
+    statistics.
+
+    Parameters
+    ----------
+    table_name: str
+        Name of the dataset.
+    url: str
+        Url of the store.
+    columns: list of str, optional
+        Columns to read. Defaults to all columns.
+    isbn: str or list of str, optional
+        Only read rows of the given ISBN(s).
+    site: str or list of str, optional
+        Only read rows of the given site(s).
+    start: :class:`datetime.date`, optional
+        Only read rows dated on or after `start`.
+    end: :class:`datetime.date`, optional
+        Only read rows dated on or before `end`.
+    schema: dict, optional
+        Override schema with dictionary of column : `polars` type.
+
+    Returns
+    -------
+    :class:`polars.LazyFrame`
+        Rows of the dataset.
+    """
+    path = parquet_path(url, table_name)
+    files = sorted(path.glob(f"{PARTITION}=*/*.parquet"))
+    if files:
+        lf = pl.scan_parquet(
+            files,
+            hive_partitioning=True,
+            hive_schema={PARTITION: pl.String},
+        )
+    else:
+        lf = pl.LazyFrame(
+            schema={**get_schema_prices(), "date": pl.Date, PARTITION: pl.String}
+        )
+    if start is not None:
+        start = _to_date(start)
+        lf = lf.filter(
+            pl.col(PARTITION) >= f"{start:%Y-%m}",
+            pl.col("date") >= start,
+        )
+    if end is not None:
+        end = _to_date(end)
+        lf = lf.filter(pl.col(PARTITION) <= f"{end:%Y-%m}", pl.col("date") <= end)
+    if isbn is not None:
+        lf = lf.filter(pl.col("isbn").is_in([isbn] if isinstance(isbn, str) else isbn))
+    if site is not None:
+        lf = lf.filter(pl.col("site").is_in([site] if isinstance(site, str) else site))
+    lf = lf.drop(PARTITION)
+    if columns is not None:
+        lf = lf.select(columns)
+    if schema is not None:
+        names = lf.collect_schema().names()
+        lf = lf.cast({key: value for key, value in schema.items() if key in names})
+    return lf
+
+
+def delete_parquet(table_name, url, isbn):
+    """Delete rows of the given ISBN(s) from the Parquet dataset `table_name`.
+
+    Files with deleted rows are rewritten atomically, or removed if no row
+    is left.
+
+    Parameters
+    ----------
+    table_name: str
+        Name of the dataset.
+    url: str
+        Url of the store.
+    isbn: list of str
+        ISBNs of the rows to delete.
+
+    Returns
+    -------
+    int
+        Number of deleted rows.
+    """
+    deleted = 0
+    path = parquet_path(url, table_name)
+    for file in sorted(path.glob(f"{PARTITION}=*/*.parquet")):
+        df = pl.read_parquet(file)
+        kept = df.filter(~pl.col("isbn").is_in(isbn))
+        if kept.height == df.height:
+            continue
+        deleted += df.height - kept.height
+        if kept.height:
+            _write_file(kept, file)
+        else:
+            file.unlink()
+    return deleted
+
+
+def compact_parquet(table_name, url, key=("isbn", "site", "date")):
+    """Merge the files of each partition of the dataset `table_name`.
+
+    Rows with the same `key` are deduplicated, keeping the last written
+    one, and rows are sorted by `key`. The merged file replaces the
+    original ones.
+
+    Parameters
+    ----------
+    table_name: str
+        Name of the dataset.
+    url: str
+        Url of the store.
+    key: tuple of str, default=("isbn", "site", "date")
+        Columns identifying a row.
+
+    Returns
+    -------
+    int
+        Number of compacted partitions.
+    """
+    compacted = 0
+    path = parquet_path(url, table_name)
+    for partition in sorted(path.glob(f"{PARTITION}=*")):
+        files = sorted(partition.glob("*.parquet"))
+        if len(files) < 2:
+            continue
+        df = (
+            pl.concat([pl.read_parquet(file) for file in files], how="diagonal")
+            .unique(subset=list(key), keep="last", maintain_order=True)
+            .sort(list(key))
+        )
+        _write_file(df, files[-1].with_name(f"compact-{files[-1].name}"))
+        for file in files:
+            file.unlink()
+        compacted += 1
+    return compacted
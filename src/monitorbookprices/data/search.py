@@ -0,0 +1,232 @@
+"""Data - Full-text search of books."""
+
+import polars as pl
+from sqlalchemy import inspect
+from sqlalchemy import text as sql_text
+
+from monitorbookprices.book.general import get_schema
+from monitorbookprices.data.engine import resolve_engine
+
+SEARCH_COLUMNS = ("isbn", "author", "title", "publisher")
+
+
+def search_table(table_name):
+    """Return name of the search index of `table_name`."""
+    return f"{table_name}_search"
+
+
+def _search_triggers(table_name):
+    """Return names of the triggers keeping the search index in sync."""
+    index = search_table(table_name)
+    return [f"{index}_{event}" for event in ("insert", "delete", "update")]
+
+
+def has_search_index(table_name, connection):
+    """Return whether the search index of `table_name` is in sync with it.
+
+    The index is in sync if it exists along with all of its triggers.
+    Nothing is created or modified, so that read-only databases can be
+    checked too.
+    """
+    if connection.dialect.name != "sqlite":
+        return False
+    existing = {
+        row[0]
+        for row in connection.execute(
+            sql_text(
+                "SELECT name FROM sqlite_master "
+                "WHERE (type = 'trigger' AND tbl_name = :table) "
+                "OR (type = 'table' AND name = :index)"
+            ),
+            {"table": table_name, "index": search_table(table_name)},
+        )
+    }
+    return existing.issuperset(
+        [search_table(table_name), *_search_triggers(table_name)]
+    )
+
+
+def ensure_search_index(table_name="books", engine=None, url=None):
+    """Create the full-text search index of a books table, if missing.
+
+    On SQLite, the index is an FTS5 table over the `SEARCH_COLUMNS` of
+    `table_name`, matching words regardless of case and accents, and
+    indexing prefixes of two and three characters. Triggers keep it in sync
+    with inserts, updates and deletes. If the triggers are missing, e.g.
+    because the table was replaced by :func:`write_database`, the index is
+    rebuilt from the table.
+
+    Parameters
+    ----------
+    table_name: str, default="books"
+        Name of the books table.
+    engine: :class:`sqlalchemy.engine.Engine`, optional
+        Engine object providing the connection to the database.
+    url: str, optional
+        Database url.
+
+    Returns
+    -------
+    bool
+        Whether the index is available. Always `False` on databases other
+        than SQLite, or if `table_name` does not exist.
+    """
+    engine = resolve_engine(engine, url)
+    if engine.dialect.name != "sqlite" or not inspect(engine).has_table(table_name):
+        return False
+    index = search_table(table_name)
+    triggers = _search_triggers(table_name)
+    with engine.begin() as connection:
+        if has_search_index(table_name, connection):
+            return True
+        table_columns = {
+            col["name"] for col in inspect(connection).get_columns(table_name)
+        }
+        columns = [col for col in SEARCH_COLUMNS if col in table_columns]
+        names = ", ".join(columns)
+        new_values = ", ".join(f"new.{col}" for col in columns)
+        old_values = ", ".join(f"old.{col}" for col in columns)
+        connection.execute(sql_text(f"DROP TABLE IF EXISTS {index}"))
+        for trigger in triggers:
+            connection.execute(sql_text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        connection.execute(
+            sql_text(
+                f"CREATE VIRTUAL TABLE {index} USING fts5("
+                f"{names}, content='{table_name}', content_rowid='rowid', "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        )
+        insert = (
+            f"INSERT INTO {index} (rowid, {names}) VALUES (new.rowid, {new_values});"
+        )
+        delete = (
+            f"INSERT INTO {index} ({index}, rowid, {names}) "
+            f"VALUES ('delete', old.rowid, {old_values});"
+        )
+        for trigger, event, body in zip(
+            triggers,
+            ("INSERT", "DELETE", "UPDATE"),
+            (insert, delete, delete + " " + insert),
+        ):
+            connection.execute(
+                sql_text(
+                    f"CREATE TRIGGER {trigger} AFTER {event} ON {table_name} "
+                    f"BEGIN {body} END"
+                )
+            )
+        connection.execute(
+            sql_text(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+        )
+    return True
+
+
+def match_expression(text):
+    """Return FTS5 query matching all words of `text` as prefixes.
+
+    Each word is quoted, so that the syntax of FTS5 queries in `text` is
+    searched for literally.
+    """
+    words = [word.replace('"', "") for word in text.split()]
+    return " ".join(f'"{word}"*' for word in words if word)
+
+
+def normalize(expr):
+    """Lowercase and strip accents from a string expression."""
+    return expr.str.normalize("NFKD").str.replace_all(r"\p{M}", "").str.to_lowercase()
+
+
+def filter_books(df, text):
+    """Return books of `df` whose search columns contain all words of `text`.
+
+    The match ignores case and accents.
+    """
+    columns = [col for col in SEARCH_COLUMNS if col in df.columns]
+    haystack = normalize(
+        pl.concat_str(
+            [pl.col(col).cast(pl.String) for col in columns],
+            separator=" ",
+            ignore_nulls=True,
+        )
+    )
+    words = (
+        pl.select(normalize(pl.Series(text.split(), dtype=pl.String)))
+        .to_series()
+        .to_list()
+    )
+    return df.filter(
+        pl.all_horizontal(
+            [haystack.str.contains(word, literal=True) for word in words] or [True]
+        )
+    )
+
+
+def find_book(
+    text,
+    df_db=None,
+    table_name="books",
+    engine=None,
+    url=None,
+    limit=None,
+    schema="books",
+):
+    """Find a book from a piece of text.
+
+    The text is matched against the ISBN, author, title and publisher of the
+    books: each word of the text has to start a word of these columns, the
+    match ignoring case and accents. On SQLite, if the full-text index of
+    :func:`ensure_search_index` is in sync with the table, the search runs on
+    it and books are ranked by relevance. The index is never created here,
+    see :func:`monitorbookprices.data.database.ensure_schema`. Otherwise,
+    and if `df_db` is given, each word of the text has to appear anywhere in
+    these columns.
+
+    Parameters
+    ----------
+    text: str
+        Text to search.
+    df_db: :class:`polars.DataFrame`, optional
+        Books to search. Defaults to the books in the database.
+    table_name: str, default="books"
+        Name of the books table.
+    engine: :class:`sqlalchemy.engine.Engine`, optional
+        Engine object providing the connection to the database.
+    url: str, optional
+        Database url.
+    limit: int, optional
+        Maximum number of books returned.
+    schema: dict or {'books', 'prices'}, default='books'
+        Override schema, see
+        :func:`monitorbookprices.data.database.read_database`.
+
+    Returns
+    -------
+    :class:`polars.DataFrame`
+        Matching books, the most relevant first.
+    """
+    if isinstance(schema, str):
+        schema = get_schema(schema)
+    if df_db is None:
+        engine = resolve_engine(engine, url)
+        query = match_expression(text)
+        with engine.connect() as connection:
+            indexed = has_search_index(table_name, connection)
+        if query and indexed:
+            index = search_table(table_name)
+            return pl.read_database(
+                query=sql_text(
+                    f"SELECT b.* FROM ("  # noqa: S608
+                    f"SELECT rowid, rank FROM {index} WHERE {index} MATCH :query "
+                    "ORDER BY rank LIMIT :limit"
+                    f") AS s JOIN {table_name} AS b ON b.rowid = s.rowid "
+                    "ORDER BY s.rank"
+                ).bindparams(query=query, limit=-1 if limit is None else limit),
+                connection=engine,
+                schema_overrides=schema,
+            )
+        df_db = pl.read_database(
+            query=f"SELECT * FROM {table_name}",  # noqa: S608
+            connection=engine,
+            schema_overrides=schema,
+        )
+    df = filter_books(df_db, text)
+    return df if limit is None else df.head(limit)
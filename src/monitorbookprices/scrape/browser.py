@@ -0,0 +1,136 @@
+"""Pool of reusable Selenium drivers for browser-based scraping."""
+
+import atexit
+import queue
+import threading
+from contextlib import contextmanager
+
+from selenium.common.exceptions import WebDriverException
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def new_firefox_driver():
+    """Start a new headless Firefox driver.
+
+    The Selenium webdriver is imported here, rather than with the module,
+    as most scrapes never start a browser.
+    """
+    from selenium import webdriver
+    from selenium.webdriver.firefox.options import Options
+
+    options = Options()
+    options.add_argument("--headless")  # Run in headless mode
+    return webdriver.Firefox(options=options)
+
+
+class DriverPool:
+    """Bounded pool of long-lived Selenium drivers.
+
+    Drivers are started lazily, leased for one page at a time through
+    :meth:`lease`, and reused afterwards. A driver is recycled (i.e., closed
+    and replaced by a new one at the next lease) after `max_pages` pages, or
+    as soon as it raises a
+    :class:`selenium.common.exceptions.WebDriverException`.
+
+    Parameters
+    ----------
+    size: int, default=2
+        Maximum number of drivers alive at the same time.
+    max_pages: int, default=50
+        Number of pages after which a driver is recycled.
+    factory: function, optional
+        Function returning a new driver. Defaults to a headless Firefox.
+    """
+
+    def __init__(self, size=2, max_pages=50, factory=None):
+        if size < 1:
+            raise ValueError("`size` must be at least 1.")
+        self.size = size
+        self.max_pages = max_pages
+        self.factory = new_firefox_driver if factory is None else factory
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        """Return the pool."""
+        return self
+
+    def __exit__(self, *exc):
+        """Close the pool."""
+        self.close()
+
+    @contextmanager
+    def lease(self):
+        """Lease a driver for the duration of the `with` block.
+
+        Blocks while `size` drivers are already leased.
+        """
+        if self._closed:
+            raise RuntimeError("Driver pool is closed.")
+        with self._slots:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = self.factory()
+                with self._lock:
+                    self._pages[id(driver)] = 0
+            try:
+                yield driver
+            except WebDriverException:
+                self._retire(driver)
+                raise
+            except BaseException:
+                self._release(driver)
+                raise
+            else:
+                self._release(driver)
+
+    def _release(self, driver):
+        """Give `driver` back to the pool, or retire it if worn out."""
+        with self._lock:
+            self._pages[id(driver)] += 1
+            worn_out = self._pages[id(driver)] >= self.max_pages
+        if worn_out or self._closed:
+            self._retire(driver)
+        else:
+            self._idle.put(driver)
+
+    def _retire(self, driver):
+        """Quit `driver` and forget about it."""
+        with self._lock:
+            self._pages.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:  # noqa: S110
+            pass
+
+    def close(self):
+        """Quit all idle drivers; leased drivers are quit when released."""
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._retire(driver)
+
+
+def default_driver_pool():
+    """Return the process-wide driver pool, creating it if needed."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None or _default_pool._closed:
+            _default_pool = DriverPool()
+        return _default_pool
+
+
+@atexit.register
+def close_default_driver_pool():
+    """Close the process-wide driver pool, if any."""
+    if _default_pool is not None:
+        _default_pool.close()
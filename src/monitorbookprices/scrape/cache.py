@@ -0,0 +1,165 @@
+"""On-disk cache of scraped responses."""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+def content_hash(content):
+    """Return hash of the content of a page."""
+    return hashlib.sha256(content).hexdigest()
+
+
+class ResponseCache:
+    """On-disk cache of scraped responses, keyed by url.
+
+    For each url, the cache stores the validators of the last response
+    (`ETag` and `Last-Modified` headers), the hash of its content, and the
+    price extracted from it. This allows conditional requests, and to skip
+    parsing pages that did not change since the last scrape.
+
+    The cache is an SQLite database. Entries older than `max_age` are
+    evicted, as well as the least recently fetched entries beyond
+    `max_entries`, when the cache is opened and closed. Writes are committed
+    every `commit_writes` writes, or when a write comes more than
+    `commit_seconds` seconds after the last commit, so that a crashed run
+    loses at most these last writes.
+
+    Parameters
+    ----------
+    path: str or :class:`pathlib.Path`
+        Path to the cache file.
+    max_entries: int, default=100000
+        Maximum number of cached urls.
+    max_age: float, default=30 days
+        Maximum age of an entry, in seconds since it was last fetched.
+    commit_writes: int, default=100
+        Maximum number of uncommitted writes.
+    commit_seconds: float, default=5
+        Maximum time between commits of pending writes, in seconds.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_entries=100_000,
+        max_age=30 * 24 * 3600,
+        commit_writes=100,
+        commit_seconds=5,
+    ):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.commit_writes = commit_writes
+        self.commit_seconds = commit_seconds
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, "
+            "etag TEXT, "
+            "last_modified TEXT, "
+            "content_hash TEXT, "
+            "price REAL, "
+            "fetched_at REAL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_fetched_at ON responses (fetched_at)"
+        )
+        self.evict()
+
+    def __enter__(self):
+        """Return the cache."""
+        return self
+
+    def __exit__(self, *exc):
+        """Close the cache."""
+        self.close()
+
+    def get(self, url):
+        """Return cached entry of `url` as a dictionary, or `None`."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT etag, last_modified, content_hash, price "
+                "FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("etag", "last_modified", "content_hash", "price"), row))
+
+    def put(self, url, content_hash, price, etag=None, last_modified=None):
+        """Store the entry of `url`."""
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash, price, time.time()),
+            )
+            self._written()
+
+    def touch(self, url):
+        """Mark the entry of `url` as fetched now."""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE responses SET fetched_at = ? WHERE url = ?",
+                (time.time(), url),
+            )
+            self._written()
+
+    def _written(self):
+        """Count a write, committing pending writes if due. Needs the lock."""
+        self._pending += 1
+        if (
+            self._pending >= self.commit_writes
+            or time.monotonic() - self._last_commit >= self.commit_seconds
+        ):
+            self._connection.commit()
+            self._pending = 0
+            self._last_commit = time.monotonic()
+
+    def __len__(self):
+        """Return number of cached urls."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+
+    def evict(self):
+        """Evict entries too old or beyond `max_entries`."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM responses WHERE fetched_at < ?",
+                (time.time() - self.max_age,),
+            )
+            self._connection.execute(
+                "DELETE FROM responses WHERE url NOT IN ("
+                "SELECT url FROM responses ORDER BY fetched_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def close(self):
+        """Evict old entries, save and close the cache."""
+        if self._connection is None:
+            return
+        self.evict()
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+            self._connection = None
+
+
+def conditional_headers(entry):
+    """Return headers making a request conditional on the cached `entry`."""
+    out = {}
+    if entry is None:
+        return out
+    if entry["etag"] is not None:
+        out["If-None-Match"] = entry["etag"]
+    if entry["last_modified"] is not None:
+        out["If-Modified-Since"] = entry["last_modified"]
+    return out
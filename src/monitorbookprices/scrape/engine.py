@@ -0,0 +1,519 @@
+"""Asynchronous scraping engine."""
+
+import asyncio
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import aiohttp
+from tqdm import tqdm
+
+from monitorbookprices.scrape.browser import DriverPool
+from monitorbookprices.scrape.cache import (
+    ResponseCache,
+    conditional_headers,
+    content_hash,
+)
+from monitorbookprices.scrape.extract import parse_page
+from monitorbookprices.scrape.ratelimit import (
+    CONGESTION_STATUSES,
+    HostLimiter,
+    RateController,
+    parse_retry_after,
+)
+from monitorbookprices.scrape.registry import site_for_url
+from monitorbookprices.scrape.sites import headers
+from monitorbookprices.scrape.telemetry import default_telemetry
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class HTTPStatusError(Exception):
+    """Raised when a server keeps answering with a retryable error status."""
+
+    def __init__(self, url, status, retry_after=None):
+        super().__init__(f"{url} answered with status {status}.")
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt, backoff, max_backoff):
+    """Return delay before retry number `attempt`, with full jitter."""
+    return random.uniform(0, min(max_backoff, backoff * 2**attempt))  # noqa: S311
+
+
+class ScrapeEngine:
+    """Scrape many urls concurrently over pooled keep-alive connections.
+
+    One :class:`aiohttp.ClientSession` is kept per host, so that DNS lookups,
+    TCP handshakes and TLS setups are paid once per shop rather than once per
+    url. Pages are downloaded on the event loop, while parsing and
+    browser-based scrapes run on small thread pools. Browser-based scrapes
+    lease their drivers from a :class:`monitorbookprices.scrape.browser.DriverPool`
+    that lives as long as the engine.
+
+    Parameters
+    ----------
+    max_connections: int, default=64
+        Maximum number of requests in flight overall.
+    max_per_host: int, default=4
+        Maximum number of requests in flight towards a single host. If
+        `rate_limits` is given, the number is instead learned per host
+        between the limits of the controller, starting from `max_per_host`.
+    timeout: float, default=30
+        Total timeout of a single request, in seconds.
+    retries: int, default=2
+        Number of retries of a request failing with a network error, a
+        timeout, or one of the statuses in `RETRY_STATUSES`.
+    backoff: float, default=0.5
+        Base of the exponential backoff between retries, in seconds. The
+        actual delay before retry `n` is drawn uniformly between 0 and
+        `min(max_backoff, backoff * 2**n)`.
+    max_backoff: float, default=30
+        Maximum delay between retries, in seconds.
+    parse_workers: int, default=4
+        Number of threads parsing downloaded pages.
+    browser_pool_size: int, default=2
+        Number of browser drivers, hence of concurrent browser-based
+        scrapes. Independent of `max_connections` and `max_per_host`.
+    browser_max_pages: int, default=50
+        Number of pages after which a browser driver is recycled.
+    driver_factory: function, optional
+        Function returning a new browser driver. Defaults to a headless
+        Firefox.
+    url_map: function, optional
+        Function applied to each url right before downloading it. The
+        original url still selects the parser. Useful to redirect the
+        requests to a local server.
+    cache: :class:`monitorbookprices.scrape.cache.ResponseCache` or str, optional
+        Response cache, or path to it. If given, requests are conditional
+        on the cached `ETag`/`Last-Modified` validators, and the cached price
+        is reused without parsing when the server answers `304 Not
+        Modified` or the content did not change.
+    telemetry: :class:`monitorbookprices.scrape.telemetry.ScrapeTelemetry`, optional
+        Telemetry recording fetch latency, response size, parse time, HTTP
+        status and outcome of each scrape. Defaults to
+        :func:`monitorbookprices.scrape.telemetry.default_telemetry`.
+    rate_limits: RateController or str, optional
+        :class:`monitorbookprices.scrape.ratelimit.RateController` adapting
+        the number of requests in flight towards each host, or path to the
+        JSON file of its learned limits, which is updated when the engine
+        is closed. Even without it, the engine slows down when a host
+        answers with one of `CONGESTION_STATUSES` or a `Retry-After`
+        header, or times out, but never exceeds `max_per_host`.
+    """
+
+    def __init__(
+        self,
+        max_connections=64,
+        max_per_host=4,
+        timeout=30,
+        retries=2,
+        backoff=0.5,
+        max_backoff=30,
+        parse_workers=4,
+        browser_pool_size=2,
+        browser_max_pages=50,
+        driver_factory=None,
+        url_map=None,
+        cache=None,
+        telemetry=None,
+        rate_limits=None,
+    ):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.parse_workers = parse_workers
+        self.browser_pool_size = browser_pool_size
+        self.browser_max_pages = browser_max_pages
+        self.driver_factory = driver_factory
+        self.url_map = url_map
+        self.cache = cache
+        self.telemetry = telemetry if telemetry is not None else default_telemetry()
+        if rate_limits is None:
+            rate_limits = RateController(
+                initial_limit=max_per_host, max_limit=max_per_host
+            )
+        elif isinstance(rate_limits, (str, Path)):
+            rate_limits = RateController(rate_limits, initial_limit=max_per_host)
+        self.rate_limits = rate_limits
+        self._own_cache = False
+        self._sessions = {}
+        self._host_limiters = {}
+        self._semaphore = None
+        self._parse_executor = None
+        self._browser_executor = None
+        self._driver_pool = None
+
+    async def __aenter__(self):
+        """Open the engine."""
+        self._semaphore = asyncio.Semaphore(self.max_connections)
+        if isinstance(self.cache, (str, Path)):
+            self.cache = ResponseCache(self.cache)
+            self._own_cache = True
+        self._parse_executor = ThreadPoolExecutor(self.parse_workers)
+        self._browser_executor = ThreadPoolExecutor(self.browser_pool_size)
+        self._driver_pool = DriverPool(
+            size=self.browser_pool_size,
+            max_pages=self.browser_max_pages,
+            factory=self.driver_factory,
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        """Close sessions and thread pools."""
+        await self.close()
+
+    async def close(self):
+        """Close all sessions and thread pools of the engine."""
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions = {}
+        self._host_limiters = {}
+        if self.rate_limits.path is not None:
+            self.rate_limits.save()
+        for executor in (self._parse_executor, self._browser_executor):
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self._parse_executor = None
+        self._browser_executor = None
+        if self._driver_pool is not None:
+            self._driver_pool.close()
+        self._driver_pool = None
+        if self._own_cache:
+            self.cache.close()
+            self.cache = self.cache.path
+            self._own_cache = False
+
+    def _session(self, host):
+        """Return the pooled session of `host`, creating it if needed."""
+        if host not in self._sessions:
+            self._sessions[host] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.rate_limits.max_limit,
+                    ttl_dns_cache=600,
+                    keepalive_timeout=60,
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._host_limiters[host] = HostLimiter(self.rate_limits, host)
+        return self._sessions[host]
+
+    async def fetch(self, url, use_headers=False):
+        """Download `url` and return its content."""
+        _, _, content = await self.fetch_response(url, use_headers=use_headers)
+        return content
+
+    async def fetch_response(self, url, use_headers=False, extra_headers=None):
+        """Download `url`.
+
+        Failed requests are retried with exponential backoff and jitter.
+        The latency of successful requests, and congestion signals, are
+        reported to `rate_limits`.
+
+        Returns
+        -------
+        tuple
+            `(status, headers, content)` of the response.
+
+        Raises
+        ------
+        HTTPStatusError
+            If the server still answers with one of `RETRY_STATUSES` after
+            all retries.
+        """
+        if self.url_map is not None:
+            url = self.url_map(url)
+        host = urlsplit(url).netloc
+        session = self._session(host)
+        request_headers = dict(headers) if use_headers else {}
+        if extra_headers:
+            request_headers.update(extra_headers)
+        attempt = 0
+        while True:
+            try:
+                async with self._host_limiters[host], self._semaphore:
+                    start = time.perf_counter()
+                    async with session.get(
+                        url,
+                        headers=request_headers or None,
+                    ) as res:
+                        if res.status in RETRY_STATUSES:
+                            raise HTTPStatusError(
+                                url,
+                                res.status,
+                                parse_retry_after(res.headers.get("Retry-After")),
+                            )
+                        content = await res.read()
+                    self.rate_limits.on_success(host, time.perf_counter() - start)
+                    return res.status, res.headers, content
+            except (aiohttp.ClientError, asyncio.TimeoutError, HTTPStatusError) as exc:
+                if isinstance(exc, asyncio.TimeoutError) or (
+                    isinstance(exc, HTTPStatusError)
+                    and (exc.status in CONGESTION_STATUSES or exc.retry_after)
+                ):
+                    self.rate_limits.on_congestion(
+                        host, retry_after=getattr(exc, "retry_after", None)
+                    )
+                if attempt >= self.retries:
+                    raise
+            await asyncio.sleep(backoff_delay(attempt, self.backoff, self.max_backoff))
+            attempt += 1
+
+    async def scrape_url(self, url):
+        """Scrape price from `url`, recording the scrape in `telemetry`."""
+        event = {"site": None, "url": url}
+        try:
+            price = await self._scrape_url(url, event)
+        except Exception as exc:
+            self.telemetry.record(**event, error=exc)
+            raise
+        self.telemetry.record(**event, price=price)
+        return price
+
+    async def _scrape_url(self, url, event):
+        """Scrape price from `url`, filling `event` with telemetry."""
+        loop = asyncio.get_running_loop()
+        site = site_for_url(url)
+        event["site"] = site.name
+        start = time.perf_counter()
+        if site.fetch == "browser":
+            price = await loop.run_in_executor(
+                self._browser_executor,
+                partial(site.parser, url, pool=self._driver_pool),
+            )
+            event["fetch_seconds"] = time.perf_counter() - start
+            return price
+        entry = self.cache.get(url) if self.cache is not None else None
+        status, res_headers, content = await self.fetch_response(
+            url,
+            use_headers=site.use_headers,
+            extra_headers=conditional_headers(entry),
+        )
+        event["fetch_seconds"] = time.perf_counter() - start
+        event["status"] = status
+        event["response_bytes"] = len(content)
+        if entry is not None and status == 304:
+            self.cache.touch(url)
+            event["cached"] = True
+            return entry["price"]
+        if self.cache is not None:
+            digest = content_hash(content)
+            if entry is not None and entry["content_hash"] == digest:
+                # store the new validators, so that the next request can be
+                # answered with `304 Not Modified`
+                self.cache.put(
+                    url,
+                    digest,
+                    entry["price"],
+                    etag=res_headers.get("ETag"),
+                    last_modified=res_headers.get("Last-Modified"),
+                )
+                event["cached"] = True
+                return entry["price"]
+        start = time.perf_counter()
+        price = await loop.run_in_executor(
+            self._parse_executor,
+            parse_page,
+            site,
+            content,
+        )
+        event["parse_seconds"] = time.perf_counter() - start
+        if self.cache is not None and status == 200:
+            self.cache.put(
+                url,
+                digest,
+                price,
+                etag=res_headers.get("ETag"),
+                last_modified=res_headers.get("Last-Modified"),
+            )
+        return price
+
+    async def scrape(self, list_link, progress=True):
+        """Scrape all links in `list_link`.
+
+        Returns
+        -------
+        list
+            Prices, in the same order as `list_link`.
+
+        Raises
+        ------
+        Exception
+            The first exception raised while scraping any link. Pending
+            scrapes are cancelled.
+        """
+        bar = tqdm(total=len(list_link), disable=not progress)
+
+        async def scrape_and_count(url):
+            try:
+                return await self.scrape_url(url)
+            finally:
+                bar.update()
+
+        tasks = [asyncio.ensure_future(scrape_and_count(url)) for url in list_link]
+        try:
+            if tasks:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in tasks:
+                if task.done() and task.exception() is not None:
+                    raise task.exception()
+            return [task.result() for task in tasks]
+        finally:
+            for task in tasks:
+                task.cancel()
+            bar.close()
+
+    async def iter_scrape(self, list_link, progress=True, return_exceptions=False):
+        """Scrape all links in `list_link`, yielding results as they finish.
+
+        Yields
+        ------
+        tuple
+            `(index, price)`, where `index` is the position of the link in
+            `list_link`. If `return_exceptions`, `price` is the exception
+            raised while scraping the link, if any.
+
+        Raises
+        ------
+        Exception
+            If not `return_exceptions`, the first exception raised while
+            scraping any link. Pending scrapes are cancelled.
+        """
+        bar = tqdm(total=len(list_link), disable=not progress)
+
+        async def scrape_with_index(index, url):
+            try:
+                return index, await self.scrape_url(url)
+            except Exception as exc:
+                if not return_exceptions:
+                    raise
+                return index, exc
+
+        tasks = [
+            asyncio.ensure_future(scrape_with_index(index, url))
+            for index, url in enumerate(list_link)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                bar.update()
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            bar.close()
+
+
+async def scrape_links_async(list_link, progress=True, **kwargs):
+    """Scrape `list_link` with a new :class:`ScrapeEngine`.
+
+    Keyword arguments are passed to :class:`ScrapeEngine`.
+    """
+    async with ScrapeEngine(**kwargs) as engine:
+        return await engine.scrape(list_link, progress=progress)
+
+
+def scrape_links(list_link, progress=True, **kwargs):
+    """Scrape `list_link` with a new :class:`ScrapeEngine`, synchronously.
+
+    Keyword arguments are passed to :class:`ScrapeEngine`.
+    """
+    return run_coroutine(scrape_links_async(list_link, progress=progress, **kwargs))
+
+
+def iter_scrape_links(list_link, progress=True, return_exceptions=False, **kwargs):
+    """Scrape `list_link`, yielding `(index, price)` as each link is done.
+
+    The scrape runs with a new :class:`ScrapeEngine` on an event loop in a
+    separate thread, so that results can be consumed synchronously while
+    the remaining links are being scraped. See :meth:`ScrapeEngine.iter_scrape`
+    for `return_exceptions`. Keyword arguments are passed to
+    :class:`ScrapeEngine`.
+
+    If the generator is closed early, e.g. by a `break` or an exception in
+    the consumer, the pending scrapes are cancelled and the thread is joined
+    before returning.
+    """
+    results = queue.Queue()
+    stop = threading.Event()
+    done = object()
+    running = {}
+
+    async def run():
+        running["loop"] = asyncio.get_running_loop()
+        running["task"] = asyncio.current_task()
+        if stop.is_set():
+            return
+        async with ScrapeEngine(**kwargs) as engine:
+            async for item in engine.iter_scrape(
+                list_link,
+                progress=progress,
+                return_exceptions=return_exceptions,
+            ):
+                if stop.is_set():
+                    break
+                results.put(item)
+
+    def target():
+        try:
+            asyncio.run(run())
+        except BaseException as exc:
+            results.put(exc)
+        finally:
+            results.put(done)
+
+    thread = threading.Thread(target=target, name="iter_scrape_links", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = results.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        if "task" in running:
+            try:
+                running["loop"].call_soon_threadsafe(running["task"].cancel)
+            except RuntimeError:
+                # the loop is already closed
+                pass
+        thread.join()
+
+
+def run_coroutine(coro):
+    """Run `coro` to completion and return its result.
+
+    If an event loop is already running in this thread (e.g., in a Jupyter
+    notebook), the coroutine runs on a new event loop in a separate thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    result = {}
+
+    def target():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as exc:
+            result["error"] = exc
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
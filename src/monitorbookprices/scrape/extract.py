@@ -0,0 +1,217 @@
+"""Fast extraction of prices with compiled XPath selectors run on lxml."""
+
+import lxml.html
+from lxml.etree import XPath
+
+
+def _has_class(name):
+    """Return XPath predicate matching elements with class `name`."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _class_is(value):
+    """Return XPath predicate matching elements whose class is `value`."""
+    return f"normalize-space(@class) = '{value}'"
+
+
+def _first(tag, predicate, descendant=False):
+    """Compile XPath selecting the first `tag` matching `predicate`."""
+    axis = ".//" if descendant else "//"
+    return XPath(f"({axis}{tag}[{predicate}])[1]")
+
+
+def _find(selector, node):
+    """Return first element selected by `selector` in `node`, or `None`."""
+    if node is None:
+        return None
+    found = selector(node)
+    return found[0] if found else None
+
+
+def html_tree(content):
+    """Parse `content` into an lxml tree.
+
+    UTF-8 content is decoded before parsing, as lxml would otherwise fall
+    back to latin-1 for pages not declaring their encoding.
+    """
+    if isinstance(content, bytes):
+        try:
+            content = content.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    return lxml.html.fromstring(content)
+
+
+def parse_page(site, content, fast=True):
+    """Parse price from the `content` of a page of `site`.
+
+    Parameters
+    ----------
+    site: :class:`monitorbookprices.scrape.registry.SiteAdapter`
+        Website of the page.
+    content: bytes or str
+        Content of the page.
+    fast: bool, default=True
+        Whether to use the fast extractor of `site`, if any. If the fast
+        extractor fails, the BeautifulSoup parser of `site` is used.
+    """
+    if fast and site.extractor is not None:
+        try:
+            return site.extractor(html_tree(content))
+        except Exception:  # noqa: S110
+            pass
+    return site.parser(content)
+
+
+_adelphi_box = _first("div", _has_class("book-impressum-price"))
+_adelphi_price = _first("span", _has_class("sale"), descendant=True)
+
+
+def extract_adelphi(tree):
+    """Extract price from an adelphi.it page."""
+    price = _find(_adelphi_price, _find(_adelphi_box, tree))
+    if price is not None:
+        return clean_up_price(price.text_content().strip())
+
+
+_buecher_price = _first("div", _class_is("clearfix price-shipping-free"))
+
+
+def extract_buecher(tree):
+    """Extract price from a buecher.de page."""
+    price = _find(_buecher_price, tree)
+    if price is not None:
+        return clean_up_price(price.text_content().strip())
+
+
+_feltrinelli_label = _first("span", _has_class("cc-top-title-label"))
+_feltrinelli_main = _first("div", _has_class("cc-pdp-main"))
+_feltrinelli_box = _first("div", _has_class("cc-content-price"), descendant=True)
+_feltrinelli_price = _first("span", _has_class("cc-price"), descendant=True)
+
+
+def extract_feltrinelli_and_ibs(tree):
+    """Extract price from a lafeltrinelli.it or ibs.it page."""
+    title_label = _find(_feltrinelli_label, tree)
+    if title_label is None or title_label.text_content() == "LIBRO USATO":
+        return
+    price = _find(
+        _feltrinelli_price,
+        _find(_feltrinelli_box, _find(_feltrinelli_main, tree)),
+    )
+    if price is not None:
+        return clean_up_price(price.text_content().strip())
+
+
+_hoepli_availability = _first("span", _has_class("disponibilita_Z"))
+_hoepli_box = _first("div", _has_class("prezzo"))
+_hoepli_price = _first("span", "true()", descendant=True)
+
+
+def extract_hoepli(tree):
+    """Extract price from a hoepli.it page."""
+    non_disponibile = _find(_hoepli_availability, tree)
+    if (
+        non_disponibile is not None
+        and "Non disponibile" in non_disponibile.text_content()
+    ):
+        return
+    box = _find(_hoepli_box, tree)
+    if box is None:
+        raise ValueError("Price not found.")
+    price = _find(_hoepli_price, box)
+    if price is not None:
+        return clean_up_price(price.text_content())
+
+
+_hugendubel_box = _first("div", _has_class("current-price"))
+_hugendubel_price = _first("span", _has_class("price"), descendant=True)
+
+
+def extract_hugendubel(tree):
+    """Extract price from a hugendubel.de page."""
+    box = _find(_hugendubel_box, tree)
+    if box is None:
+        raise ValueError("Price not found.")
+    price = _find(_hugendubel_price, box)
+    if price is not None:
+        return clean_up_price(price.text_content())
+
+
+_libcoop_disabled = _first("button", _class_is("btn btn-disabled"))
+_libcoop_disabled_2 = _first("button", _class_is("btn btn-disabled mt-2"))
+_libcoop_price = _first("span", _has_class("current-price"))
+
+
+def extract_libcoop(tree):
+    """Extract price from a librerie.coop page."""
+    msg = _find(_libcoop_disabled, tree)
+    if msg is None:
+        msg = _find(_libcoop_disabled_2, tree)
+    if msg is not None and "NON DISPONIBILE" in msg.text_content():
+        return
+    price = _find(_libcoop_price, tree)
+    if price is not None:
+        return clean_up_price(price.text_content())
+
+
+_libraccio_box = _first("div", _has_class("buybox"))
+_libraccio_price = _first("span", _has_class("currentprice"), descendant=True)
+
+
+def extract_libraccio(tree):
+    """Extract price from a libraccio.it page."""
+    price = _find(_libraccio_price, _find(_libraccio_box, tree))
+    if price is not None:
+        return clean_up_price(price.text_content().strip())
+
+
+_libuni_price = _first("span", _has_class("current-price"))
+
+
+def extract_libuni(tree):
+    """Extract price from a libreriauniversitaria.it page."""
+    text = tree.text_content()
+    if "Prodotto momentaneamente non disponibile" in text or "Fuori catalogo" in text:
+        return
+    price = _find(_libuni_price, tree)
+    if price is not None:
+        return clean_up_price(price.text_content().strip())
+
+
+_mondadori_price = _first("span", _class_is("new-price new-detail-price"))
+
+
+def extract_mondadori(tree):
+    """Extract price from a mondadoristore.it page."""
+    price = _find(_mondadori_price, tree)
+    if price is not None:
+        return clean_up_price(price.text_content())
+
+
+_rizzoli_price = _first("span", _has_class("price-value"))
+
+
+def extract_rizzoli(tree):
+    """Extract price from a libreriarizzoli.it page."""
+    price = _find(_rizzoli_price, tree)
+    if price is not None:
+        return clean_up_price(price.text_content())
+
+
+def clean_up_price(ss):
+    """Clean up price into float.
+
+    :param ss: price string, containing possibly symbols.
+    :type ss: str
+    :returns: price float
+    :rtype: float
+    """
+    if len(ss) > 0:
+        return float(
+            ss.replace("\n", "")
+            .replace("\xa0", "")
+            .replace("€", "")
+            .replace(",", ".")
+            .strip()
+        )
@@ -1,70 +1,233 @@
 """Functions to update prices of a database."""
 
-from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import polars as pl
+from sqlalchemy import inspect, text
 from tqdm import tqdm
 
-from monitorbookprices.scrape.sites import (
-    list_sites,
-    list_sites_links_short,
-    scrape_url,
-)
+from monitorbookprices.data.database import write_database_batches
+from monitorbookprices.data.engine import resolve_engine
+from monitorbookprices.scrape.engine import iter_scrape_links, scrape_links
+from monitorbookprices.scrape.sites import list_sites, scrape_url
 
 
-def scrape_database(books_df, date=datetime.today().date(), parallel=True):
-    """Scrape database."""
-    list_isbn, list_link = prepare_scrape(books_df)
-    list_price = scrape_list(list_link, parallel=parallel)
-    list_site = from_list_link_to_list_site(list_link)
-    list_date = [date] * len(list_price)
-    return pl.DataFrame(
-        {
-            "isbn": list_isbn,
-            "site": list_site,
-            "price": list_price,
-            "date": list_date,
+def scrape_database(
+    books_df,
+    date=datetime.today().date(),
+    parallel=True,
+    **engine_kwargs,
+):
+    """Scrape database.
+
+    If `parallel`, the links are scraped concurrently by
+    :class:`monitorbookprices.scrape.engine.ScrapeEngine`, which is
+    configured by the remaining keyword arguments (e.g., `max_connections`,
+    `max_per_host` and `rate_limits`). See :func:`scrape_list`.
+    """
+    jobs = prepare_scrape(books_df)
+    list_price = scrape_list(jobs["url"].to_list(), parallel=parallel, **engine_kwargs)
+    return jobs.select(
+        "isbn",
+        "site",
+        price=pl.Series(list_price, dtype=pl.Float64),
+        date=pl.lit(date),
+    )
+
+
+def iter_scrape_database(
+    books_df,
+    date=None,
+    skip=None,
+    return_exceptions=False,
+    **engine_kwargs,
+):
+    """Scrape database, yielding prices as soon as they are scraped.
+
+    Parameters
+    ----------
+    books_df: :class:`polars.DataFrame`
+        Books to scrape.
+    date: :class:`datetime.date`, optional
+        Date of the scrape. Defaults to today.
+    skip: :class:`polars.DataFrame`, optional
+        Pairs of `isbn` and `site` not to scrape.
+    return_exceptions: bool, default=False
+        Whether to yield failed scrapes instead of raising. Failed scrapes
+        have `price` set to `None` and the exception under the key `error`.
+
+    Remaining keyword arguments configure the
+    :class:`monitorbookprices.scrape.engine.ScrapeEngine`.
+
+    Yields
+    ------
+    dict
+        Scraped price, with keys `isbn`, `site`, `price` and `date`. If
+        `return_exceptions`, also `url` and `error`.
+    """
+    if date is None:
+        date = datetime.today().date()
+    jobs = prepare_scrape(books_df)
+    if skip is not None:
+        jobs = jobs.join(skip.select("isbn", "site"), on=["isbn", "site"], how="anti")
+    list_isbn = jobs["isbn"].to_list()
+    list_site = jobs["site"].to_list()
+    list_link = jobs["url"].to_list()
+    for index, price in iter_scrape_links(
+        list_link,
+        return_exceptions=return_exceptions,
+        **engine_kwargs,
+    ):
+        row = {
+            "isbn": list_isbn[index],
+            "site": list_site[index],
+            "price": price,
+            "date": date,
         }
+        if return_exceptions:
+            error = price if isinstance(price, Exception) else None
+            row.update(
+                price=None if error is not None else price,
+                url=list_link[index],
+                error=error,
+            )
+        yield row
+
+
+def scrape_to_database(
+    books_df,
+    table_name="prices",
+    engine=None,
+    url=None,
+    date=None,
+    resume=True,
+    batch_rows=500,
+    batch_seconds=30,
+    **engine_kwargs,
+):
+    """Scrape database, appending prices to a table while scraping.
+
+    Prices are written in batches as they are scraped, see
+    :func:`monitorbookprices.data.database.write_database_batches`, so that
+    an interrupted scrape keeps what it has already collected.
+
+    Parameters
+    ----------
+    books_df: :class:`polars.DataFrame`
+        Books to scrape.
+    table_name: str, default="prices"
+        Name of the prices table.
+    engine: :class:`sqlalchemy.engine.Engine`, optional
+        Engine object providing the connection to the database.
+    url: str, optional
+        Database url.
+    date: :class:`datetime.date`, optional
+        Date of the scrape. Defaults to today.
+    resume: bool, default=True
+        Whether to skip pairs of `isbn` and `site` already in the table for
+        `date`, e.g. written by an interrupted run.
+    batch_rows: int, default=500
+        Maximum number of prices per batch.
+    batch_seconds: float, default=30
+        Maximum time between writes, in seconds.
+
+    Remaining keyword arguments configure the
+    :class:`monitorbookprices.scrape.engine.ScrapeEngine`.
+
+    Returns
+    -------
+    int
+        Number of written prices.
+    """
+    engine = resolve_engine(engine, url)
+    if date is None:
+        date = datetime.today().date()
+    skip = scraped_on(date, table_name=table_name, engine=engine) if resume else None
+    return write_database_batches(
+        iter_scrape_database(books_df, date=date, skip=skip, **engine_kwargs),
+        table_name,
+        schema={
+            "isbn": pl.String,
+            "site": pl.String,
+            "price": pl.Float64,
+            "date": pl.Date,
+        },
+        engine=engine,
+        batch_rows=batch_rows,
+        batch_seconds=batch_seconds,
+    )
+
+
+def scraped_on(date, table_name="prices", engine=None):
+    """Return pairs of `isbn` and `site` in the prices table for `date`."""
+    if not inspect(engine).has_table(table_name):
+        return pl.DataFrame(schema={"isbn": pl.String, "site": pl.String})
+    query = text(
+        f"SELECT isbn, site FROM {table_name} "  # noqa: S608
+        "WHERE date >= :day AND date < :next_day"
+    )
+    with engine.connect() as connection:
+        rows = connection.execute(
+            query,
+            {
+                "day": date.isoformat(),
+                "next_day": (date + timedelta(days=1)).isoformat(),
+            },
+        ).fetchall()
+    return pl.DataFrame(
+        rows,
+        schema={"isbn": pl.String, "site": pl.String},
+        orient="row",
     )
 
 
 def prepare_scrape(books_df):
-    """Prepare scrape."""
-    list_isbn = []
-    list_site = []
-    for book in books_df.iter_slices(1):
-        list_site_i = book.select(pl.col(list_sites()))[
-            [s.name for s in book[list_sites()] if not s.null_count()]
-        ]
-        if list_site_i.shape[0] > 0:
-            for site in list_site_i:
-                list_isbn.append(book["isbn"][0])
-                list_site.append(site[0])
-    return list_isbn, list_site
-
-
-def scrape_list(list_site, parallel=True):
-    """Scrape list of sites."""
+    """Prepare scrape.
+
+    The site columns of `books_df` are unpivoted into one row per link,
+    books without a link to a site are dropped.
+
+    Returns
+    -------
+    :class:`polars.DataFrame`
+        DataFrame with columns `isbn`, `site` and `url`, ordered by book and
+        then by site.
+    """
+    sites = [site for site in list_sites() if site in books_df.columns]
+    return (
+        books_df.select("isbn", *sites)
+        .with_row_index("book")
+        .unpivot(
+            on=sites, index=["book", "isbn"], variable_name="site", value_name="url"
+        )
+        .drop_nulls("url")
+        .sort("book", maintain_order=True)
+        .drop("book")
+    )
+
+
+def scrape_list(list_site, parallel=True, **engine_kwargs):
+    """Scrape list of sites.
+
+    If `parallel`, the links are scraped concurrently by
+    :class:`monitorbookprices.scrape.engine.ScrapeEngine`, which is
+    configured by the remaining keyword arguments. Otherwise, they are
+    scraped one by one with :func:`monitorbookprices.scrape.sites.scrape_url`.
+
+    Raises
+    ------
+    TypeError
+        If keyword arguments of the engine are given and not `parallel`.
+    """
+    if not parallel and engine_kwargs:
+        raise TypeError(
+            "Sequential scrapes do not take engine options: "
+            f"{', '.join(sorted(engine_kwargs))}."
+        )
     if parallel:
-        with ThreadPoolExecutor() as executor:
-            list_price = list(
-                tqdm(executor.map(scrape_url, list_site), total=len(list_site))
-            )
+        list_price = scrape_links(list_site, **engine_kwargs)
     else:
         list_price = []
         for site in tqdm(list_site):
             list_price.append(scrape_url(site))
     return list_price
-
-
-def from_list_link_to_list_site(list_link):
-    """Derive `list_site` from `list_link`."""
-    dd = dict(zip(list_sites_links_short(), list_sites()))
-    list_site = []
-    for link in list_link:
-        for sl in dd.keys():
-            if sl in link:
-                list_site.append(dd[sl])
-                break
-    return list_site
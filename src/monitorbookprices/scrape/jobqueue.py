@@ -0,0 +1,415 @@
+"""Durable queue of scrape jobs, and workers consuming it."""
+
+import asyncio
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+
+import polars as pl
+
+from monitorbookprices.book.general import schema_prices
+from monitorbookprices.data.database import (
+    TABLE_KEYS,
+    ensure_table,
+    upsert_database,
+    write_database,
+)
+from monitorbookprices.data.engine import resolve_engine
+from monitorbookprices.data.parquet import is_parquet_url
+from monitorbookprices.scrape.engine import ScrapeEngine, run_coroutine
+from monitorbookprices.scrape.jobs import classify_failure
+
+STATUSES = ("pending", "leased", "done", "failed")
+PRICES_SCHEMA = {**schema_prices(), "date": pl.Date}
+
+
+class JobQueue:
+    """Durable queue of scrape jobs, shared by worker processes.
+
+    Each job is the scrape of one book on one site for a given day. Workers
+    lease jobs for `lease_seconds`, and either complete them with the
+    scraped price or fail them. Jobs whose lease expires, e.g. because their
+    worker crashed, are leased again, up to `max_attempts` leases.
+
+    The queue is an SQLite database in WAL mode, so that any number of
+    processes on the same machine can use it at once. WAL needs memory
+    shared between the processes: the file must be on a local disk, not on
+    a network filesystem, and the queue cannot be shared across machines.
+
+    Parameters
+    ----------
+    path: str or :class:`pathlib.Path`
+        Path to the queue file.
+    lease_seconds: float, default=600
+        Duration of a lease, in seconds.
+    max_attempts: int, default=3
+        Maximum number of leases of a job.
+    """
+
+    def __init__(self, path, lease_seconds=600, max_attempts=3):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY, "
+            "isbn TEXT, "
+            "site TEXT, "
+            "url TEXT, "
+            "date TEXT, "
+            "status TEXT DEFAULT 'pending', "
+            "attempts INTEGER DEFAULT 0, "
+            "worker TEXT, "
+            "leased_until REAL, "
+            "price REAL, "
+            "error TEXT, "
+            "updated_at REAL, "
+            "UNIQUE (isbn, site, date))"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, leased_until)"
+        )
+
+    def __enter__(self):
+        """Return the queue."""
+        return self
+
+    def __exit__(self, *exc):
+        """Close the queue."""
+        self.close()
+
+    def enqueue(self, jobs_df, date=None):
+        """Add jobs to the queue.
+
+        Parameters
+        ----------
+        jobs_df: :class:`polars.DataFrame`
+            Jobs, with columns `isbn`, `site` and `url`, e.g. from
+            :func:`monitorbookprices.scrape.general.prepare_scrape`.
+        date: :class:`datetime.date`, optional
+            Day of the scrape. Defaults to today.
+
+        Returns
+        -------
+        int
+            Number of added jobs. Jobs already in the queue for the same
+            book, site and day are not added again.
+        """
+        if date is None:
+            date = datetime.today().date()
+        now = time.time()
+        rows = [
+            (isbn, site, url, date.isoformat(), now)
+            for isbn, site, url in jobs_df.select("isbn", "site", "url").iter_rows()
+        ]
+        with self._lock:
+            before = self._connection.total_changes
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO jobs (isbn, site, url, date, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._connection.execute("COMMIT")
+            return self._connection.total_changes - before
+
+    def lease(self, worker, n=1):
+        """Lease up to `n` jobs to `worker`.
+
+        Pending jobs are leased first in order of insertion, together with
+        jobs whose lease expired. Expired jobs already leased
+        `max_attempts` times are failed instead.
+
+        Returns
+        -------
+        list of dict
+            Leased jobs, with keys `id`, `isbn`, `site`, `url`, `date` and
+            `attempts`.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'lease expired', "
+                    "updated_at = ? "
+                    "WHERE status = 'leased' AND leased_until < ? AND attempts >= ?",
+                    (now, now, self.max_attempts),
+                )
+                # select, then update, in the same write transaction:
+                # `UPDATE ... RETURNING` would need SQLite 3.35
+                rows = self._connection.execute(
+                    "SELECT id, isbn, site, url, date, attempts + 1 FROM jobs "
+                    "WHERE status = 'pending' "
+                    "OR (status = 'leased' AND leased_until < ?) "
+                    "ORDER BY id LIMIT ?",
+                    (now, n),
+                ).fetchall()
+                self._connection.executemany(
+                    "UPDATE jobs SET status = 'leased', worker = ?, "
+                    "leased_until = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ?",
+                    [(worker, now + self.lease_seconds, now, row[0]) for row in rows],
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        columns = ("id", "isbn", "site", "url", "date", "attempts")
+        jobs = [dict(zip(columns, row)) for row in rows]
+        for job in jobs:
+            job["date"] = datetime.fromisoformat(job["date"]).date()
+        return jobs
+
+    def complete(self, job_id, price, worker):
+        """Complete job `job_id` leased by `worker` with `price`.
+
+        Returns
+        -------
+        bool
+            Whether the job was still leased by `worker`. If not, e.g.
+            because the lease expired and the job was leased to another
+            worker, nothing is changed.
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET status = 'done', price = ?, error = NULL, "
+                "updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (price, time.time(), job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, error, worker, retry=True):
+        """Fail job `job_id` leased by `worker` with message `error`.
+
+        If `retry` and the job was leased less than `max_attempts` times,
+        it goes back to the pending jobs.
+
+        Returns
+        -------
+        bool
+            Whether the job was still leased by `worker`.
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET error = ?, updated_at = ?, "
+                "status = CASE WHEN ? AND attempts < ? "
+                "THEN 'pending' ELSE 'failed' END "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (error, time.time(), retry, self.max_attempts, job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def counts(self):
+        """Return number of jobs with each status in `STATUSES`."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return {**dict.fromkeys(STATUSES, 0), **dict(rows)}
+
+    def unfinished(self):
+        """Return number of jobs pending or leased."""
+        counts = self.counts()
+        return counts["pending"] + counts["leased"]
+
+    def results(self, date=None):
+        """Return prices of the completed jobs, optionally only for `date`."""
+        query = "SELECT isbn, site, price, date FROM jobs WHERE status = 'done'"
+        params = ()
+        if date is not None:
+            query += " AND date = ?"
+            params = (date.isoformat(),)
+        with self._lock:
+            rows = self._connection.execute(query + " ORDER BY id", params).fetchall()
+        return pl.DataFrame(
+            rows,
+            schema={
+                "isbn": pl.String,
+                "site": pl.String,
+                "price": pl.Float64,
+                "date": pl.String,
+            },
+            orient="row",
+        ).with_columns(pl.col("date").str.to_date())
+
+    def close(self):
+        """Close the queue."""
+        if self._connection is None:
+            return
+        with self._lock:
+            self._connection.close()
+            self._connection = None
+
+
+def run_worker(
+    queue,
+    engine=None,
+    url=None,
+    table_name="prices",
+    batch_size=50,
+    poll_seconds=5,
+    worker=None,
+    **engine_kwargs,
+):
+    """Scrape jobs leased from `queue` until none is left.
+
+    Jobs are leased in batches of `batch_size` and scraped concurrently by
+    one :class:`monitorbookprices.scrape.engine.ScrapeEngine`, configured by
+    the remaining keyword arguments. Prices are merged into `table_name`
+    with :func:`monitorbookprices.data.database.upsert_database`, or
+    appended to it with a `parquet://` url, if `engine` or `url` is given,
+    and then the jobs are completed. A job scraped again after its lease
+    expired thus replaces its price rather than duplicating it. Failed
+    scrapes are retried by a later lease if their failure is classified as
+    `network` by :func:`monitorbookprices.scrape.jobs.classify_failure`.
+
+    While other workers hold leases, the worker polls the queue every
+    `poll_seconds`, so that it takes over the jobs of crashed workers once
+    their lease expires.
+
+    Parameters
+    ----------
+    queue: :class:`JobQueue` or str
+        Job queue, or path to it.
+    engine: :class:`sqlalchemy.engine.Engine`, optional
+        Engine object providing the connection to the database.
+    url: str, optional
+        Database url.
+    table_name: str, default="prices"
+        Name of the prices table.
+    batch_size: int, default=50
+        Number of jobs per lease. A batch should be scraped well within the
+        lease duration of the queue.
+    poll_seconds: float, default=5
+        Time between two polls of the queue while waiting for leased jobs.
+    worker: str, optional
+        Name of the worker. Defaults to host name and process id.
+
+    Returns
+    -------
+    dict
+        Number of jobs completed under the key `done`, and number of failed
+        scrapes under the key `failed`.
+    """
+    own_queue = isinstance(queue, (str, Path))
+    if own_queue:
+        queue = JobQueue(queue)
+    if worker is None:
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+    counts = Counter(done=0, failed=0)
+
+    def write(rows):
+        if not rows or (engine is None and url is None):
+            return
+        df = pl.DataFrame(rows, schema=PRICES_SCHEMA, orient="row")
+        if engine is None and is_parquet_url(url):
+            write_database(df, table_name, url=url)
+        else:
+            upsert_database(
+                df, table_name, key=TABLE_KEYS["prices"], engine=engine, url=url
+            )
+
+    async def work():
+        async with ScrapeEngine(**engine_kwargs) as scraper:
+            while True:
+                jobs = queue.lease(worker, batch_size)
+                if not jobs:
+                    if not queue.unfinished():
+                        return
+                    await asyncio.sleep(poll_seconds)
+                    continue
+                results = [
+                    result
+                    async for result in scraper.iter_scrape(
+                        [job["url"] for job in jobs],
+                        progress=False,
+                        return_exceptions=True,
+                    )
+                ]
+                completed = []
+                for index, price in results:
+                    job = jobs[index]
+                    if isinstance(price, Exception):
+                        queue.fail(
+                            job["id"],
+                            repr(price),
+                            worker,
+                            retry=classify_failure(price) == "network",
+                        )
+                        counts["failed"] += 1
+                    else:
+                        completed.append((job, price))
+                write(
+                    [
+                        {
+                            "isbn": job["isbn"],
+                            "site": job["site"],
+                            "price": price,
+                            "date": job["date"],
+                        }
+                        for job, price in completed
+                    ]
+                )
+                for job, price in completed:
+                    counts["done"] += queue.complete(job["id"], price, worker)
+
+    try:
+        run_coroutine(work())
+    finally:
+        if own_queue:
+            queue.close()
+    return dict(counts)
+
+
+def run_workers(path, processes=None, **kwargs):
+    """Run :func:`run_worker` on the queue at `path` in several processes.
+
+    Parameters
+    ----------
+    path: str or :class:`pathlib.Path`
+        Path to the job queue.
+    processes: int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+
+    Remaining keyword arguments are passed to :func:`run_worker`, and must
+    be picklable (e.g., a database `url` rather than an `engine`). The
+    prices table is created beforehand, so that the workers do not race to
+    create it.
+
+    Returns
+    -------
+    dict
+        Numbers of completed and failed jobs summed over all workers.
+    """
+    processes = processes or os.cpu_count() or 1
+    url = kwargs.get("url")
+    if url is not None and not is_parquet_url(url):
+        ensure_table(
+            kwargs.get("table_name", "prices"),
+            TABLE_KEYS["prices"],
+            PRICES_SCHEMA,
+            engine=resolve_engine(url=url),
+            indexes=[("date",)],
+        )
+    with ProcessPoolExecutor(processes, mp_context=get_context("spawn")) as pool:
+        futures = [
+            pool.submit(run_worker, str(path), **kwargs) for _ in range(processes)
+        ]
+        totals = Counter(done=0, failed=0)
+        for future in futures:
+            totals.update(future.result())
+    return dict(totals)
@@ -0,0 +1,226 @@
+"""Resumable scrape jobs."""
+
+import asyncio
+from collections import Counter
+from datetime import datetime
+
+import aiohttp
+import polars as pl
+from selenium.common.exceptions import WebDriverException
+from sqlalchemy import (
+    Column,
+    Date,
+    DateTime,
+    MetaData,
+    String,
+    Table,
+    select,
+)
+
+from monitorbookprices.data.database import write_database_batches
+from monitorbookprices.data.engine import resolve_engine
+from monitorbookprices.scrape.engine import HTTPStatusError
+from monitorbookprices.scrape.general import (
+    iter_scrape_database,
+    prepare_scrape,
+    scraped_on,
+)
+from monitorbookprices.scrape.registry import UnsupportedSiteError
+
+FAILURE_KINDS = ("network", "parse", "out_of_stock", "unsupported")
+
+
+def classify_failure(error):
+    """Classify a failed scrape.
+
+    Parameters
+    ----------
+    error: Exception or None
+        Exception raised while scraping, or `None` if the scrape succeeded
+        without finding a price.
+
+    Returns
+    -------
+    str
+        One of `FAILURE_KINDS`.
+    """
+    if error is None:
+        return "out_of_stock"
+    if isinstance(error, UnsupportedSiteError):
+        return "unsupported"
+    if isinstance(
+        error,
+        (
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+            HTTPStatusError,
+            OSError,
+            WebDriverException,
+        ),
+    ):
+        return "network"
+    return "parse"
+
+
+def failures_table(table_name="scrape_failures"):
+    """Return definition of the table recording failed scrapes."""
+    return Table(
+        table_name,
+        MetaData(),
+        Column("isbn", String),
+        Column("site", String),
+        Column("url", String),
+        Column("date", Date),
+        Column("kind", String),
+        Column("message", String),
+        Column("recorded_at", DateTime),
+    )
+
+
+def failed_on(date, kinds, table_name="scrape_failures", engine=None):
+    """Return pairs of `isbn` and `site` that failed on `date` with `kinds`."""
+    table = failures_table(table_name)
+    query = select(table.c.isbn, table.c.site).where(
+        table.c.date == date,
+        table.c.kind.in_(list(kinds)),
+    )
+    with engine.connect() as connection:
+        rows = connection.execute(query).fetchall()
+    return pl.DataFrame(
+        rows,
+        schema={"isbn": pl.String, "site": pl.String},
+        orient="row",
+    )
+
+
+def run_scrape_job(
+    books_df,
+    engine=None,
+    url=None,
+    date=None,
+    table_name="prices",
+    failures_table_name="scrape_failures",
+    retry_failed=("network",),
+    batch_rows=500,
+    batch_seconds=30,
+    plan=None,
+    **engine_kwargs,
+):
+    """Run a resumable scrape job.
+
+    Prices are appended to `table_name` while scraping, see
+    :func:`monitorbookprices.scrape.general.scrape_to_database`. Each
+    request is retried with exponential backoff and jitter (see the
+    `retries`, `backoff` and `max_backoff` arguments of
+    :class:`monitorbookprices.scrape.engine.ScrapeEngine`). Links that still
+    fail, or whose page has no price, do not stop the job: they are
+    classified with :func:`classify_failure` and recorded in
+    `failures_table_name`.
+
+    The prices and failures tables are the checkpoint of the job: running
+    it again for the same `date` skips the links already scraped, and the
+    links that failed with a kind not in `retry_failed`.
+
+    Parameters
+    ----------
+    books_df: :class:`polars.DataFrame`
+        Books to scrape.
+    engine: :class:`sqlalchemy.engine.Engine`, optional
+        Engine object providing the connection to the database.
+    url: str, optional
+        Database url.
+    date: :class:`datetime.date`, optional
+        Date of the scrape. Defaults to today.
+    table_name: str, default="prices"
+        Name of the prices table.
+    failures_table_name: str, default="scrape_failures"
+        Name of the table recording failed scrapes.
+    retry_failed: iterable of str, default=("network",)
+        Kinds of failures recorded by a previous run that are retried.
+    batch_rows: int, default=500
+        Maximum number of prices per batch.
+    batch_seconds: float, default=30
+        Maximum time between writes, in seconds.
+    plan: :class:`polars.DataFrame`, optional
+        Pairs of `isbn` and `site` to scrape, e.g. from
+        :func:`monitorbookprices.scrape.scheduler.plan_scrape`. Other links
+        of `books_df` are skipped.
+
+    Remaining keyword arguments configure the
+    :class:`monitorbookprices.scrape.engine.ScrapeEngine`.
+
+    Returns
+    -------
+    dict
+        Number of written prices under the key `written`, and number of
+        failures of each kind in `FAILURE_KINDS`.
+    """
+    engine = resolve_engine(engine, url)
+    if date is None:
+        date = datetime.today().date()
+    failures = failures_table(failures_table_name)
+    failures.create(engine, checkfirst=True)
+    skip = [
+        scraped_on(date, table_name=table_name, engine=engine),
+        failed_on(
+            date,
+            [kind for kind in FAILURE_KINDS if kind not in retry_failed],
+            table_name=failures_table_name,
+            engine=engine,
+        ),
+    ]
+    if plan is not None:
+        skip.append(
+            prepare_scrape(books_df)
+            .select("isbn", "site")
+            .join(plan.select("isbn", "site"), on=["isbn", "site"], how="anti")
+        )
+    skip = pl.concat(skip)
+    counts = Counter(dict.fromkeys(FAILURE_KINDS, 0))
+
+    def record(rows):
+        for row in rows:
+            error = row["error"]
+            if error is not None or row["price"] is None:
+                kind = classify_failure(error)
+                counts[kind] += 1
+                with engine.begin() as connection:
+                    connection.execute(
+                        failures.insert(),
+                        {
+                            "isbn": row["isbn"],
+                            "site": row["site"],
+                            "url": row["url"],
+                            "date": date,
+                            "kind": kind,
+                            "message": None if error is None else repr(error),
+                            "recorded_at": datetime.now(),
+                        },
+                    )
+            # failed links are retried by the next run, out of stock ones
+            # are recorded as missing prices
+            if error is None:
+                yield row
+
+    written = write_database_batches(
+        record(
+            iter_scrape_database(
+                books_df,
+                date=date,
+                skip=skip,
+                return_exceptions=True,
+                **engine_kwargs,
+            )
+        ),
+        table_name,
+        schema={
+            "isbn": pl.String,
+            "site": pl.String,
+            "price": pl.Float64,
+            "date": pl.Date,
+        },
+        engine=engine,
+        batch_rows=batch_rows,
+        batch_seconds=batch_seconds,
+    )
+    return {"written": written, **counts}
@@ -0,0 +1,205 @@
+"""Adaptive per-host rate control."""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+CONGESTION_STATUSES = frozenset({429, 503, 504})
+
+
+def parse_retry_after(value):
+    """Return seconds to wait from a `Retry-After` header, or `None`.
+
+    The header holds either a number of seconds or an HTTP date.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateController:
+    """Learn how many concurrent requests each host accepts.
+
+    The limit of each host follows an additive-increase,
+    multiplicative-decrease (AIMD) rule. Every successful request adds
+    `increase / limit` to the limit, i.e. about `increase` per round of
+    requests, as long as its latency stays within `latency_tolerance` times
+    the usual latency of the host. A congestion signal (one of
+    `CONGESTION_STATUSES` or a timeout) multiplies the limit by `decrease`,
+    at most once per `cooldown` seconds so that a burst of failures of the
+    requests in flight counts once. A `Retry-After` header also pauses all
+    requests to the host for the given time.
+
+    Learned limits are read from and saved to the JSON file `path`, so
+    that the next run starts close to the optimum.
+
+    Parameters
+    ----------
+    path: str or Path, optional
+        JSON file of the learned limits.
+    initial_limit: int, default=4
+        Limit of hosts without a learned limit.
+    min_limit: int, default=1
+        Minimum limit.
+    max_limit: int, default=16
+        Maximum limit.
+    increase: float, default=1
+        Additive increase of the limit per round of successful requests.
+    decrease: float, default=0.5
+        Multiplicative decrease of the limit on congestion.
+    latency_tolerance: float, default=2
+        The limit does not increase while the latency of requests is more
+        than `latency_tolerance` times the usual latency of the host.
+    cooldown: float, default=1
+        Minimum time between two decreases of the limit of a host, in
+        seconds.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        initial_limit=4,
+        min_limit=1,
+        max_limit=16,
+        increase=1,
+        decrease=0.5,
+        latency_tolerance=2,
+        cooldown=1,
+    ):
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError("Limits must satisfy 1 <= min_limit <= max_limit.")
+        self.path = None if path is None else Path(path)
+        self.initial_limit = min(max(initial_limit, min_limit), max_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._last_decrease = {}
+        if self.path is not None and self.path.exists():
+            self._hosts = json.loads(self.path.read_text())
+
+    def _state(self, host):
+        """Return mutable state of `host`."""
+        if host not in self._hosts:
+            self._hosts[host] = {
+                "limit": self.initial_limit,
+                "latency": None,
+                "blocked_until": 0.0,
+            }
+        return self._hosts[host]
+
+    def limit(self, host):
+        """Return number of requests allowed in flight towards `host`."""
+        with self._lock:
+            limit = int(self._state(host)["limit"])
+        return min(max(limit, self.min_limit), self.max_limit)
+
+    def blocked_for(self, host):
+        """Return seconds to wait before sending requests to `host`."""
+        with self._lock:
+            blocked_until = self._state(host).get("blocked_until", 0.0)
+        return max(0.0, blocked_until - time.time())
+
+    def on_success(self, host, latency):
+        """Record a request to `host` answered after `latency` seconds."""
+        with self._lock:
+            state = self._state(host)
+            usual = state["latency"]
+            if usual is None or latency <= self.latency_tolerance * usual:
+                state["limit"] = min(
+                    self.max_limit, state["limit"] + self.increase / state["limit"]
+                )
+            # slow moving average, so that a sustained rise of latency is
+            # seen as congestion for a while before becoming the norm
+            state["latency"] = (
+                latency if usual is None else usual + 0.05 * (latency - usual)
+            )
+
+    def on_congestion(self, host, retry_after=None):
+        """Record a congestion signal from `host`.
+
+        Parameters
+        ----------
+        host: str
+            Host that signalled congestion.
+        retry_after: float, optional
+            Seconds to wait before the next request, from a `Retry-After`
+            header.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(host)
+            if now - self._last_decrease.get(host, -float("inf")) >= self.cooldown:
+                state["limit"] = max(self.min_limit, state["limit"] * self.decrease)
+                self._last_decrease[host] = now
+            if retry_after:
+                state["blocked_until"] = max(
+                    state.get("blocked_until", 0.0), time.time() + retry_after
+                )
+
+    def to_dict(self):
+        """Return learned state of all hosts."""
+        with self._lock:
+            return {host: dict(state) for host, state in sorted(self._hosts.items())}
+
+    def save(self, path=None):
+        """Write learned limits to `path`, by default the path of the controller.
+
+        The file is replaced atomically.
+        """
+        path = self.path if path is None else Path(path)
+        if path is None:
+            raise ValueError("No path to save the rate limits to.")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self.to_dict(), indent=2))
+        os.replace(tmp, path)
+
+
+class HostLimiter:
+    """Asynchronous context manager admitting requests to one host.
+
+    Requests wait while the host is paused by a `Retry-After` header or
+    while the number of requests in flight reaches the limit learned by
+    `controller`.
+    """
+
+    def __init__(self, controller, host):
+        self.controller = controller
+        self.host = host
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        """Wait until a request to the host is allowed."""
+        while True:
+            delay = self.controller.blocked_for(self.host)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            async with self._condition:
+                if self.in_flight < self.controller.limit(self.host):
+                    self.in_flight += 1
+                    return self
+                await self._condition.wait()
+
+    async def __aexit__(self, *exc):
+        """Release the request, waking up waiting ones."""
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
@@ -0,0 +1,255 @@
+"""Registry of supported websites."""
+
+import threading
+from dataclasses import dataclass
+from importlib.metadata import entry_points
+from types import MappingProxyType
+from urllib.parse import urlsplit
+
+ENTRY_POINT_GROUP = "monitorbookprices.sites"
+
+
+class UnsupportedSiteError(ValueError):
+    """Raised for urls of websites that are not supported."""
+
+
+_adapters = {}
+_domains = {}
+_lock = threading.RLock()
+_loaded = False
+_loading = False
+_catalog = None
+
+
+@dataclass(frozen=True)
+class SiteAdapter:
+    """Description of a supported website.
+
+    Parameters
+    ----------
+    name: str
+        Name of the website, used as column name in the books table.
+    domains: tuple of str
+        Domains of the website, e.g. `("adelphi.it",)`. Subdomains (e.g.,
+        `www.adelphi.it`) are matched too.
+    parser: function
+        If `fetch` is `"http"`, function parsing the price from the content
+        of a downloaded page. If `fetch` is `"browser"`, function scraping
+        the price from a url, with a driver leased from the
+        :class:`monitorbookprices.scrape.browser.DriverPool` passed as `pool`
+        keyword argument.
+    fetch: {'http', 'browser'}, default='http'
+        How pages of the website are loaded.
+    use_headers: bool, default=False
+        Whether to send custom headers when downloading pages.
+    links: tuple of str, default=()
+        Links to the home pages of the website.
+    extractor: function, optional
+        Fast alternative to `parser` for `"http"` websites, extracting the
+        price from an lxml tree of the page. See
+        :func:`monitorbookprices.scrape.extract.parse_page`.
+    """
+
+    name: str
+    domains: tuple
+    parser: object
+    fetch: str = "http"
+    use_headers: bool = False
+    links: tuple = ()
+    extractor: object = None
+
+    def __post_init__(self):
+        """Check fields."""
+        if self.fetch not in ("http", "browser"):
+            raise ValueError("`fetch` must be either 'http' or 'browser'.")
+        if isinstance(self.domains, str):
+            raise ValueError("`domains` must be a tuple of strings.")
+
+
+@dataclass(frozen=True, eq=False)
+class SiteCatalog:
+    """Immutable snapshot of the registered websites.
+
+    The catalog is built once, and rebuilt only after a website is
+    registered or unregistered, see :func:`site_catalog`.
+
+    Parameters
+    ----------
+    sites: mapping
+        Name to :class:`SiteAdapter`, in order of registration.
+    domains: mapping
+        Name to domains of each website.
+    hosts: mapping
+        Domain to name of the website.
+    names: tuple of str
+        Names of the websites, in order of registration.
+    links: tuple of str
+        Links to the home pages of the websites.
+    short_links: tuple of str
+        Main domain of each website.
+    """
+
+    sites: MappingProxyType
+    domains: MappingProxyType
+    hosts: MappingProxyType
+    names: tuple
+    links: tuple
+    short_links: tuple
+
+
+def _build_catalog():
+    """Return catalog of the registered websites."""
+    adapters = tuple(_adapters.values())
+    return SiteCatalog(
+        sites=MappingProxyType(dict(_adapters)),
+        domains=MappingProxyType({site.name: site.domains for site in adapters}),
+        hosts=MappingProxyType(dict(_domains)),
+        names=tuple(site.name for site in adapters),
+        links=tuple(link for site in adapters for link in site.links),
+        short_links=tuple(site.domains[0] for site in adapters),
+    )
+
+
+def site_catalog():
+    """Return the catalog of the registered websites, a :class:`SiteCatalog`.
+
+    The same catalog is returned until a website is registered or
+    unregistered.
+    """
+    global _catalog
+    catalog = _catalog
+    if catalog is None:
+        _ensure_loaded()
+        with _lock:
+            if _catalog is None:
+                _catalog = _build_catalog()
+            catalog = _catalog
+    return catalog
+
+
+def register_site(adapter, replace=False):
+    """Register `adapter`, a :class:`SiteAdapter`.
+
+    If `replace`, websites with the same name or sharing a domain with
+    `adapter` are unregistered first.
+
+    Raises
+    ------
+    ValueError
+        If a website with the same name or domain is already registered and
+        `replace` is `False`.
+    """
+    domains = [domain.lower() for domain in adapter.domains]
+    _ensure_loaded()
+    with _lock:
+        owners = {_domains[domain] for domain in domains if domain in _domains}
+        if adapter.name in _adapters:
+            owners.add(adapter.name)
+        if owners and not replace:
+            raise ValueError(f"Website {adapter.name} already registered.")
+        for owner in owners:
+            for domain in _adapters[owner].domains:
+                _domains.pop(domain.lower(), None)
+            if owner != adapter.name:
+                del _adapters[owner]
+        # a replaced website keeps its position
+        _adapters[adapter.name] = adapter
+        for domain in domains:
+            _domains[domain] = adapter.name
+        _invalidate_catalog()
+
+
+def unregister_site(name):
+    """Unregister the website called `name`."""
+    _ensure_loaded()
+    with _lock:
+        adapter = _adapters.pop(name, None)
+        if adapter is None:
+            raise ValueError(f"Website {name} not supported.")
+        for domain in adapter.domains:
+            _domains.pop(domain.lower(), None)
+        _invalidate_catalog()
+
+
+def _invalidate_catalog():
+    """Drop the catalog, so that it is rebuilt on next access."""
+    global _catalog
+    _catalog = None
+
+
+def load_entry_points():
+    """Register the adapters advertised by installed packages.
+
+    Packages register websites through the `monitorbookprices.sites` entry
+    point group. Each entry point must refer to a :class:`SiteAdapter` or to
+    a list of them.
+    """
+    try:
+        eps = entry_points(group=ENTRY_POINT_GROUP)
+    except TypeError:  # Python < 3.10
+        eps = entry_points().get(ENTRY_POINT_GROUP, [])
+    for ep in eps:
+        adapters = ep.load()
+        if isinstance(adapters, SiteAdapter):
+            adapters = [adapters]
+        for adapter in adapters:
+            register_site(adapter, replace=True)
+
+
+def _ensure_loaded():
+    """Register built-in and third-party adapters, once.
+
+    Built-in adapters come first, so that the order of the supported
+    websites does not depend on installed packages.
+    """
+    global _loaded, _loading
+    if _loaded:
+        return
+    with _lock:
+        if _loaded or _loading:
+            return
+        _loading = True
+        try:
+            from monitorbookprices.scrape.sites import builtin_sites
+
+            for adapter in builtin_sites():
+                register_site(adapter)
+            load_entry_points()
+        finally:
+            _loading = False
+        _loaded = True
+
+
+def registered_sites():
+    """Return registered adapters, in order of registration."""
+    return list(site_catalog().sites.values())
+
+
+def get_site(name):
+    """Return the adapter of the website called `name`."""
+    try:
+        return site_catalog().sites[name]
+    except KeyError:
+        raise ValueError(f"Website {name} not supported.") from None
+
+
+def site_for_url(url):
+    """Return the adapter scraping `url`.
+
+    The adapter is looked up by the hostname of `url` and, failing that, by
+    its parent domains (e.g., `books.mondadoristore.it`, then
+    `mondadoristore.it`).
+
+    Raises
+    ------
+    UnsupportedSiteError
+        If no registered website matches `url`.
+    """
+    catalog = site_catalog()
+    host = urlsplit(url).hostname or ""
+    while host:
+        name = catalog.hosts.get(host)
+        if name is not None:
+            return catalog.sites[name]
+        _, _, host = host.partition(".")
+    raise UnsupportedSiteError("Website not supported.")
@@ -0,0 +1,148 @@
+"""Schedule scrapes by how often prices change."""
+
+from datetime import datetime
+
+import polars as pl
+
+from monitorbookprices.book.general import expand_prices
+from monitorbookprices.scrape.general import prepare_scrape
+
+
+def revisit_intervals(
+    prices_df, books_df=None, min_days=1, max_days=30, max_backoff=5, lazy=False
+):
+    """Return how often each book should be scraped on each site.
+
+    The interval starts from the mean number of days between two price
+    changes of the book on the site, over its whole price history. It is
+    then:
+
+    - shortened, down to half, when the last price is close to the
+      `min_price` of the book rather than to its `full_price`, since a
+      change there would be a new low;
+    - doubled for each of the last scrapes that found no price, up to
+      `max_backoff` times, since unavailable books rarely come back soon;
+    - clipped between `min_days` and `max_days`.
+
+    Parameters
+    ----------
+    prices_df: :class:`polars.DataFrame` or :class:`polars.LazyFrame`
+        Price history, in the default or compact schema.
+    books_df: :class:`polars.DataFrame` or :class:`polars.LazyFrame`, optional
+        Books, with the columns `isbn`, `min_price` and `full_price`. If not
+        given, intervals do not depend on the distance from these prices.
+    min_days: float, default=1
+        Minimum interval, in days.
+    max_days: float, default=30
+        Maximum interval, in days.
+    max_backoff: int, default=5
+        Maximum number of doublings of the interval of unavailable books.
+    lazy: bool, default=False
+        Whether to return a :class:`polars.LazyFrame`.
+
+    Returns
+    -------
+    :class:`polars.DataFrame`
+        For each book and site in `prices_df`: `last_date`, day of the last
+        scrape, `last_price`, last price found, `changes`, number of price
+        changes, `unavailable`, number of the last scrapes that found no
+        price, and `interval`, days between two scrapes.
+    """
+    prices = (
+        expand_prices(prices_df.lazy())
+        .with_columns(pl.col("date").cast(pl.Date))
+        .sort("isbn", "site", "date")
+    )
+    price = pl.col("price")
+    out = prices.group_by("isbn", "site").agg(
+        first_date=pl.col("date").first(),
+        last_date=pl.col("date").last(),
+        last_price=price.drop_nulls().last(),
+        changes=(price.drop_nulls().diff() != 0).sum(),
+        unavailable=(price.reverse().is_not_null().cum_sum() == 0).sum(),
+    )
+    days = (pl.col("last_date") - pl.col("first_date")).dt.total_days() + 1
+    interval = days / (pl.col("changes") + 1)
+    if books_df is not None:
+        out = out.join(
+            books_df.lazy().select("isbn", "min_price", "full_price"),
+            on="isbn",
+            how="left",
+        )
+        position = (
+            (pl.col("last_price") - pl.col("min_price"))
+            / (pl.col("full_price") - pl.col("min_price"))
+        ).fill_nan(None)
+        interval = interval * (0.5 + 0.5 * position.clip(0, 1).fill_null(1))
+    interval = interval * 2 ** pl.col("unavailable").clip(upper_bound=max_backoff)
+    out = out.with_columns(interval=interval.clip(min_days, max_days)).select(
+        "isbn", "site", "last_date", "last_price", "changes", "unavailable", "interval"
+    )
+    return out if lazy else out.collect()
+
+
+def plan_scrape(
+    books_df,
+    prices_df,
+    budget=None,
+    date=None,
+    min_days=1,
+    max_days=30,
+):
+    """Plan which links of `books_df` to scrape on `date`.
+
+    A link is due when the days since its last scrape reach its interval
+    from :func:`revisit_intervals`. Due links are ranked by the ratio of
+    these two numbers, links never scraped first, and at most `budget` of
+    them are kept.
+
+    Parameters
+    ----------
+    books_df: :class:`polars.DataFrame`
+        Books to scrape.
+    prices_df: :class:`polars.DataFrame` or :class:`polars.LazyFrame`
+        Price history, in the default or compact schema.
+    budget: int, optional
+        Maximum number of links to scrape. Defaults to all due links.
+    date: :class:`datetime.date`, optional
+        Day of the scrape. Defaults to today.
+    min_days: float, default=1
+        Minimum interval between two scrapes of a link, in days.
+    max_days: float, default=30
+        Maximum interval between two scrapes of a link, in days.
+
+    Returns
+    -------
+    :class:`polars.DataFrame`
+        Links to scrape, with columns `isbn`, `site`, `url`, `last_date`,
+        `interval` and `overdue`, the days since the last scrape divided by
+        the interval, in decreasing order of `overdue`. Can be passed as
+        `plan` to :func:`monitorbookprices.scrape.jobs.run_scrape_job`.
+    """
+    if date is None:
+        date = datetime.today().date()
+    elif isinstance(date, datetime):
+        date = date.date()
+    intervals = revisit_intervals(
+        prices_df, books_df, min_days=min_days, max_days=max_days, lazy=True
+    )
+    out = (
+        prepare_scrape(books_df)
+        .lazy()
+        .join(
+            intervals.select("isbn", "site", "last_date", "interval"),
+            on=["isbn", "site"],
+            how="left",
+        )
+        .with_columns(
+            overdue=(
+                (pl.lit(date) - pl.col("last_date")).dt.total_days()
+                / pl.col("interval")
+            ).fill_null(float("inf"))
+        )
+        .filter(pl.col("overdue") >= 1)
+        .sort("overdue", descending=True, maintain_order=True)
+    )
+    if budget is not None:
+        out = out.head(budget)
+    return out.collect()
@@ -1,111 +1,214 @@
 """Extract prices."""
 
-from shutil import which
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
 
 import requests
 from bs4 import BeautifulSoup
-from selenium import webdriver
 
-# from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.firefox.service import Service
-
-firefox_options = Options()
-firefox_options.add_argument("--headless")  # Run in headless mode
-firefox_service = Service(which("geckodriver"))
+from monitorbookprices.scrape.browser import default_driver_pool
+from monitorbookprices.scrape.extract import (
+    clean_up_price,
+    extract_adelphi,
+    extract_buecher,
+    extract_feltrinelli_and_ibs,
+    extract_hoepli,
+    extract_hugendubel,
+    extract_libcoop,
+    extract_libraccio,
+    extract_libuni,
+    extract_mondadori,
+    extract_rizzoli,
+    parse_page,
+)
+from monitorbookprices.scrape.registry import (
+    SiteAdapter,
+    site_catalog,
+    site_for_url,
+)
+from monitorbookprices.scrape.telemetry import default_telemetry
+
+logger = logging.getLogger(__name__)
 
 headers = {"User-Agent": "Dottor Professor Truffatore Imbroglione"}
 
+_local = threading.local()
 
-def list_sites():
-    """Return names of supported websites."""
+
+def builtin_sites():
+    """Return adapters of the built-in supported websites."""
     return [
-        "adelphi",
-        "buecher",
-        "feltrinelli",
-        "hoepli",
-        "hugendubel",
-        "ibs",
-        "libcoop",
-        "libraccio",
-        "libuni",
-        "mondadori",
-        "osiander",
-        "rizzoli",
+        SiteAdapter(
+            "adelphi",
+            ("adelphi.it",),
+            parse_adelphi,
+            extractor=extract_adelphi,
+            links=("https://www.adelphi.it/",),
+        ),
+        SiteAdapter(
+            "buecher",
+            ("buecher.de",),
+            parse_buecher,
+            extractor=extract_buecher,
+            links=("https://www.buecher.de/",),
+        ),
+        SiteAdapter(
+            "feltrinelli",
+            ("lafeltrinelli.it",),
+            parse_feltrinelli_and_ibs,
+            extractor=extract_feltrinelli_and_ibs,
+            links=("https://www.lafeltrinelli.it/",),
+        ),
+        SiteAdapter(
+            "hoepli",
+            ("hoepli.it",),
+            parse_hoepli,
+            use_headers=True,
+            extractor=extract_hoepli,
+            links=("https://www.hoepli.it/",),
+        ),
+        SiteAdapter(
+            "hugendubel",
+            ("hugendubel.de",),
+            parse_hugendubel,
+            extractor=extract_hugendubel,
+            links=("https://www.hugendubel.de/",),
+        ),
+        SiteAdapter(
+            "ibs",
+            ("ibs.it",),
+            parse_feltrinelli_and_ibs,
+            extractor=extract_feltrinelli_and_ibs,
+            links=("https://www.ibs.it/",),
+        ),
+        SiteAdapter(
+            "libcoop",
+            ("librerie.coop",),
+            parse_libcoop,
+            use_headers=True,
+            extractor=extract_libcoop,
+            links=("https://www.librerie.coop/",),
+        ),
+        SiteAdapter(
+            "libraccio",
+            ("libraccio.it",),
+            parse_libraccio,
+            extractor=extract_libraccio,
+            links=("https://www.libraccio.it/",),
+        ),
+        SiteAdapter(
+            "libuni",
+            ("libreriauniversitaria.it",),
+            parse_libuni,
+            extractor=extract_libuni,
+            links=("https://www.libreriauniversitaria.it/",),
+        ),
+        SiteAdapter(
+            "mondadori",
+            ("mondadoristore.it",),
+            parse_mondadori,
+            use_headers=True,
+            extractor=extract_mondadori,
+            links=(
+                "https://www.mondadoristore.it/",
+                "https://books.mondadoristore.it/",
+            ),
+        ),
+        SiteAdapter(
+            "osiander",
+            ("osiander.de",),
+            scrape_osiander,
+            fetch="browser",
+            links=("https://www.osiander.de/",),
+        ),
+        SiteAdapter(
+            "rizzoli",
+            ("libreriarizzoli.it",),
+            parse_rizzoli,
+            use_headers=True,
+            extractor=extract_rizzoli,
+            links=("https://www.libreriarizzoli.it/",),
+        ),
     ]
 
 
+def list_sites():
+    """Return names of supported websites."""
+    return list(site_catalog().names)
+
+
 def list_sites_links_short():
     """Return list of supported webiste, short version."""
-    return [
-        "adelphi.it",
-        "buecher.de",
-        "lafeltrinelli.it",
-        "hoepli.it",
-        "hugendubel.de",
-        "ibs.it",
-        "librerie.coop",
-        "libraccio.it",
-        "libreriauniversitaria.it",
-        "mondadoristore.it",
-        "osiander.de",
-        "libreriarizzoli.it",
-    ]
+    return list(site_catalog().short_links)
 
 
 def list_sites_links():
     """Return links to supported websites."""
-    return [
-        "https://www.adelphi.it/",
-        "https://www.buecher.de/",
-        "https://www.lafeltrinelli.it/",
-        "https://www.hoepli.it/",
-        "https://www.hugendubel.de/",
-        "https://www.ibs.it/",
-        "https://www.librerie.coop/",
-        "https://www.libraccio.it/",
-        "https://www.libreriauniversitaria.it/",
-        "https://www.mondadoristore.it/",
-        "https://books.mondadoristore.it/",
-        "https://www.osiander.de/",
-        "https://www.libreriarizzoli.it/",
-    ]
+    return list(site_catalog().links)
 
 
 def scrape_url(url):
-    """Read url and redirect to specialized scraping function."""
-    if not any([website in url for website in list_sites_links()]):
-        raise ValueError("Website not supported.")
-
-    if "adelphi.it" in url:
-        return scrape_adelphi(url)
-    if "buecher" in url:
-        return scrape_buecher(url)
-    if "feltrinelli" in url or "ibs" in url:
-        return scrape_feltrinelli_and_ibs(url)
-    if "hoepli" in url:
-        return scrape_hoepli(url)
-    if "hugendubel" in url:
-        return scrape_hugendubel(url)
-    if "librerie.coop" in url:
-        return scrape_libcoop(url)
-    if "libraccio" in url:
-        return scrape_libraccio(url)
-    if "libreriauniversitaria" in url:
-        return scrape_libuni(url)
-    if "mondadori" in url:
-        return scrape_mondadori(url)
-    if "osiander" in url:
-        return scrape_osiander(url)
-    if "rizzoli" in url:
-        return scrape_rizzoli(url)
-
-
-def scrape_adelphi(url):
-    """Scrape price from adelphi.it."""
-    with requests.get(url, timeout=30) as res:
-        soup = BeautifulSoup(res.content, "lxml")
+    """Read url and redirect to specialized scraping function.
+
+    The website is found with a single lookup of the hostname of `url` in
+    the registry of supported websites.
+    The scrape is recorded in
+    :func:`monitorbookprices.scrape.telemetry.default_telemetry`.
+    """
+    telemetry = default_telemetry()
+    event = {"site": None, "url": url}
+    try:
+        site = site_for_url(url)
+        event["site"] = site.name
+        start = time.perf_counter()
+        if site.fetch == "browser":
+            price = site.parser(url)
+            event["fetch_seconds"] = time.perf_counter() - start
+        else:
+            status, content = fetch_response(url, use_headers=site.use_headers)
+            event["fetch_seconds"] = time.perf_counter() - start
+            event["status"] = status
+            event["response_bytes"] = len(content)
+            start = time.perf_counter()
+            price = parse_page(site, content)
+            event["parse_seconds"] = time.perf_counter() - start
+    except Exception as exc:
+        telemetry.record(**event, error=exc)
+        raise
+    telemetry.record(**event, price=price)
+    return price
+
+
+def get_session(url):
+    """Return the keep-alive session for the host of `url`.
+
+    Sessions are kept per thread, so that connections are reused across
+    calls without sharing a `requests.Session` between threads.
+    """
+    sessions = getattr(_local, "sessions", None)
+    if sessions is None:
+        sessions = _local.sessions = {}
+    host = urlsplit(url).netloc
+    if host not in sessions:
+        sessions[host] = requests.Session()
+    return sessions[host]
+
+
+def fetch_response(url, use_headers=False):
+    """Download `url` and return `(status, content)` of the response."""
+    with get_session(url).get(
+        url,
+        headers=headers if use_headers else None,
+        timeout=30,
+    ) as res:
+        return res.status_code, res.content
+
+
+def parse_adelphi(content):
+    """Parse price from an adelphi.it page."""
+    soup = BeautifulSoup(content, "lxml")
     try:
         price = soup.find("div", {"class", "book-impressum-price"}).find(
             "span", {"class", "sale"}
@@ -116,19 +219,17 @@ def scrape_adelphi(url):
         return clean_up_price(price.text.strip())
 
 
-def scrape_buecher(url):
-    """Scrape price from buecher.de."""
-    with requests.get(url, timeout=30) as res:
-        soup = BeautifulSoup(res.content, "lxml")
+def parse_buecher(content):
+    """Parse price from a buecher.de page."""
+    soup = BeautifulSoup(content, "lxml")
     price = soup.find("div", {"class", "clearfix price-shipping-free"})
     if price is not None:
         return clean_up_price(price.text.strip())
 
 
-def scrape_feltrinelli_and_ibs(url):
-    """Scrape price from lafeltrinelli.it and ibs.it."""
-    with requests.get(url, timeout=30) as res:
-        soup = BeautifulSoup(res.content, "lxml")
+def parse_feltrinelli_and_ibs(content):
+    """Parse price from a lafeltrinelli.it or ibs.it page."""
+    soup = BeautifulSoup(content, "lxml")
     title_label = soup.find("span", {"cc-top-title-label"})
     if title_label is None or title_label.text == "LIBRO USATO":
         return
@@ -144,10 +245,9 @@ def scrape_feltrinelli_and_ibs(url):
         return clean_up_price(price.text.strip())
 
 
-def scrape_hoepli(url):
-    """Scrape price from hoepli.it."""
-    with requests.get(url, headers=headers, timeout=30) as res:
-        soup = BeautifulSoup(res.content, "lxml")
+def parse_hoepli(content):
+    """Parse price from a hoepli.it page."""
+    soup = BeautifulSoup(content, "lxml")
     non_disponibile = soup.find("span", {"class", "disponibilita_Z"})
     if non_disponibile is not None and "Non disponibile" in non_disponibile.text:
         return
@@ -157,20 +257,18 @@ def scrape_hoepli(url):
         return clean_up_price(price.text)
 
 
-def scrape_hugendubel(url):
-    """Scrape price from hugendubel.de."""
-    with requests.get(url, timeout=30) as res:
-        soup = BeautifulSoup(res.content, "lxml")
+def parse_hugendubel(content):
+    """Parse price from a hugendubel.de page."""
+    soup = BeautifulSoup(content, "lxml")
     price = soup.find("div", {"class", "current-price"})
     price = price.find("span", {"class", "price"})
     if price is not None:
         return clean_up_price(price.text)
 
 
-def scrape_libcoop(url):
-    """Scrape price from librerie.coop."""
-    with requests.get(url, headers=headers, timeout=30) as res:
-        soup = BeautifulSoup(res.content, "lxml")
+def parse_libcoop(content):
+    """Parse price from a librerie.coop page."""
+    soup = BeautifulSoup(content, "lxml")
     btn_disabled = soup.find("button", {"class", "btn btn-disabled"})
     btn_disabled_2 = soup.find("button", {"class", "btn btn-disabled mt-2"})
     if btn_disabled or btn_disabled_2:
@@ -182,10 +280,9 @@ def scrape_libcoop(url):
         return clean_up_price(price.text)
 
 
-def scrape_libraccio(url):
-    """Scrape price from libraccio.it."""
-    with requests.get(url, timeout=30) as res:
-        soup = BeautifulSoup(res.content, "lxml")
+def parse_libraccio(content):
+    """Parse price from a libraccio.it page."""
+    soup = BeautifulSoup(content, "lxml")
     try:
         price = soup.find("div", {"class": "buybox"}).find(
             "span", {"class": "currentprice"}
@@ -196,10 +293,9 @@ def scrape_libraccio(url):
         return clean_up_price(price.text.strip())
 
 
-def scrape_libuni(url):
-    """Scrape price from libreriauniversitaria.it."""
-    with requests.get(url, timeout=30) as res:
-        soup = BeautifulSoup(res.content, "lxml")
+def parse_libuni(content):
+    """Parse price from a libreriauniversitaria.it page."""
+    soup = BeautifulSoup(content, "lxml")
     if "Prodotto momentaneamente non disponibile" in soup.text:
         return
     if "Fuori catalogo" in soup.text:
@@ -209,59 +305,53 @@ def scrape_libuni(url):
         return clean_up_price(price.text.strip())
 
 
-def scrape_mondadori(url):
-    """Scrape price from mondadoristore.it."""
-    with requests.get(url, headers=headers, timeout=30) as res:
-        soup = BeautifulSoup(res.content, "lxml")
+def parse_mondadori(content):
+    """Parse price from a mondadoristore.it page."""
+    soup = BeautifulSoup(content, "lxml")
     price = soup.find("span", {"class", "new-price new-detail-price"})
     if price is not None:
         return clean_up_price(price.text)
 
 
-def scrape_osiander(url):
-    """Scrape price from osiander.de."""
-    with webdriver.Firefox(options=firefox_options) as driver:
+def scrape_osiander(url, pool=None):
+    """Scrape price from osiander.de.
+
+    The page is loaded by a driver leased from `pool`, a
+    :class:`monitorbookprices.scrape.browser.DriverPool`. If `pool` is not
+    given, the process-wide pool is used.
+    """
+    if pool is None:
+        pool = default_driver_pool()
+    with pool.lease() as driver:
         driver.get(url)
-        li = driver.find_elements(By.CLASS_NAME, "streichpreisdarstellung")
-        if len(li) > 0:  # a discount on the book is found
-            price = li[0].text.splitlines()[0]
-            return clean_up_price(price)
-        else:  # book not on discount
-            prices = [
-                ee.text.splitlines()[0]
-                for ee in driver.find_elements(By.CLASS_NAME, "element-headline-medium")
-                if len(ee.text) > 0
-                if "€" in ee.text
-            ]
-            if len(prices) > 0:
-                return clean_up_price(prices[0])
-            else:
-                # TODO: Add log for failed scrape
-                return
-
-
-def scrape_rizzoli(url):
-    """Scrape price from libreriarizzoli.it."""
-    with requests.get(url, headers=headers, timeout=30) as res:
-        soup = BeautifulSoup(res.content, "lxml")
+        return parse_osiander(driver)
+
+
+def parse_osiander(driver):
+    """Parse price from the osiander.de page loaded in `driver`."""
+    from selenium.webdriver.common.by import By
+
+    li = driver.find_elements(By.CLASS_NAME, "streichpreisdarstellung")
+    if len(li) > 0:  # a discount on the book is found
+        price = li[0].text.splitlines()[0]
+        return clean_up_price(price)
+    else:  # book not on discount
+        prices = [
+            ee.text.splitlines()[0]
+            for ee in driver.find_elements(By.CLASS_NAME, "element-headline-medium")
+            if len(ee.text) > 0
+            if "€" in ee.text
+        ]
+        if len(prices) > 0:
+            return clean_up_price(prices[0])
+        else:
+            logger.debug("No price element on %s", driver.current_url)
+            return
+
+
+def parse_rizzoli(content):
+    """Parse price from a libreriarizzoli.it page."""
+    soup = BeautifulSoup(content, "lxml")
     price = soup.find("span", {"class", "price-value"})
     if price is not None:
         return clean_up_price(price.text)
-
-
-def clean_up_price(ss):
-    """Clean up price into float.
-
-    :param ss: price string, containing possibly symbols.
-    :type ss: str
-    :returns: price float
-    :rtype: float
-    """
-    if len(ss) > 0:
-        return float(
-            ss.replace("\n", "")
-            .replace("\xa0", "")
-            .replace("€", "")
-            .replace(",", ".")
-            .strip()
-        )
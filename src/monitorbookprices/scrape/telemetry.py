@@ -0,0 +1,267 @@
+"""Per-site telemetry of scrapes."""
+
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+FETCH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000)
+PARSE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+PROMETHEUS_PREFIX = "monitorbookprices"
+
+
+class Histogram:
+    """Histogram of observed values over fixed bucket bounds.
+
+    Parameters
+    ----------
+    bounds: tuple of float
+        Upper bounds of the buckets, in increasing order. Values above the
+        last bound fall in an overflow bucket.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+
+    def observe(self, value):
+        """Add `value` to the histogram."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Return upper bound of the bucket holding the `q` quantile."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        """Return the histogram as a JSON-serializable dictionary."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+            "buckets": dict(zip([*map(str, self.bounds), "+Inf"], self.counts)),
+        }
+
+
+class SiteMetrics:
+    """Metrics of the scrapes of one website."""
+
+    def __init__(self):
+        self.outcomes = Counter()
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.fetch_seconds = Histogram(FETCH_BUCKETS)
+        self.response_bytes = Histogram(SIZE_BUCKETS)
+        self.parse_seconds = Histogram(PARSE_BUCKETS)
+
+    def to_dict(self):
+        """Return the metrics as a JSON-serializable dictionary."""
+        return {
+            "outcomes": dict(self.outcomes),
+            "statuses": {str(status): n for status, n in self.statuses.items()},
+            "errors": dict(self.errors),
+            "fetch_seconds": self.fetch_seconds.to_dict(),
+            "response_bytes": self.response_bytes.to_dict(),
+            "parse_seconds": self.parse_seconds.to_dict(),
+        }
+
+
+class ScrapeTelemetry:
+    """Collect per-site metrics of scrapes.
+
+    For each website, the telemetry counts the outcome of the scrapes
+    (`ok`, `no_price`, `cached` or `error`), the HTTP statuses and the types
+    of errors, and keeps histograms of fetch latency, response size and
+    parse time. Metrics can be exported as a JSON run report with
+    :meth:`report`, or in the Prometheus text format with
+    :meth:`to_prometheus`.
+
+    Hooks added with :meth:`add_hook` are called with every recorded event,
+    a dictionary with the arguments of :meth:`record` and the `outcome`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sites = defaultdict(SiteMetrics)
+        self._hooks = []
+        self.started_at = time.time()
+
+    def add_hook(self, hook):
+        """Call `hook` with every recorded event."""
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """Stop calling `hook`."""
+        self._hooks.remove(hook)
+
+    def record(
+        self,
+        site,
+        url,
+        price=None,
+        error=None,
+        status=None,
+        fetch_seconds=None,
+        response_bytes=None,
+        parse_seconds=None,
+        cached=False,
+    ):
+        """Record the scrape of `url`.
+
+        Parameters
+        ----------
+        site: str or None
+            Name of the website, `None` if the website is not supported.
+        url: str
+            Scraped url.
+        price: float, optional
+            Scraped price.
+        error: Exception, optional
+            Exception raised by the scrape.
+        status: int, optional
+            HTTP status of the response. Defaults to the `status` attribute
+            of `error`, if any.
+        fetch_seconds: float, optional
+            Time taken to download the page, or to load it in a browser.
+        response_bytes: int, optional
+            Size of the page.
+        parse_seconds: float, optional
+            Time taken to parse the price.
+        cached: bool, default=False
+            Whether the price came from the response cache.
+        """
+        site = "unknown" if site is None else site
+        if status is None:
+            status = getattr(error, "status", None)
+        if error is not None:
+            outcome = "error"
+            logger.warning("Failed scrape of %s: %r", url, error)
+        elif cached:
+            outcome = "cached"
+        elif price is None:
+            outcome = "no_price"
+            logger.info("No price found on %s", url)
+        else:
+            outcome = "ok"
+        with self._lock:
+            metrics = self._sites[site]
+            metrics.outcomes[outcome] += 1
+            if error is not None:
+                metrics.errors[type(error).__name__] += 1
+            if status is not None:
+                metrics.statuses[status] += 1
+            if fetch_seconds is not None:
+                metrics.fetch_seconds.observe(fetch_seconds)
+            if response_bytes is not None:
+                metrics.response_bytes.observe(response_bytes)
+            if parse_seconds is not None:
+                metrics.parse_seconds.observe(parse_seconds)
+        if self._hooks:
+            event = {
+                "site": site,
+                "url": url,
+                "outcome": outcome,
+                "price": price,
+                "error": error,
+                "status": status,
+                "fetch_seconds": fetch_seconds,
+                "response_bytes": response_bytes,
+                "parse_seconds": parse_seconds,
+            }
+            for hook in list(self._hooks):
+                try:
+                    hook(event)
+                except Exception:
+                    logger.exception("Telemetry hook %r failed.", hook)
+
+    def reset(self):
+        """Forget all recorded metrics."""
+        with self._lock:
+            self._sites.clear()
+            self.started_at = time.time()
+
+    def report(self):
+        """Return run report, a JSON-serializable dictionary."""
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "reported_at": time.time(),
+                "sites": {
+                    site: metrics.to_dict()
+                    for site, metrics in sorted(self._sites.items())
+                },
+            }
+
+    def to_json(self, path=None):
+        """Return run report as JSON, and write it to `path` if given."""
+        out = json.dumps(self.report(), indent=2)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(out)
+        return out
+
+    def to_prometheus(self):
+        """Return metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def counter(name, help_text, label, attribute):
+            metric = f"{PROMETHEUS_PREFIX}_{name}_total"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for site, metrics in sorted(self._sites.items()):
+                for value, n in sorted(getattr(metrics, attribute).items()):
+                    lines.append(f'{metric}{{site="{site}",{label}="{value}"}} {n}')
+
+        def histogram(name, help_text, attribute):
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for site, metrics in sorted(self._sites.items()):
+                hist = getattr(metrics, attribute)
+                cumulative = 0
+                for bound, count in zip([*hist.bounds, "+Inf"], hist.counts):
+                    cumulative += count
+                    lines.append(
+                        f'{metric}_bucket{{site="{site}",le="{bound}"}} {cumulative}'
+                    )
+                lines.append(f'{metric}_sum{{site="{site}"}} {hist.sum}')
+                lines.append(f'{metric}_count{{site="{site}"}} {hist.count}')
+
+        with self._lock:
+            counter("scrapes", "Scrapes by outcome.", "outcome", "outcomes")
+            counter("http_responses", "HTTP responses by status.", "status", "statuses")
+            counter("errors", "Failed scrapes by type of error.", "error", "errors")
+            histogram("fetch_seconds", "Time to load a page.", "fetch_seconds")
+            histogram("response_bytes", "Size of the pages.", "response_bytes")
+            histogram("parse_seconds", "Time to parse a price.", "parse_seconds")
+        return "\n".join(lines) + "\n"
+
+
+_default = ScrapeTelemetry()
+
+
+def default_telemetry():
+    """Return the process-wide telemetry, used unless another one is given."""
+    return _default
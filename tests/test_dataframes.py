@@ -1,11 +1,15 @@
 """Test functions related to dataframes, databases, etc."""
 
+from datetime import date, datetime
 from pathlib import Path
 
 import polars as pl
+import pytest
 from polars.testing import assert_frame_equal
+from sqlalchemy import inspect
 
 import monitorbookprices as mbp
+from monitorbookprices.data import database
 
 
 def get_simple_df():
@@ -45,3 +49,251 @@ def test_excel():
     sqlexcel_path = Path(__file__).parent / "data/test_dataframes/database.xlsx"
     df_2 = mbp.read_excel(sqlexcel_path, schema=mbp.schema())
     assert_frame_equal(df_1, df_2)
+
+
+def test_upsert(tmp_path):
+    """Test upsert of prices and books into a managed schema."""
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    mbp.ensure_schema(url=url)
+    prices = pl.DataFrame(
+        {
+            "isbn": ["9783866473256", "9783866473256", "9783866473256"],
+            "price": [7.95, 7.5, 7.0],
+            "site": ["buecher", "osiander", "buecher"],
+            "date": [
+                datetime(2024, 1, 1, 8),
+                datetime(2024, 1, 1),
+                datetime(2024, 1, 2),
+            ],
+        }
+    )
+    assert mbp.upsert_database(prices, "prices", url=url) == 3
+    # same-day rescrape replaces the price
+    rescrape = prices.head(1).with_columns(
+        price=pl.lit(6.5), date=pl.lit(date(2024, 1, 1))
+    )
+    assert mbp.upsert_database(rescrape, "prices", url=url) == 1
+    df = mbp.read_database(table_name="prices", url=url, schema=None).sort(
+        "date", "site"
+    )
+    assert df["price"].to_list() == [6.5, 7.5, 7.0]
+
+    books = get_simple_df()
+    mbp.upsert_database(books, "books", url=url)
+    mbp.upsert_database(books.with_columns(min_price=pl.lit(6.5)), "books", url=url)
+    df = mbp.read_database(table_name="books", url=url, schema=mbp.schema())
+    assert df["min_price"].to_list() == [6.5]
+
+
+def test_upsert_datetimes(tmp_path):
+    """Test upsert of prices into a table written with datetimes."""
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    prices = pl.DataFrame(
+        {
+            "isbn": ["9783866473256"] * 3,
+            "price": [7.95, 7.5, 7.0],
+            "site": ["buecher"] * 3,
+            "date": [
+                datetime(2024, 1, 1, 10),
+                datetime(2024, 1, 1, 12),
+                datetime(2024, 1, 2, 9),
+            ],
+        }
+    )
+    mbp.write_database(prices, "prices", url=url)
+    rescrape = prices.head(1).with_columns(
+        price=pl.lit(6.5), date=pl.lit(date(2024, 1, 1))
+    )
+    assert mbp.upsert_database(rescrape, "prices", url=url) == 1
+    df = mbp.read_database(
+        table_name="prices", url=url, schema={"price": pl.Float64}
+    ).sort("date")
+    assert df["date"].to_list() == ["2024-01-01", "2024-01-02"]
+    assert df["price"].to_list() == [6.5, 7.0]
+
+
+def test_ensure_schema_dedupes(tmp_path):
+    """Test that keys are added to existing tables, removing duplicates."""
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    books = get_simple_df()
+    mbp.write_database(pl.concat([books, books]), "books", url=url)
+    mbp.ensure_schema(url=url)
+    df = mbp.read_database(table_name="books", url=url, schema=mbp.schema())
+    assert df.height == 1
+
+
+def test_wipe_book(tmp_path):
+    """Test wiping books from a database."""
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    books = pl.concat(
+        [
+            get_simple_df().with_columns(isbn=pl.lit(f"978000000000{i}"))
+            for i in range(3)
+        ]
+    )
+    prices = pl.DataFrame(
+        {
+            "isbn": ["9780000000000", "9780000000000", "9780000000001"],
+            "price": [7.95, 7.5, 7.0],
+            "site": ["buecher", "osiander", "buecher"],
+            "date": [date(2024, 1, 1)] * 3,
+        }
+    )
+    mbp.write_database(books, "books", url=url)
+    mbp.write_database(prices, "prices", url=url)
+    assert mbp.wipe_book("9780000000002", url=url) == {"books": 1, "prices": 0}
+    deleted = mbp.wipe_book(books.head(2), url=url)
+    assert deleted == {"books": 2, "prices": 3}
+    df = mbp.read_database(table_name="books", url=url, schema=mbp.schema())
+    assert df.height == 0
+
+
+def test_get_engine(tmp_path):
+    """Test engines are shared by url and configure SQLite."""
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    engine = mbp.get_engine(url, sqlite_pragmas={"journal_mode": "WAL"})
+    assert mbp.get_engine(url) is engine
+    mbp.write_database(get_simple_df(), "books", url=url)
+    with engine.connect() as connection:
+        mode = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+    assert mode == "wal"
+    mbp.dispose_engine(url)
+    # by default, the journal mode of the file is left as it is
+    other = tmp_path / "other.db"
+    mbp.write_database(get_simple_df(), "books", url=f"sqlite:///{other}")
+    with mbp.get_engine(f"sqlite:///{other}").connect() as connection:
+        mode = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+    assert mode == "delete"
+    mbp.dispose_engine(f"sqlite:///{other}")
+    mbp.dispose_engine(url)
+    assert mbp.get_engine(url) is not engine
+    mbp.dispose_engine(url)
+
+
+def test_read_database_pushdown(tmp_path):
+    """Test reading a selection of columns and rows of a table."""
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    prices = pl.DataFrame(
+        {
+            "isbn": ["9780000000000"] * 3 + ["9780000000001"],
+            "price": [7.95, 7.5, 7.0, 9.0],
+            "site": ["buecher", "osiander", "buecher", "buecher"],
+            "date": [
+                datetime(2024, 1, 1),
+                datetime(2024, 1, 2, 12),
+                datetime(2024, 1, 3),
+                datetime(2024, 1, 2),
+            ],
+        }
+    )
+    mbp.write_database(prices, "prices", url=url)
+    df = mbp.read_database(
+        table_name="prices",
+        url=url,
+        schema=None,
+        columns=["date", "price"],
+        isbn="9780000000000",
+        start=date(2024, 1, 2),
+        end=date(2024, 1, 2),
+    )
+    assert df.columns == ["date", "price"]
+    assert df["price"].to_list() == [7.5]
+    lf = mbp.read_database(
+        table_name="prices",
+        url=url,
+        schema=None,
+        isbn=["9780000000000", "9780000000001"],
+        site="buecher",
+        lazy=True,
+    )
+    assert isinstance(lf, pl.LazyFrame)
+    assert lf.collect()["price"].sort().to_list() == [7.0, 7.95, 9.0]
+
+
+def test_find_book(tmp_path):
+    """Test full-text search of books."""
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    books = get_simple_df()
+    mbp.write_database(books, "books", url=url)
+    # without the index, books are filtered and nothing is created
+    assert mbp.find_book("kap marx", url=url)["isbn"].to_list() == ["9783866473256"]
+    assert inspect(mbp.get_engine(url)).get_table_names() == ["books"]
+    read_only = f"sqlite:///file:{tmp_path / 'database.db'}?mode=ro&uri=true"
+    assert mbp.find_book("marx", url=read_only).height == 1
+    mbp.dispose_engine(read_only)
+    mbp.ensure_schema(url=url)
+    assert mbp.find_book("kap marx", url=url)["isbn"].to_list() == ["9783866473256"]
+    assert database.find_book is mbp.find_book
+    assert mbp.find_book("kapital (", url=url).height == 1
+    assert mbp.find_book("buecher", url=url).height == 0
+    other = books.with_columns(
+        isbn=pl.lit("9788807900020"),
+        author=pl.lit("Umberto Eco"),
+        title=pl.lit("Perché le lingue"),
+    )
+    # inserts are indexed by the triggers
+    mbp.write_database(other, "books", url=url)
+    found = mbp.find_book("PERCHE", url=url)
+    assert found["isbn"].to_list() == ["9788807900020"]
+    # replacing the table drops the triggers, the index is not used
+    mbp.write_database(other, "books", url=url, if_table_exists="replace")
+    assert mbp.find_book("marx", url=url).height == 0
+    assert mbp.find_book("eco", url=url).height == 1
+    # and is rebuilt by ensure_schema
+    mbp.ensure_schema(url=url)
+    assert mbp.find_book("marx", url=url).height == 0
+    assert mbp.find_book("eco", url=url).height == 1
+    mbp.dispose_engine(url)
+    assert mbp.find_book("perché", df_db=pl.concat([books, other])).height == 1
+
+
+def test_parquet_store(tmp_path):
+    """Test storing prices in a date-partitioned Parquet store."""
+    url = f"parquet://{tmp_path / 'store'}"
+    prices = pl.DataFrame(
+        {
+            "isbn": ["9780000000000", "9780000000000", "9780000000001"],
+            "price": [7.95, 7.5, 7.0],
+            "site": ["buecher", "osiander", "buecher"],
+            "date": [datetime(2024, 1, 31), datetime(2024, 2, 1), datetime(2024, 2, 1)],
+        }
+    )
+    mbp.write_database(prices, "prices", url=url)
+    mbp.write_database(
+        prices.tail(1).with_columns(price=pl.lit(6.5)), "prices", url=url
+    )
+    partitions = sorted(path.name for path in (tmp_path / "store/prices").iterdir())
+    assert partitions == ["month=2024-01", "month=2024-02"]
+    df = mbp.read_database(
+        table_name="prices",
+        url=url,
+        columns=["isbn", "price"],
+        site="buecher",
+        start=date(2024, 2, 1),
+    )
+    assert df.sort("price")["price"].to_list() == [6.5, 7.0]
+    assert mbp.compact_parquet("prices", url) == 1
+    lf = mbp.read_database(table_name="prices", url=url, lazy=True)
+    assert isinstance(lf, pl.LazyFrame)
+    df = lf.collect().sort("date", "site")
+    assert df["price"].to_list() == [7.95, 6.5, 7.5]
+    assert df["date"].dtype == pl.Date
+    assert mbp.read_database(table_name="missing", url=url).height == 0
+
+    # books stay in the SQL database
+    books_url = f"sqlite:///{tmp_path / 'database.db'}"
+    books = pl.DataFrame(
+        [mbp.new_book({"isbn": isbn}) for isbn in ["9780000000000", "9780000000001"]],
+        schema=mbp.schema(),
+    )
+    mbp.write_database(books, "books", url=books_url)
+    assert mbp.update_min_whole_database(url=books_url, prices_url=url) == 2
+    df = mbp.read_database(table_name="books", url=books_url, schema=mbp.schema())
+    assert df["min_price"].to_list() == [7.5, 6.5]
+    with pytest.raises(ValueError, match="prices_url"):
+        mbp.wipe_book("9780000000000", url=url)
+    wiped = mbp.wipe_book("9780000000000", url=books_url, prices_url=url)
+    assert wiped == {"books": 1, "prices": 2}
+    df = mbp.read_database(table_name="prices", url=url)
+    assert df["isbn"].to_list() == ["9780000000001"]
+    mbp.dispose_engine(books_url)
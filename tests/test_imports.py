@@ -0,0 +1,32 @@
+"""Test the package loads heavy libraries only when needed."""
+
+import subprocess
+import sys
+
+import monitorbookprices as mbp
+
+
+def loaded_modules(statement):
+    """Return heavy modules loaded by `statement` in a fresh interpreter."""
+    out = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys; {statement}; "
+            "print(' '.join(m for m in ('bokeh', 'holoviews', 'selenium.webdriver') "
+            "if m in sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return out.stdout.split()
+
+
+def test_lazy_imports():
+    """Test plotting and browser libraries are loaded lazily."""
+    assert loaded_modules("import monitorbookprices") == []
+    assert loaded_modules("from monitorbookprices import run_scrape_job") == []
+    assert "holoviews" in loaded_modules("from monitorbookprices import plot_history")
+    assert set(dir(mbp)).issuperset(mbp.__all__)
+    assert mbp.read_database is mbp.data.database.read_database
@@ -0,0 +1,48 @@
+"""Test functions related to plots."""
+
+from datetime import date, timedelta
+
+import polars as pl
+
+from monitorbookprices.analysis.plots import downsample, lttb, plot_histories
+
+
+def get_history_df(days=1000):
+    """Create long price history of two books."""
+    prices = [8.0] * days
+    prices[100], prices[500] = 6.0, None
+    return pl.DataFrame(
+        {
+            "isbn": ["9780000000000"] * days + ["9780000000001"] * days,
+            "site": ["ibs"] * 2 * days,
+            "date": [date(2020, 1, 1) + timedelta(days=i) for i in range(days)] * 2,
+            "price": prices + [float(i % 50) for i in range(days)],
+        }
+    )
+
+
+def test_downsample():
+    """Test step deduplication and downsampling of price histories."""
+    df = get_history_df()
+    steps = downsample(df).filter(pl.col("isbn") == "9780000000000")
+    assert steps["price"].to_list() == [8.0, 6.0, 8.0, None, 8.0, 8.0]
+    small = downsample(df, max_points=20)
+    assert small.group_by("isbn").len().sort("isbn")["len"].to_list() == [6, 20]
+    line = lttb(df.filter(pl.col("isbn") == "9780000000001"), 20)
+    assert line.height == 20
+    assert line["date"].is_sorted()
+    assert line["price"].max() == 49.0
+    assert line["date"][[0, -1]].to_list() == [date(2020, 1, 1), date(2022, 9, 26)]
+
+
+def test_plot_histories():
+    """Test plotting a grid of price histories."""
+    books = pl.DataFrame(
+        {
+            "isbn": ["9780000000000", "9780000000001"],
+            "author": ["A", "B"],
+            "title": ["X", "Y"],
+        }
+    )
+    plot = plot_histories(get_history_df(), books_df=books, cols=1)
+    assert len(plot) == 2
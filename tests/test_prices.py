@@ -0,0 +1,137 @@
+"""Test functions related to prices."""
+
+from datetime import date
+
+import polars as pl
+from polars.testing import assert_frame_equal
+from sqlalchemy import inspect
+
+import monitorbookprices as mbp
+
+
+def get_books_df():
+    """Create books dataframe."""
+    books = [
+        mbp.new_book({"isbn": "9783866473256", "min_price": 7.95}),
+        mbp.new_book({"isbn": "9788845925238", "min_price": None}),
+        mbp.new_book({"isbn": "9788807900099", "min_price": 5.0}),
+    ]
+    return pl.DataFrame(books, schema=mbp.schema())
+
+
+def get_prices_df():
+    """Create prices dataframe."""
+    return pl.DataFrame(
+        {
+            "isbn": ["9783866473256", "9783866473256", "9788845925238"],
+            "price": [7.5, 8.0, 12.0],
+            "site": ["buecher", "osiander", "ibs"],
+            "date": [date(2024, 1, 1)] * 3,
+        }
+    )
+
+
+def test_update_min():
+    """Test update of minimum prices."""
+    books = mbp.update_min(get_books_df(), get_prices_df())
+    assert books["min_price"].to_list() == [7.5, 12.0, 5.0]
+    compact = mbp.compact_prices(get_prices_df())
+    assert_frame_equal(mbp.update_min(get_books_df(), compact), books)
+
+
+def test_update_min_incremental(tmp_path):
+    """Test incremental update of minimum prices in database."""
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    mbp.write_database(get_books_df(), "books", url=url)
+    prices = get_prices_df().vstack(
+        pl.DataFrame(
+            {
+                "isbn": ["9788807900099"],
+                "price": [6.0],
+                "site": ["ibs"],
+                "date": [date(2024, 1, 1)],
+            }
+        )
+    )
+    assert mbp.update_min_incremental(prices, url=url) == 2
+    books = mbp.read_database(table_name="books", url=url, schema=mbp.schema())
+    assert_frame_equal(books, mbp.update_min(get_books_df(), prices))
+
+
+def test_compact_prices(tmp_path):
+    """Test conversion of prices to and from the compact schema."""
+    prices = get_prices_df().with_columns(price=pl.Series([7.95, 8.0, 12.0]))
+    compact = mbp.compact_prices(prices)
+    assert compact.schema == pl.Schema(mbp.schema_prices(compact=True))
+    assert_frame_equal(mbp.expand_prices(compact), prices)
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    mbp.write_database(compact, "prices", url=url)
+    df = mbp.read_database(table_name="prices", url=url, schema=None, compact=True)
+    assert_frame_equal(df, compact)
+
+
+def test_discounts():
+    """Test discounts of the whole catalog."""
+    prices = pl.DataFrame(
+        {
+            "isbn": ["9783866473256"] * 4 + ["9788845925238"] * 2,
+            "price": [9.0, 8.0, 7.0, None, 15.0, 16.0],
+            "site": ["buecher"] * 3 + ["osiander"] + ["ibs"] * 2,
+            "date": [
+                date(2024, 1, 1),
+                date(2024, 3, 1),
+                date(2024, 5, 1),
+                date(2024, 5, 1),
+                date(2024, 1, 1),
+                date(2024, 5, 1),
+            ],
+        }
+    )
+    books = get_books_df().with_columns(full_price=pl.Series([10.0, 20.0, 5.0]))
+    df = mbp.discounts(books, mbp.compact_prices(prices))
+    assert df.select("isbn", "site").rows() == [
+        ("9783866473256", "buecher"),
+        ("9788845925238", "ibs"),
+        ("9783866473256", "osiander"),
+    ]
+    assert df["discount_pct"].to_list() == [30.0, 20.0, None]
+    assert df["min_date"].to_list() == [date(2024, 5, 1), date(2024, 1, 1), None]
+    assert df["min_90d"].to_list() == [7.0, 16.0, None]
+    assert df["new_low"].to_list() == [True, False, False]
+    df = mbp.discounts(books, prices, date=date(2024, 3, 1))
+    assert df["price"].to_list() == [15.0, 8.0]
+    assert df["min_30d"].to_list() == [None, 8.0]
+    assert mbp.cheapest(mbp.discounts(books, prices))["site"].to_list() == [
+        "buecher",
+        "ibs",
+    ]
+
+
+def test_update_min_whole_database(tmp_path):
+    """Test update of minimum prices from the whole prices table."""
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    books = get_books_df().vstack(
+        pl.DataFrame([mbp.new_book({"isbn": "88-07-90009-X"})], schema=mbp.schema())
+    )
+    prices = get_prices_df().vstack(
+        pl.DataFrame(
+            {
+                "isbn": ["88-07-90009-X"],
+                "price": [4.0],
+                "site": ["ibs"],
+                "date": [date(2024, 1, 1)],
+            }
+        )
+    )
+    mbp.write_database(books, "books", url=url)
+    mbp.write_database(prices, "prices", url=url)
+    mbp.ensure_schema(url=url)
+    indexes = inspect(mbp.get_engine(url)).get_indexes("books")
+    assert [index["name"] for index in indexes] == ["books_key"]
+    assert mbp.update_min_whole_database(url=url) == 3
+    df = mbp.read_database(table_name="books", url=url, schema=mbp.schema())
+    assert df["min_price"].to_list() == [7.5, 12.0, 5.0, 4.0]
+    # books are updated in place, keeping the key and the search index
+    assert inspect(mbp.get_engine(url)).get_indexes("books") == indexes
+    assert mbp.find_book("88-07", url=url)["isbn"].to_list() == ["88-07-90009-X"]
+    mbp.dispose_engine(url)
@@ -0,0 +1,716 @@
+"""Test functions related to scraping."""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import polars as pl
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+import monitorbookprices as mbp
+from monitorbookprices.scrape.browser import DriverPool
+from monitorbookprices.scrape.cache import ResponseCache
+from monitorbookprices.scrape.engine import iter_scrape_links, scrape_links
+from monitorbookprices.scrape.extract import html_tree, parse_page
+from monitorbookprices.scrape.jobqueue import JobQueue
+from monitorbookprices.scrape.jobs import run_scrape_job
+from monitorbookprices.scrape.ratelimit import RateController, parse_retry_after
+from monitorbookprices.scrape.registry import (
+    SiteAdapter,
+    get_site,
+    register_site,
+    site_catalog,
+    site_for_url,
+    unregister_site,
+)
+
+PAGES = {
+    "/buecher": b'<html><body><div class="clearfix price-shipping-free">'
+    b"12,50 \xe2\x82\xac</div></body></html>",
+    "/rizzoli": b'<html><body><span class="price-value">9,90</span></body></html>',
+    "/empty": b"<html><body></body></html>",
+    "/slow_broken": b'<html><body><span class="price-value">n/a</span></body></html>',
+}
+
+
+@contextmanager
+def local_shop(pages=PAGES, etag=False):
+    """Serve `pages` from a local keep-alive HTTP server.
+
+    If `etag`, responses carry an `ETag` header and conditional requests are
+    answered with `304 Not Modified`. Yields the server, which records the
+    peer and the status of every request in `server.peers` and
+    `server.statuses`. Paths in the dictionary `server.failures` are
+    answered with `503 Service Unavailable` as many times as their value.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):  # noqa: N802
+            self.server.peers.append(self.client_address)
+            if "slow" in self.path:
+                time.sleep(0.5)
+            path = urlsplit(self.path).path
+            if self.server.failures.get(path, 0) > 0:
+                self.server.failures[path] -= 1
+                self.server.statuses.append(503)
+                self.send_error(503)
+                return
+            body = pages.get(path)
+            if body is None:
+                self.server.statuses.append(404)
+                self.send_error(404)
+                return
+            tag = f'"{hash(body)}"'
+            if etag and self.headers.get("If-None-Match") == tag:
+                self.server.statuses.append(304)
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.server.statuses.append(200)
+            self.send_response(200)
+            if etag:
+                self.send_header("ETag", tag)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.peers = []
+    server.statuses = []
+    server.failures = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def to_local(server):
+    """Return a `url_map` redirecting shop urls to `server`."""
+    host, port = server.server_address[:2]
+
+    def url_map(url):
+        site = "buecher" if "buecher" in url else "rizzoli"
+        if "missing" in url:
+            site = "empty"
+        return f"http://{host}:{port}/{site}"
+
+    return url_map
+
+
+def test_engine():
+    """Test asynchronous engine against a local server."""
+    links = [
+        "https://www.buecher.de/artikel/buch/das-kapital/25646129/",
+        "https://www.libreriarizzoli.it/libro/9788807900000",
+        "https://www.buecher.de/artikel/buch/missing/1/",
+    ] * 20
+    with local_shop() as server:
+        prices = scrape_links(
+            links,
+            progress=False,
+            max_per_host=2,
+            url_map=to_local(server),
+        )
+        assert prices == [12.5, 9.9, None] * 20
+        # all requests go to the same local host: at most `max_per_host`
+        # keep-alive connections are opened
+        assert len(server.peers) == len(links)
+        assert len(set(server.peers)) <= 2
+
+
+def test_scrape_database():
+    """Test scraping a books dataframe."""
+    books = mbp.new_book(
+        {
+            "isbn": "9783866473256",
+            "buecher": "https://www.buecher.de/artikel/buch/das-kapital/25646129/",
+            "rizzoli": "https://www.libreriarizzoli.it/libro/9783866473256",
+        }
+    )
+    books_df = pl.DataFrame(books, schema_overrides=mbp.schema())
+    with local_shop() as server:
+        df = mbp.scrape_database(books_df, url_map=to_local(server))
+    assert df["site"].to_list() == ["buecher", "rizzoli"]
+    assert df["price"].to_list() == [12.5, 9.9]
+    with pytest.raises(TypeError, match="retries"):
+        mbp.scrape_database(books_df, parallel=False, retries=0)
+
+
+class FakeDriver:
+    """Stand-in for a Selenium driver."""
+
+    def __init__(self):
+        self.quit_called = False
+
+    def quit(self):
+        """Quit the driver."""
+        self.quit_called = True
+
+
+def test_driver_pool():
+    """Test leasing, recycling and closing of browser drivers."""
+    drivers = []
+
+    def factory():
+        drivers.append(FakeDriver())
+        return drivers[-1]
+
+    with DriverPool(size=2, max_pages=3, factory=factory) as pool:
+        for _ in range(3):
+            with pool.lease() as driver:
+                assert driver is drivers[0]
+        # recycled after `max_pages` pages
+        assert drivers[0].quit_called
+        with pool.lease() as driver:
+            assert driver is drivers[1]
+        # recycled after a crash
+        with pytest.raises(WebDriverException):
+            with pool.lease() as driver:
+                raise WebDriverException("crash")
+        assert drivers[1].quit_called
+        with pool.lease() as driver_1, pool.lease() as driver_2:
+            assert driver_1 is not driver_2
+        assert len(drivers) == 4
+    assert all(driver.quit_called for driver in drivers)
+    with pytest.raises(RuntimeError):
+        with pool.lease():
+            pass
+
+
+def test_prepare_scrape():
+    """Test planning of the links to scrape."""
+    books_df = pl.DataFrame(
+        [
+            mbp.new_book({"isbn": "9780000000001", "osiander": "o1", "buecher": "b1"}),
+            mbp.new_book({"isbn": "9780000000002"}),
+            mbp.new_book({"isbn": "9780000000003", "ibs": "i3"}),
+        ],
+        schema=mbp.schema(),
+    )
+    jobs = mbp.prepare_scrape(books_df)
+    assert jobs.columns == ["isbn", "site", "url"]
+    assert jobs.rows() == [
+        ("9780000000001", "buecher", "b1"),
+        ("9780000000001", "osiander", "o1"),
+        ("9780000000003", "ibs", "i3"),
+    ]
+
+
+def test_site_for_url():
+    """Test dispatch of urls to websites."""
+    assert site_for_url("https://www.ibs.it/libro/9788845925238").name == "ibs"
+    assert site_for_url("https://books.mondadoristore.it/x").name == "mondadori"
+    # used to be sent to the feltrinelli scraper because it contains "ibs"
+    libraccio_url = "https://www.libraccio.it/libro/9788807900099/ibsen.html"
+    assert site_for_url(libraccio_url).name == "libraccio"
+    with pytest.raises(ValueError):
+        site_for_url("https://www.ibs.it.example.com/libro")
+    with pytest.raises(ValueError):
+        mbp.scrape_url("https://www.example.com/ibs.it/")
+
+
+def test_register_site():
+    """Test registration of a third-party website."""
+    adapter = SiteAdapter("example", ("example.com",), parser=len)
+    catalog = site_catalog()
+    assert site_catalog() is catalog
+    register_site(adapter)
+    try:
+        assert site_catalog() is not catalog
+        assert site_catalog().domains["example"] == ("example.com",)
+        assert mbp.list_sites()[-1] == "example"
+        assert "example" in mbp.schema()
+        assert site_for_url("https://shop.example.com/book") is adapter
+        with pytest.raises(ValueError):
+            register_site(SiteAdapter("other", ("example.com",), parser=len))
+    finally:
+        unregister_site("example")
+    assert "example" not in mbp.list_sites()
+    assert "example" not in mbp.schema()
+
+
+FIXTURES = {
+    "adelphi": 19.0,
+    "buecher": 7.95,
+    "feltrinelli": 16.15,
+    "feltrinelli_used": None,
+    "hoepli": 13.3,
+    "hoepli_unavailable": None,
+    "hugendubel": 11.0,
+    "ibs": 12.35,
+    "libcoop": 18.05,
+    "libcoop_unavailable": None,
+    "libraccio": 14.25,
+    "libuni": 22.8,
+    "libuni_unavailable": None,
+    "mondadori": 10.45,
+    "rizzoli": 9.9,
+}
+
+
+@pytest.mark.parametrize("fixture", FIXTURES)
+def test_parse_page(fixture):
+    """Test fast and BeautifulSoup extraction on saved pages."""
+    site = get_site(fixture.split("_")[0])
+    content = (Path(__file__).parent / f"data/test_scrape/{fixture}.html").read_bytes()
+    assert parse_page(site, content, fast=True) == FIXTURES[fixture]
+    assert parse_page(site, content, fast=False) == FIXTURES[fixture]
+    assert site.extractor(html_tree(content)) == FIXTURES[fixture]
+
+
+def test_parse_page_fallback():
+    """Test fallback to BeautifulSoup when the fast extractor fails."""
+
+    def broken(tree):
+        raise ValueError("broken")
+
+    site = SiteAdapter("broken", ("broken.com",), parser=len, extractor=broken)
+    assert parse_page(site, b"<html></html>") == len(b"<html></html>")
+
+
+@pytest.mark.parametrize("etag", [True, False])
+def test_engine_cache(tmp_path, etag):
+    """Test conditional requests and reuse of cached prices."""
+    links = [
+        "https://www.buecher.de/artikel/buch/das-kapital/25646129/",
+        "https://www.libreriarizzoli.it/libro/9788807900000",
+    ]
+    cache_path = tmp_path / "cache.db"
+    with local_shop(etag=etag) as server:
+        kwargs = {"progress": False, "url_map": to_local(server), "cache": cache_path}
+        assert scrape_links(links, **kwargs) == [12.5, 9.9]
+        with ResponseCache(cache_path) as cache:
+            assert len(cache) == 2
+            entry = cache.get(links[0])
+            cache.put(links[0], entry["content_hash"], 1.0, etag=entry["etag"])
+            cache.put(links[1], "changed", 2.0)
+        # unchanged pages reuse the cached price, changed ones are parsed
+        assert scrape_links(links, **kwargs) == [1.0, 9.9]
+        assert sorted(server.statuses[2:]) == [200, 304 if etag else 200]
+        if etag:
+            # unchanged page with stale validators: the new ones are stored
+            with ResponseCache(cache_path) as cache:
+                entry = cache.get(links[0])
+                cache.put(links[0], entry["content_hash"], 1.0, etag='"stale"')
+            assert scrape_links(links[:1], **kwargs) == [1.0]
+            assert scrape_links(links[:1], **kwargs) == [1.0]
+            assert server.statuses[4:] == [200, 304]
+
+
+def test_cache_eviction(tmp_path):
+    """Test age- and size-based eviction of the response cache."""
+    with ResponseCache(tmp_path / "cache.db", max_entries=2) as cache:
+        for i in range(3):
+            cache.put(f"https://www.ibs.it/{i}", str(i), float(i))
+        cache.evict()
+        assert len(cache) == 2
+        assert cache.get("https://www.ibs.it/0") is None
+        cache.max_age = -1
+        cache.evict()
+        assert len(cache) == 0
+
+
+def test_iter_scrape_links_early_stop():
+    """Test that stopping the iteration early cancels pending scrapes."""
+    links = [f"https://www.libreriarizzoli.it/{i}" for i in range(8)]
+    with local_shop() as server:
+        host, port = server.server_address[:2]
+        results = iter_scrape_links(
+            links,
+            progress=False,
+            max_per_host=1,
+            url_map=lambda url: (
+                f"http://{host}:{port}/"
+                + ("rizzoli" if url == links[0] else "slow_broken")
+            ),
+        )
+        start = time.monotonic()
+        next(results)
+        results.close()
+        # the scrape is cancelled, not left running until its next result
+        assert time.monotonic() - start < 1
+        threads = [thread.name for thread in threading.enumerate()]
+        assert "iter_scrape_links" not in threads
+        peers = len(server.peers)
+        time.sleep(1)
+        assert len(server.peers) <= peers + 1
+
+
+def test_cache_commits(tmp_path):
+    """Test that cache writes are committed while the cache is open."""
+    path = tmp_path / "cache.db"
+
+    def committed():
+        with sqlite3.connect(path) as connection:
+            return connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    cache = ResponseCache(path, commit_writes=2)
+    cache.put("https://www.ibs.it/0", "0", 0.0)
+    cache.touch("https://www.ibs.it/0")
+    cache.put("https://www.ibs.it/1", "1", 1.0)
+    # a crash now would lose only the last write
+    assert committed() == 1
+    cache.close()
+    assert committed() == 2
+
+
+def test_scrape_to_database(tmp_path):
+    """Test streaming of scraped prices into a database, and resume."""
+    books_df = pl.DataFrame(
+        [
+            mbp.new_book(
+                {
+                    "isbn": f"978000000000{i}",
+                    "buecher": f"https://www.buecher.de/artikel/buch/{i}/",
+                    "rizzoli": f"https://www.libreriarizzoli.it/libro/{i}",
+                }
+            )
+            for i in range(5)
+        ],
+        schema=mbp.schema(),
+    )
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    day = date(2024, 1, 1)
+    with local_shop() as server:
+        local = to_local(server)
+
+        def crash_on_rizzoli(link):
+            if "rizzoli" in link and link.endswith("/4"):
+                host, port = server.server_address[:2]
+                return f"http://{host}:{port}/slow_broken"
+            return local(link)
+
+        with pytest.raises(ValueError):
+            mbp.scrape_to_database(
+                books_df,
+                url=url,
+                date=day,
+                batch_rows=2,
+                url_map=crash_on_rizzoli,
+            )
+        written = mbp.read_database(table_name="prices", url=url, schema=None)
+        assert written.height == 9
+        # resume only scrapes what is missing
+        n = mbp.scrape_to_database(books_df, url=url, date=day, url_map=local)
+        assert n == 1
+    prices = mbp.read_database(table_name="prices", url=url, schema=None)
+    assert prices.height == 10
+    assert prices.unique(["isbn", "site"]).height == 10
+    assert sorted(prices["price"].unique().to_list()) == [9.9, 12.5]
+
+
+def test_run_scrape_job(tmp_path):
+    """Test retries, failure classification and resume of scrape jobs."""
+    books_df = pl.DataFrame(
+        [
+            mbp.new_book(
+                {
+                    "isbn": "9780000000000",
+                    "buecher": "https://www.buecher.de/0",
+                    "rizzoli": "https://www.libreriarizzoli.it/flaky",
+                }
+            ),
+            mbp.new_book(
+                {
+                    "isbn": "9780000000001",
+                    "buecher": "https://www.buecher.de/empty",
+                    "rizzoli": "https://www.libreriarizzoli.it/slow_broken",
+                }
+            ),
+            mbp.new_book(
+                {"isbn": "9780000000002", "ibs": "https://www.example.com/ibs"}
+            ),
+            mbp.new_book(
+                {
+                    "isbn": "9780000000003",
+                    "rizzoli": "https://www.libreriarizzoli.it/down",
+                }
+            ),
+        ],
+        schema=mbp.schema(),
+    )
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    pages = {**PAGES, "/flaky": PAGES["/rizzoli"], "/down": PAGES["/rizzoli"]}
+    with local_shop(pages=pages) as server:
+        host, port = server.server_address[:2]
+
+        def url_map(link):
+            path = urlsplit(link).path
+            if path == "/0":
+                path = "/buecher"
+            return f"http://{host}:{port}{path}"
+
+        kwargs = {"url": url, "date": date(2024, 1, 1), "url_map": url_map}
+        kwargs.update(progress=False, retries=2, backoff=0.01)
+        server.failures.update({"/flaky": 2, "/down": 100})
+        summary = run_scrape_job(books_df, **kwargs)
+        assert summary == {
+            "written": 3,
+            "network": 1,
+            "parse": 1,
+            "out_of_stock": 1,
+            "unsupported": 1,
+        }
+        # only network failures are retried
+        summary = run_scrape_job(books_df, **kwargs)
+        assert summary["written"] == 0
+        assert summary["network"] == 1
+        assert sum(summary.values()) == 1
+        server.failures.clear()
+        summary = run_scrape_job(books_df, **kwargs)
+        assert summary["written"] == 1
+        assert sum(summary.values()) == 1
+    prices = mbp.read_database(table_name="prices", url=url, schema=None)
+    assert sorted(prices["price"].drop_nulls().to_list()) == [9.9, 9.9, 12.5]
+
+
+def test_telemetry():
+    """Test per-site telemetry of the engine, reports and hooks."""
+    telemetry = mbp.ScrapeTelemetry()
+    events = []
+    telemetry.add_hook(events.append)
+    links = [
+        "https://www.buecher.de/artikel/buch/das-kapital/25646129/",
+        "https://www.libreriarizzoli.it/libro/9788807900000",
+        "https://www.buecher.de/artikel/buch/missing/1/",
+        "https://www.libreriarizzoli.it/libro/9788807900001",
+    ]
+    with local_shop() as server:
+        server.failures["/rizzoli"] = 1
+        results = dict(
+            iter_scrape_links(
+                links,
+                progress=False,
+                return_exceptions=True,
+                max_per_host=1,
+                retries=0,
+                url_map=to_local(server),
+                telemetry=telemetry,
+            )
+        )
+    assert sum(isinstance(result, Exception) for result in results.values()) == 1
+    assert len(events) == len(links)
+    report = json.loads(telemetry.to_json())["sites"]
+    assert report["buecher"]["outcomes"] == {"ok": 1, "no_price": 1}
+    assert report["buecher"]["fetch_seconds"]["count"] == 2
+    assert report["buecher"]["parse_seconds"]["count"] == 2
+    assert report["rizzoli"]["outcomes"] == {"ok": 1, "error": 1}
+    assert report["rizzoli"]["statuses"] == {"200": 1, "503": 1}
+    assert report["rizzoli"]["errors"] == {"HTTPStatusError": 1}
+    prometheus = telemetry.to_prometheus()
+    assert (
+        'monitorbookprices_scrapes_total{site="buecher",outcome="no_price"} 1'
+        in prometheus
+    )
+    assert 'monitorbookprices_fetch_seconds_count{site="rizzoli"} 1' in prometheus
+    assert (
+        'monitorbookprices_response_bytes_bucket{site="buecher",le="+Inf"} 2'
+        in prometheus
+    )
+    telemetry.reset()
+    assert telemetry.report()["sites"] == {}
+
+
+def test_rate_limits(tmp_path):
+    """Test adaptive per-host limits and their persistence."""
+    controller = RateController(initial_limit=2, max_limit=4, cooldown=0)
+    for _ in range(20):
+        controller.on_success("shop", 0.1)
+    assert controller.limit("shop") == 4
+    controller.on_congestion("shop")
+    assert controller.limit("shop") == 2
+    # no increase while the latency is much higher than usual
+    for _ in range(5):
+        controller.on_success("shop", 1.0)
+    assert controller.limit("shop") == 2
+    controller.on_congestion("shop", retry_after=parse_retry_after("30"))
+    assert controller.limit("shop") == 1
+    assert 29 < controller.blocked_for("shop") <= 30
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("soon") is None
+
+    links = [
+        "https://www.buecher.de/artikel/buch/das-kapital/25646129/",
+        "https://www.libreriarizzoli.it/libro/9788807900000",
+    ] * 2
+    path = tmp_path / "limits.json"
+    with local_shop() as server:
+        server.failures["/rizzoli"] = 1
+        prices = scrape_links(
+            links,
+            progress=False,
+            backoff=0,
+            url_map=to_local(server),
+            rate_limits=path,
+        )
+        host = "{}:{}".format(*server.server_address[:2])
+    assert prices == [12.5, 9.9] * 2
+    # the 503 halved the initial limit of `max_per_host`
+    learned = json.loads(path.read_text())
+    assert 1 < learned[host]["limit"] < 4
+    assert RateController(path).limit(host) == int(learned[host]["limit"])
+
+
+def test_plan_scrape(tmp_path):
+    """Test revisit intervals and planning of scrapes under a budget."""
+    books_df = pl.DataFrame(
+        [
+            mbp.new_book(
+                {
+                    "isbn": f"978000000000{i}",
+                    "full_price": 20.0,
+                    "min_price": 10.0,
+                    "buecher": "https://www.buecher.de/0",
+                    "rizzoli": "https://www.libreriarizzoli.it/libro/0",
+                }
+            )
+            for i in range(2)
+        ],
+        schema=mbp.schema(),
+    )
+    days = pl.date_range(date(2024, 1, 1), date(2024, 2, 29), eager=True)
+    volatile = [10.0 + i % 2 for i in range(len(days))]
+    history = {
+        # price changes every day
+        ("9780000000000", "buecher"): volatile,
+        # price never changes
+        ("9780000000000", "rizzoli"): [15.0] * len(days),
+        # price changes every day, then the book is not available
+        ("9780000000001", "buecher"): volatile[:-3] + [None] * 3,
+    }
+    prices_df = pl.concat(
+        pl.DataFrame(
+            {"isbn": isbn, "site": site, "price": prices, "date": days},
+            schema={
+                "isbn": pl.String,
+                "site": pl.String,
+                "price": pl.Float64,
+                "date": pl.Date,
+            },
+        )
+        for (isbn, site), prices in history.items()
+    )
+    intervals = mbp.revisit_intervals(prices_df, books_df).sort("isbn", "site")
+    assert intervals["changes"].to_list() == [59, 0, 56]
+    assert intervals["unavailable"].to_list() == [0, 0, 3]
+    assert intervals["interval"].to_list()[:2] == [1, 30]
+    assert 1 < intervals["interval"][2] < 30
+
+    plan = mbp.plan_scrape(books_df, prices_df, date=date(2024, 3, 1))
+    # never scraped first, then due links; stable and unavailable ones wait
+    assert plan.select("isbn", "site").rows() == [
+        ("9780000000001", "rizzoli"),
+        ("9780000000000", "buecher"),
+    ]
+    plan = mbp.plan_scrape(books_df, prices_df, budget=1, date=date(2024, 3, 1))
+    assert plan.select("isbn", "site").rows() == [("9780000000001", "rizzoli")]
+
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    with local_shop() as server:
+        summary = run_scrape_job(
+            books_df,
+            url=url,
+            date=date(2024, 3, 1),
+            plan=plan,
+            progress=False,
+            url_map=to_local(server),
+        )
+    assert summary["written"] == 1
+    assert len(server.statuses) == 1
+
+
+def test_job_queue(tmp_path):
+    """Test leases, expiry, retries and completion of queued jobs."""
+    jobs = pl.DataFrame(
+        {
+            "isbn": ["9780000000000", "9780000000001", "9780000000002"],
+            "site": ["buecher", "rizzoli", "rizzoli"],
+            "url": ["u0", "u1", "u2"],
+        }
+    )
+    day = date(2024, 1, 1)
+    with JobQueue(tmp_path / "queue.db", lease_seconds=0.2, max_attempts=2) as queue:
+        assert queue.enqueue(jobs, date=day) == 3
+        assert queue.enqueue(jobs, date=day) == 0
+        first = queue.lease("a", n=2)
+        assert [job["url"] for job in first] == ["u0", "u1"]
+        assert first[0]["date"] == day
+        assert [job["url"] for job in queue.lease("b", n=2)] == ["u2"]
+        assert queue.lease("b") == []
+        assert queue.complete(first[0]["id"], 12.5, "a")
+        assert queue.fail(first[1]["id"], "timeout", "a")
+        assert not queue.complete(first[1]["id"], 1.0, "a")
+        # the job of the crashed worker "b" is leased again after expiry
+        time.sleep(0.3)
+        again = queue.lease("c", n=5)
+        assert sorted(job["url"] for job in again) == ["u1", "u2"]
+        assert all(job["attempts"] == 2 for job in again)
+        assert queue.fail(again[0]["id"], "timeout", "c")
+        time.sleep(0.3)
+        # jobs out of attempts are failed
+        assert queue.lease("d") == []
+        assert queue.counts() == {"pending": 0, "leased": 0, "done": 1, "failed": 2}
+        assert queue.results(day).rows() == [("9780000000000", "buecher", 12.5, day)]
+
+
+def test_run_workers(tmp_path):
+    """Test worker processes scraping queued jobs into the database."""
+    books_df = pl.DataFrame(
+        [
+            mbp.new_book(
+                {
+                    "isbn": f"978000000000{i}",
+                    "buecher": f"https://www.buecher.de/{i}",
+                    "rizzoli": f"https://www.libreriarizzoli.it/libro/{i}",
+                }
+            )
+            for i in range(5)
+        ],
+        schema=mbp.schema(),
+    )
+    path = tmp_path / "queue.db"
+    url = f"sqlite:///{tmp_path / 'database.db'}"
+    day = date(2024, 1, 1)
+    with JobQueue(path) as queue:
+        assert queue.enqueue(mbp.prepare_scrape(books_df), date=day) == 10
+    pages = {
+        **{f"/{i}": PAGES["/buecher"] for i in range(5)},
+        **{f"/libro/{i}": PAGES["/rizzoli"] for i in range(5)},
+    }
+    with local_shop(pages=pages) as server:
+        host, port = server.server_address[:2]
+        # picklable, for the worker processes
+        url_map = partial(re.sub, r"^https://www\.\w+\.\w+/", f"http://{host}:{port}/")
+        server.failures["/libro/0"] = 1
+        summary = mbp.run_workers(
+            path,
+            processes=2,
+            url=url,
+            batch_size=2,
+            poll_seconds=0.1,
+            retries=0,
+            url_map=url_map,
+        )
+    assert summary == {"done": 10, "failed": 1}
+    prices = mbp.read_database(table_name="prices", url=url, schema=None)
+    assert len(prices) == 10
+    assert sorted(prices["price"].to_list()) == [9.9] * 5 + [12.5] * 5